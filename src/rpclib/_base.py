@@ -31,10 +31,23 @@ class MethodContext(object):
 
         self.udc = None # the user defined context. use it to your liking.
 
+        # the protocols of the request and of the response. the server may
+        # pick other ones than those of the application, per request.
+        self.in_protocol = app.in_protocol
+        self.out_protocol = app.out_protocol
+
         self.method_name = None
         # these are set based on the value of the method_name.
         self.service_class = None # the class the method belongs to
         self.descriptor = None    # its descriptor
+        self.function = None      # the callable the descriptor points to
+        self.cache_key = None     # the key of the response in the response
+                                  #     cache of the method, if it has one.
+        self.flight = None        # set when identical requests wait for this
+                                  #     one to finish. see util.coalesce
+        self.blocking = True      # False when the request is processed in a
+                                  #     thread that must not wait for other
+                                  #     ones, e.g. the twisted reactor thread.
 
         self.in_string = None     # incoming bytestream (can be any kind of
                                   #     iterable that contains strings)
@@ -44,6 +57,12 @@ class MethodContext(object):
         self.in_header_doc = None # incoming header document of the request.
         self.in_body_doc = None   # incoming body document of the request.
         self.in_header = None     # native incoming header
+        self.in_stream = None     # (element, element iterator) pair set
+                                  #     when the children of an array element
+                                  #     in in_document are to be parsed and
+                                  #     deserialized lazily.
+        self.in_attachments = None # the non-root parts of a multipart request
+                                  #     as files, by content id.
 
         # in the request (i.e. server) case, this contains the function
         # arguments for the function in the service definition class.
@@ -65,8 +84,25 @@ class MethodContext(object):
         self.out_header_doc = None # serialized header object
         self.out_document = None   # body and header wrapped in the outgoing
                                    # envelope
+        self.out_stream = None     # (element, array class, iterable) triplet
+                                   # set when the contents of an array element
+                                   # in out_document are to be serialized
+                                   # lazily while creating out_string.
+        self.out_attachments = None # (content id, Attachment) pairs that are
+                                   # sent as separate mime parts of an mtom
+                                   # response.
+        self.out_streamed_attachments = None # the streamed Attachment
+                                   # instances in the response, by id. see
+                                   # rpclib.model.binary.ATTACHMENT_PI_TARGET
         self.out_string = None     # outgoing bytestream (can be any kind of
                                    # iterable that contains strings)
+        self.out_content_type = None # the content type of out_string, when
+                                   # it's not the mime type of the protocol.
+
+        self.timings = {}          # phase name -> duration in seconds, set by
+                                   # the server. see rpclib.util.stats.PHASES
+        self.in_bytes = None       # length of in_string, when it's known
+        self.out_bytes = None      # length of out_string, when it's known
 
         self.frozen = True # when this is set, no new attribute can be added to
                            # the class instance.
@@ -105,7 +141,8 @@ class MethodDescriptor(object):
     def __init__(self, name, public_name, in_message, out_message, doc,
                  is_callback=False, is_async=False, mtom=False, in_header=None,
                  out_header=None, faults=(),
-                 port_type=None, no_ctx=False,
+                 port_type=None, no_ctx=False, cache=None, executor=None,
+                 coalesce=None,
                 ):
 
         self.name = name
@@ -121,6 +158,32 @@ class MethodDescriptor(object):
         self.faults = faults
         self.port_type = port_type
         self.no_ctx = no_ctx
+        self.cache = cache # a ResponseCache instance, or None.
+        self.executor = executor # an rpclib.util.executor instance, or None.
+        self.coalesce = coalesce # a RequestCoalescer instance, or None.
+
+class MethodRoute(object):
+    '''This class holds the precomputed dispatch information for a public
+    method. Instances are built once by the interface, and are not meant to be
+    modified afterwards. The id is a small integer that identifies the method
+    in the interface, e.g. in MessagePack messages.
+    '''
+
+    __slots__ = ('service_class', 'descriptor', 'function', 'id')
+
+    def __init__(self, service_class, descriptor, function, id=None):
+        object.__setattr__(self, 'service_class', service_class)
+        object.__setattr__(self, 'descriptor', descriptor)
+        object.__setattr__(self, 'function', function)
+        object.__setattr__(self, 'id', id)
+
+    def __setattr__(self, k, v):
+        raise AttributeError("%s instances are immutable" %
+                                                        self.__class__.__name__)
+
+    def __repr__(self):
+        return "%s(%s.%s)" % (self.__class__.__name__,
+                                 self.service_class.__name__, self.descriptor.name)
 
 class EventManager(object):
     def __init__(self, parent, handlers={}):
@@ -24,6 +24,7 @@ import traceback
 
 from rpclib.model.exception import Fault
 from rpclib._base import EventManager
+from rpclib.util.stats import PipelineStats
 
 class Application(object):
     transport = None
@@ -53,22 +54,58 @@ class Application(object):
 
         self.event_manager = EventManager(self)
 
+        # per-method latency and payload size histograms. set this to None to
+        # disable their collection.
+        self.stats = PipelineStats()
+
     def process_request(self, ctx, req_obj):
         """Takes a MethodContext instance and the native request object.
         Returns the response to the request as a native python object.
 
+        When the method has a response cache and the request is found in it,
+        or when the method coalesces requests and an identical request is
+        being processed, the method is not called, and both ctx.out_object and
+        ctx.out_string are set from the cache or the identical request.
+
         Not meant to be overridden.
         """
 
+        # serve the response from the cache of the method, if possible.
+        cache = ctx.descriptor.cache
+        if not (cache is None):
+            key = cache.get_key(ctx)
+            if not (key is None):
+                hit = cache.get(key)
+                if not (hit is None):
+                    ctx.out_object, ctx.out_string = hit
+                    return
+
+                ctx.cache_key = key
+
+        # wait for an identical request that's in flight, if there's one.
+        coalesce = ctx.descriptor.coalesce
+        if not (coalesce is None) and ctx.blocking and not coalesce.join(ctx):
+            return
+
         try:
             # implementation hook
             ctx.service_class.event_manager.fire_event('method_call',ctx)
 
             # retrieve the method
-            func = getattr(ctx.service_class, ctx.descriptor.name)
+            func = ctx.function
+            if func is None:
+                func = getattr(ctx.service_class, ctx.descriptor.name)
+
+            # call the method, in the thread pool that's assigned to it, if any
+            executor = ctx.descriptor.executor
+            if executor is None:
+                executor = ctx.service_class.__executor__
 
-            # call the method
-            ctx.out_object = ctx.service_class.call_wrapper(ctx, func, req_obj)
+            if executor is None:
+                ctx.out_object = ctx.service_class.call_wrapper(ctx, func,
+                                                                        req_obj)
+            else:
+                ctx.out_object = executor.run_method(ctx, func, req_obj)
 
             # fire events
             self.event_manager.fire_event('method_return_object', ctx)
@@ -108,5 +145,28 @@ class Application(object):
 
         return self.interface.call_routes[method_name]
 
+    def get_route(self, method_name):
+        """Returns the precomputed MethodRoute instance that holds the service
+        class, the method descriptor and the callable for the given qualified
+        or bare method name or SOAPAction. Raises KeyError when no such method
+        exists.
+
+        Override this function to alter the method mappings.
+        """
+
+        return self.interface.get_route(method_name)
+
+    def get_stats(self, method_name=None):
+        """Returns the per-method timings of the request pipeline phases
+        (parse, decompose, deserialize, call, serialize and tostring) and the
+        sizes of the requests and responses, as a dict of method names to
+        histogram summaries. See rpclib.util.stats.PipelineStats.summary.
+        """
+
+        if self.stats is None:
+            return {}
+
+        return self.stats.summary(method_name)
+
     def _has_callbacks(self):
         return self.interface._has_callbacks()
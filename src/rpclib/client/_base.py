@@ -17,8 +17,11 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
+from lxml import etree
+
 from rpclib._base import MethodContext
 from rpclib.model.primitive import string_encoding
+from rpclib.protocol.soap import Soap11
 
 class Factory(object):
     def __init__(self, app):
@@ -28,14 +31,33 @@ class Factory(object):
         return self.__app.interface.get_class_instance(object_name)
 
 class Service(object):
+    """Creates the callables of the remote methods when they're first accessed,
+    and returns the same ones afterwards."""
+
     def __init__(self, rpc_class, url, app):
         self.__app = app
         self.__url = url
-        self.out_header = None
+        self.__out_header = None
+        self.__stubs = {}
         self.rpc_class = rpc_class
 
+    def __get_out_header(self):
+        return self.__out_header
+
+    def __set_out_header(self, out_header):
+        self.__out_header = out_header
+        for stub in self.__stubs.values():
+            stub.out_header = out_header
+
+    out_header = property(__get_out_header, __set_out_header)
+
     def __getattr__(self, key):
-        return self.rpc_class(self.__url, self.__app, key, self.out_header)
+        stub = self.__stubs.get(key)
+        if stub is None:
+            stub = self.__stubs.setdefault(key, self.rpc_class(self.__url,
+                                              self.__app, key, self.out_header))
+
+        return stub
 
 class RemoteProcedureBase(object):
     """Abstract base class for the callable that gets the request from the
@@ -48,70 +70,121 @@ class RemoteProcedureBase(object):
 
     where the args and kwargs are serialized using the protocol and sent to the
     remote side using the transport the child implements.
+
+    Instances are reused for every call to their method, possibly from many
+    threads at the same time, so the state of a call is kept in the
+    MethodContext instance returned by get_context, which should be passed to
+    release_context when the call is done. Released contexts are reused by the
+    following calls, along with the envelopes they've serialized.
     """
 
-    def __init__(self, url, app, name, out_header):
+    def __init__(self, url, app, name, out_header=None):
         self.url = url
         self.app = app
+        self.out_header = out_header
+
+        ctx = MethodContext(app)
+        route = self.app.get_route(name)
+
+        ctx.method_name = name
+        ctx.service_class = route.service_class
+        ctx.descriptor = route.descriptor
+        ctx.function = route.function
+
+        # fresh contexts are created by copying this.
+        self.__ctx_dict = dict(ctx.__dict__)
+        self.__contexts = []
 
-        self.ctx = MethodContext(app)
-        self.ctx.method_name = name
-        self.ctx.service_class = self.app.get_service_class(name)
-        self.ctx.out_header = out_header
-        self.ctx.descriptor = self.ctx.service_class.get_method(self.ctx.method_name)
+    def get_context(self):
+        """Returns a fresh MethodContext instance for a call."""
 
-    def get_out_object(self, args, kwargs):
-        assert self.ctx.out_object is None
+        try:
+            ctx = self.__contexts.pop()
 
-        request_raw_class = self.ctx.descriptor.in_message
+        except IndexError:
+            ctx = MethodContext.__new__(MethodContext)
+            ctx.__dict__.update(self.__ctx_dict)
+
+        ctx.timings = {}
+        ctx.out_header = self.out_header
+
+        return ctx
+
+    def release_context(self, ctx):
+        """Makes the given context available to the following calls."""
+
+        out_document = ctx.out_document
+        ctx.__dict__.update(self.__ctx_dict)
+
+        # the serialized envelope is kept without its contents, so that it
+        # doesn't have to be built again.
+        if etree.iselement(out_document):
+            out_document.clear()
+            ctx.out_document = out_document
+
+        self.__contexts.append(ctx)
+
+    def get_out_object(self, ctx, args, kwargs):
+        assert ctx.out_object is None
+
+        request_raw_class = ctx.descriptor.in_message
         request_type_info = request_raw_class._type_info
-        self.ctx.out_object = request_raw = request_raw_class()
+        ctx.out_object = request_raw = request_raw_class()
 
-        for i in range(len(request_type_info)):
+        keys = request_type_info.keys()
+        for i in range(len(keys)):
             if i < len(args):
-                setattr(request_raw, request_type_info.keys()[i], args[i])
+                setattr(request_raw, keys[i], args[i])
             else:
-                setattr(request_raw, request_type_info.keys()[i], None)
+                setattr(request_raw, keys[i], None)
 
         for k in request_type_info:
             if k in kwargs:
                 setattr(request_raw, k, kwargs[k])
 
-    def get_out_string(self):
-        assert self.ctx.out_document is None
-        assert self.ctx.out_string is None
+    def get_out_string(self, ctx):
+        assert ctx.out_string is None
 
-        self.app.out_protocol.serialize(self.ctx)
-        self.app.out_protocol.create_out_string(self.ctx, string_encoding)
+        self.app.out_protocol.serialize(ctx)
+        self.app.out_protocol.create_out_string(ctx, string_encoding)
 
-    def get_in_object(self, is_error=False):
-        assert self.ctx.in_string is not None
-        assert self.ctx.in_document is None
+    def get_in_object(self, ctx, is_error=False):
+        assert ctx.in_string is not None
+        assert ctx.in_document is None
 
-        self.app.in_protocol.create_in_document(self.ctx)
+        self.app.in_protocol.create_in_document(ctx)
 
         # sets the ctx.in_body_doc and ctx.in_header_doc properties
-        self.app.in_protocol.decompose_incoming_envelope(self.ctx)
+        self.app.in_protocol.decompose_incoming_envelope(ctx)
 
         # this sets ctx.in_object
-        self.app.in_protocol.deserialize(self.ctx)
+        self.app.in_protocol.deserialize(ctx)
 
-        if not (self.ctx.in_error is None) or is_error:
-            raise self.ctx.in_error
+        if not (ctx.in_error is None) or is_error:
+            raise ctx.in_error
 
         else:
-            type_info = self.ctx.descriptor.out_message._type_info
+            out_message = ctx.descriptor.out_message
+            type_info = out_message._type_info
 
-            if (self.app.in_protocol.in_wrapper != self.app.in_protocol.NO_WRAPPER
-                      and len(self.ctx.descriptor.out_message._type_info) == 1):
+            if len(type_info) == 1 and isinstance(ctx.in_object, out_message):
                 wrapper_attribute = type_info.keys()[0]
-                self.ctx.in_object = getattr(self.ctx.in_object,
-                                                        wrapper_attribute, None)
+                ctx.in_object = getattr(ctx.in_object, wrapper_attribute, None)
 
 class ClientBase(object):
     def __init__(self, url, app):
         """Must be overridden to initialize the service properly"""
         self.factory = Factory(app)
 
+        # the soap protocols of the application are set up for the server
+        # side, which parses requests and serializes responses. a client does
+        # the opposite: it parses the responses, which are wrapped in the
+        # out_message of the method, and serializes the requests without a
+        # wrapper, as get_out_object already builds the in_message instance.
+        if isinstance(app.in_protocol, Soap11):
+            app.in_protocol.in_wrapper = Soap11.OUT_WRAPPER
+        if isinstance(app.out_protocol, Soap11):
+            app.out_protocol.out_wrapper = Soap11.NO_WRAPPER
+
     def set_options(self, **kwargs):
         self.service.out_header = kwargs.get('soapheaders', None)
@@ -17,46 +17,227 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
-"""A soap client that uses http (urllib2) as transport"""
+"""A soap client that uses http (httplib) as transport.
 
-import urllib2
+The connections to the server are kept open between the calls and reused, as
+long as the server allows it. They're kept in a ConnectionPool instance, which
+can be shared by the clients of many services:
+
+    pool = ConnectionPool(max_size=8, idle_timeout=30)
+    client = Client('http://localhost:7789/', app, pool=pool)
+"""
+
+import errno
+import socket
+import httplib
+import threading
+import urlparse
+
+from time import time
+from functools import partial
 
 from rpclib.client import Service
 from rpclib.client import ClientBase
 from rpclib.client import RemoteProcedureBase
 
-import rpclib.protocol.soap
+from rpclib.model.primitive import string_encoding
+
+_default_ports = {
+    'http': httplib.HTTP_PORT,
+    'https': httplib.HTTPS_PORT,
+}
+
+_connection_classes = {
+    'http': httplib.HTTPConnection,
+    'https': httplib.HTTPSConnection,
+}
+
+# the errors of sending to a connection that the server has already closed.
+_stale_errnos = (errno.ECONNRESET, errno.EPIPE)
+
+class ConnectionPool(object):
+    '''Keeps persistent httplib connections, per (scheme, host, port).
+
+    :param max_size: The maximum number of connections that are open to the
+        same host at the same time. Callers wait for a connection to be
+        released when that many are in use.
+    :param idle_timeout: The number of seconds an idle connection is kept.
+        Older ones are closed instead of being reused.
+    :param timeout: The socket timeout of the connections, in seconds. None
+        means the global default.
+
+    The opened and reused attributes count the connections that were opened
+    and the requests that were sent over an already open connection.
+    '''
+
+    def __init__(self, max_size=10, idle_timeout=60, timeout=None):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self.opened = 0
+        self.reused = 0
+
+        self.__idle = {}
+        self.__counts = {}
+        self.__cond = threading.Condition()
+
+    def request(self, url, body, headers={}, method='POST'):
+        '''Sends the request and returns the status code and the body of the
+        response.'''
+
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.hostname,
+                                  parts.port or _default_ports[parts.scheme])
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+
+        while True:
+            conn, is_reused = self.__get(key)
+
+            # the server may have closed the idle connection in the meantime.
+            # the request is sent again over a new one only when it's certain
+            # that the server hasn't processed it, i.e. when sending fails or
+            # when the connection is closed without a response. timeouts and
+            # the other errors are not retried, as the request may have been
+            # processed.
+            try:
+                conn.request(method, path, body, headers)
+
+            except socket.error, e:
+                self.__discard(key, conn)
+                if is_reused and not isinstance(e, socket.timeout) and \
+                                                     e.errno in _stale_errnos:
+                    continue
+                raise
+
+            except:
+                self.__discard(key, conn)
+                raise
+
+            try:
+                response = conn.getresponse()
+                data = response.read()
+
+            except httplib.BadStatusLine:
+                self.__discard(key, conn)
+                if is_reused:
+                    continue
+                raise
+
+            except:
+                self.__discard(key, conn)
+                raise
+
+            if response.will_close:
+                self.__discard(key, conn)
+            else:
+                self.__release(key, conn)
+
+            return response.status, data
+
+    def close(self):
+        '''Closes the idle connections.'''
+
+        with self.__cond:
+            for key, idle in self.__idle.items():
+                for conn, _ in idle:
+                    conn.close()
+                self.__counts[key] -= len(idle)
+                del idle[:]
+
+            self.__cond.notify_all()
+
+    def __get(self, key):
+        with self.__cond:
+            idle = self.__idle.setdefault(key, [])
+
+            while True:
+                now = time()
+                while len(idle) > 0:
+                    conn, last_used = idle.pop()
+                    if now - last_used < self.idle_timeout:
+                        self.reused += 1
+                        return conn, True
+
+                    conn.close()
+                    self.__counts[key] -= 1
+
+                count = self.__counts.get(key, 0)
+                if count < self.max_size:
+                    self.__counts[key] = count + 1
+                    self.opened += 1
+                    break
+
+                self.__cond.wait()
+
+        scheme, host, port = key
+        conn = _connection_classes[scheme](host, port, timeout=self.timeout)
+
+        return conn, False
+
+    def __release(self, key, conn):
+        with self.__cond:
+            self.__idle[key].append((conn, time()))
+            self.__cond.notify()
+
+    def __discard(self, key, conn):
+        conn.close()
+
+        with self.__cond:
+            self.__counts[key] -= 1
+            self.__cond.notify()
 
 class _RemoteProcedure(RemoteProcedureBase):
+    def __init__(self, url, app, name, out_header=None, pool=None):
+        RemoteProcedureBase.__init__(self, url, app, name, out_header)
+
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+
+        self.headers = {
+            'Content-Type': '%s; charset=%s' % (app.out_protocol.mime_type,
+                                                          string_encoding),
+            'SOAPAction': '"%s"' % name,
+        }
+
     def __call__(self, *args, **kwargs):
-        self.get_out_object(args, kwargs) # sets self.ctx.out_object
-        self.get_out_string()
+        ctx = self.get_context()
 
-        out_string = ''.join(self.ctx.out_string)
-        request = urllib2.Request(self.url, out_string)
-        code=200
         try:
-            response = urllib2.urlopen(request)
-            self.ctx.in_string = response.read()
+            self.get_out_object(ctx, args, kwargs) # sets ctx.out_object
+            self.get_out_string(ctx)
+
+            out_string = ''.join(ctx.out_string)
+            code, ctx.in_string = self.pool.request(self.url, out_string,
+                                                                 self.headers)
+
+            self.get_in_object(ctx, is_error=(code == 500))
 
-        except urllib2.HTTPError,e:
-            code=e.code
-            self.ctx.in_string = e.read()
+            if ctx.in_error is None:
+                return ctx.in_object
+            else:
+                return ctx.in_error
 
-        self.get_in_object(is_error=(code == 500))
-        if self.ctx.in_error is None:
-            return self.ctx.in_object
-        else:
-            return self.ctx.in_error
+        finally:
+            self.release_context(ctx)
 
 class Client(ClientBase):
-    def __init__(self, url, app):
+    '''An http client.
+
+    :param url: The url of the server.
+    :param app: The application that describes the remote services.
+    :param pool: The ConnectionPool to get the connections from. Each client
+        creates its own by default.
+    '''
+
+    def __init__(self, url, app, pool=None):
         super(Client, self).__init__(url, app)
 
-        # FIXME: this four-line block should be explained...
-        if isinstance(app.in_protocol,rpclib.protocol.soap.Soap11):
-            app.in_protocol.in_wrapper = rpclib.protocol.soap.Soap11.OUT_WRAPPER
-        if isinstance(app.out_protocol,rpclib.protocol.soap.Soap11):
-            app.out_protocol.out_wrapper= rpclib.protocol.soap.Soap11.NO_WRAPPER
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
 
-        self.service = Service(_RemoteProcedure, url, app)
+        self.service = Service(partial(_RemoteProcedure, pool=pool), url, app)
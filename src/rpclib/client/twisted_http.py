@@ -0,0 +1,136 @@
+
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""A soap client that uses twisted.web as transport.
+
+Calling a remote method returns a twisted Deferred instead of blocking until
+the response arrives, so many calls can be in flight at the same time from the
+reactor thread:
+
+    client = Client('http://localhost:7789/', app)
+
+    d1 = client.service.get_rate('EUR')
+    d2 = client.service.get_rate('USD', _timeout=2)
+    d = gatherResults([d1, d2])
+
+The connections are kept open between the calls in a
+twisted.web.client.HTTPConnectionPool, which can be shared by many clients.
+When the response doesn't arrive in the number of seconds given with the
+_timeout keyword argument (or the timeout argument of the client), the request
+is cancelled and the Deferred fails with twisted.internet.defer.TimeoutError.
+"""
+
+from cStringIO import StringIO
+from functools import partial
+
+from twisted.internet import reactor
+from twisted.internet.defer import TimeoutError
+from twisted.web.client import Agent
+from twisted.web.client import FileBodyProducer
+from twisted.web.client import HTTPConnectionPool
+from twisted.web.client import readBody
+from twisted.web.http_headers import Headers
+
+from rpclib.client import Service
+from rpclib.client import ClientBase
+from rpclib.client import RemoteProcedureBase
+from rpclib.model.primitive import string_encoding
+
+def _on_timeout(result, timeout):
+    # the agent wraps the CancelledError of the request in its own exception.
+    raise TimeoutError("No response in %r seconds." % timeout)
+
+class _RemoteProcedure(RemoteProcedureBase):
+    def __init__(self, url, app, name, out_header=None, agent=None,
+                                                                  timeout=None):
+        RemoteProcedureBase.__init__(self, url, app, name, out_header)
+
+        self.agent = agent
+        self.timeout = timeout
+
+        self.headers = Headers({
+            'Content-Type': ['%s; charset=%s' % (app.out_protocol.mime_type,
+                                                             string_encoding)],
+            'SOAPAction': ['"%s"' % name],
+        })
+
+    def __call__(self, *args, **kwargs):
+        timeout = kwargs.pop('_timeout', self.timeout)
+
+        ctx = self.get_context()
+
+        try:
+            self.get_out_object(ctx, args, kwargs) # sets ctx.out_object
+            self.get_out_string(ctx)
+
+            body = FileBodyProducer(StringIO(''.join(ctx.out_string)))
+
+        except:
+            self.release_context(ctx)
+            raise
+
+        d = self.agent.request('POST', self.url, self.headers, body)
+        d.addCallback(self.__read_response)
+        if not (timeout is None):
+            d.addTimeout(timeout, reactor, onTimeoutCancel=_on_timeout)
+
+        d.addCallback(self.__get_result, ctx)
+        d.addBoth(self.__release, ctx)
+
+        return d
+
+    def __read_response(self, response):
+        return readBody(response).addCallback(lambda data: (response.code, data))
+
+    def __get_result(self, (code, data), ctx):
+        ctx.in_string = data
+
+        self.get_in_object(ctx, is_error=(code == 500))
+
+        if ctx.in_error is None:
+            return ctx.in_object
+        else:
+            return ctx.in_error
+
+    def __release(self, result, ctx):
+        self.release_context(ctx)
+
+        return result
+
+class Client(ClientBase):
+    '''A twisted.web client.
+
+    :param url: The url of the server.
+    :param app: The application that describes the remote services.
+    :param pool: The twisted.web.client.HTTPConnectionPool to get the
+        connections from. Each client creates its own by default.
+    :param timeout: The default number of seconds to wait for a response. None
+        means no timeout.
+    '''
+
+    def __init__(self, url, app, pool=None, timeout=None):
+        super(Client, self).__init__(url, app)
+
+        if pool is None:
+            pool = HTTPConnectionPool(reactor, persistent=True)
+            pool.maxPersistentPerHost = 10
+        self.pool = pool
+
+        self.service = Service(partial(_RemoteProcedure,
+                  agent=Agent(reactor, pool=pool), timeout=timeout), url, app)
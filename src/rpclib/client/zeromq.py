@@ -17,31 +17,40 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
-"""A soap client that uses ZeroMQ (zmq.REQ) as transport"""
+"""An rpc client that uses ZeroMQ (zmq.REQ) as transport. Works with any
+protocol, e.g. Soap11 or the more compact MessagePackObject."""
 
 import zmq
 
 from rpclib.client import Service
 from rpclib.client import RemoteProcedureBase
-from rpclib.client import Base
+from rpclib.client import ClientBase
 
 context = zmq.Context()
 
 class _RemoteProcedure(RemoteProcedureBase):
     def __call__(self, *args, **kwargs):
-        out_object = self.get_out_object(args, kwargs)
-        out_string = self.get_out_string(out_object)
+        ctx = self.get_context()
 
-        socket = context.socket(zmq.REQ)
-        socket.connect(self.url)
-        socket.send(out_string)
-    
-        in_str = socket.recv()
+        try:
+            self.get_out_object(ctx, args, kwargs)
+            self.get_out_string(ctx)
 
-        return self.get_in_object(in_str)
+            socket = context.socket(zmq.REQ)
+            socket.connect(self.url)
+            socket.send(''.join(ctx.out_string))
 
-class Client(Base):
+            ctx.in_string = socket.recv()
+
+            self.get_in_object(ctx)
+
+            return ctx.in_object
+
+        finally:
+            self.release_context(ctx)
+
+class Client(ClientBase):
     def __init__(self, url, app):
-        Base.__init__(self, url, app)
+        ClientBase.__init__(self, url, app)
 
         self.service = Service(_RemoteProcedure, url, app)
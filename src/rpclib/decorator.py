@@ -144,6 +144,9 @@ def rpc(*params, **kparams):
                 _port_type = kparams.get('_soap_port_type', None)
                 _no_ctx = kparams.get('_no_ctx', False)
                 _faults = kparams.get('_faults', [])
+                _cache = kparams.get('_cache', None)
+                _executor = kparams.get('_executor', None)
+                _coalesce = kparams.get('_coalesce', None)
 
                 in_message = _produce_input_message(f, params, kparams, _no_ctx)
                 out_message = _produce_output_message(f, params, kparams)
@@ -152,7 +155,8 @@ def rpc(*params, **kparams):
                 retval = MethodDescriptor(f.func_name, _public_name,
                         in_message, out_message, doc, _is_callback, _is_async,
                         _mtom, _in_header, _out_header, _faults,
-                        port_type=_port_type, no_ctx=_no_ctx)
+                        port_type=_port_type, no_ctx=_no_ctx, cache=_cache,
+                        executor=_executor, coalesce=_coalesce)
 
             return retval
 
@@ -22,6 +22,7 @@ logger = logging.getLogger(__name__)
 
 import warnings
 from rpclib.util.odict import odict
+from rpclib._base import MethodRoute
 
 import rpclib.const.xml_ns
 _ns_xsd = rpclib.const.xml_ns.xsd
@@ -42,6 +43,8 @@ class Base(object):
         self.url = None
 
         self.call_routes = {}
+        self.routes = {}
+        self.method_routes = []
         self.namespaces = odict()
         self.classes = {}
         self.imports = {}
@@ -257,6 +260,73 @@ class Base(object):
                     fault.resolve_namespace(fault, self.get_tns())
                     fault.add_to_schema(self)
 
+        # compile serializers and deserializers. this needs to be done after
+        # all the namespaces are resolved.
+        for s in self.services:
+            for method in s.public_methods:
+                for cls in (method.in_header, method.out_header,
+                                        method.in_message, method.out_message):
+                    if not (cls is None):
+                        cls.compile_serializer()
+                        cls.compile_deserializer()
+
+        self.populate_routes()
+
+    def populate_routes(self):
+        """Builds the routing index that maps the qualified and bare method
+        names, the qualified name of the input message and the SOAPAction of
+        every public method to its MethodRoute instance. Must be called after
+        the namespaces of the messages are resolved.
+
+        The routes are numbered in the order of the qualified method names, and
+        are listed in that order in method_routes, so that route.id indexes it.
+
+        Not meant to be overridden.
+        """
+
+        routes = {}
+        method_routes = []
+        aliases = []
+        tns = self.get_tns()
+
+        methods = []
+        for s in self.services:
+            for method in s.public_methods:
+                methods.append(("{%s}%s" % (tns, method.name), s, method))
+        methods.sort(key=lambda m: m[0])
+
+        # the qualified method names are guaranteed to be unique by the checks
+        # in populate_interface, and are registered before the aliases so that
+        # no alias can override them.
+        for i, (name, s, method) in enumerate(methods):
+            route = MethodRoute(s, method, getattr(s, method.name), i)
+            in_message_name = "{%s}%s" % (method.in_message.get_namespace(),
+                                          method.in_message.get_type_name())
+
+            routes[name] = route
+            method_routes.append(route)
+            for key in (in_message_name, method.name, method.public_name):
+                aliases.append((key, route))
+
+        for key, route in aliases:
+            o = routes.setdefault(key, route)
+            if not (o is route):
+                raise Exception("%s.%s.%s overwrites the route %r of %s.%s.%s" %
+                      (route.service_class.__module__,
+                       route.service_class.__name__, route.descriptor.name,
+                       key, o.service_class.__module__, o.service_class.__name__,
+                       o.descriptor.name))
+
+        self.routes = routes
+        self.method_routes = method_routes
+
+    def get_route(self, method_name):
+        """Returns the MethodRoute instance for the given qualified or bare
+        method name or SOAPAction. Raises KeyError when there's no such method.
+        """
+
+        return self.routes[method_name]
+
     tns = property(get_tns)
 
     def get_namespace_prefix(self, ns):
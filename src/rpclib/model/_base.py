@@ -176,6 +176,22 @@ class ModelBase(object):
 
         etree.SubElement(parent_elt, "{%s}%s" % (tns,name)).text = cls.to_string(value)
 
+    @classmethod
+    def compile_serializer(cls):
+        '''
+        Precomputes what's needed to serialize instances of this class. It's
+        called once for every type in the interface when the interface is built.
+        '''
+        #Nothing needs to happen for types without members
+
+    @classmethod
+    def compile_deserializer(cls):
+        '''
+        Precomputes what's needed to deserialize instances of this class. It's
+        called once for every type in the interface when the interface is built.
+        '''
+        #Nothing needs to happen for types without members
+
     @classmethod
     def add_to_schema(cls, schema_entries):
         '''
@@ -193,8 +209,14 @@ class ModelBase(object):
 
         cls_dict = {}
 
+        # the slot descriptors are recreated from __slots__.
+        slots = cls.__dict__.get('__slots__', ())
+
         for k in cls.__dict__:
-            if not (k in ("__dict__", "__weakref__")):
+            # compiled (de)serializers belong to the class they were compiled
+            # for, so they're not copied to the clone.
+            if not (k in ("__dict__", "__weakref__") or k in slots or
+                                                    k.startswith('_compiled_')):
                 cls_dict[k] = cls.__dict__[k]
 
         class Attributes(cls.Attributes):
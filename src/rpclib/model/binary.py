@@ -17,22 +17,144 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
+"""The Attachment type, for binary data that's transferred base64-encoded.
+
+Large files can be transferred without loading them to memory by using a
+streaming Attachment type:
+
+    StreamingAttachment = Attachment.customize(stream=True)
+
+Outgoing attachments of such types that have a file_name and no data are
+mmap'd and base64-encoded in chunks as the response is written. Only the Soap
+protocols write the response incrementally. Incoming ones are decoded into a
+temporary file as the Soap protocols parse the request, so their base64 text is
+never held in memory as a whole. The file is kept in memory until it grows
+beyond spool_size bytes. It's accessible as the file attribute of the
+Attachment, and its data attribute is None.
+"""
+
 import base64
+import binascii
+import mmap
+import os
+import shutil
 
 from cStringIO import StringIO
+from urllib import unquote
+from tempfile import SpooledTemporaryFile
 from lxml import etree
 from rpclib.model import nillable_element
 from rpclib.model import nillable_value
 from rpclib.model import nillable_string
 from rpclib.model import ModelBase
 
+import rpclib.const.xml_ns
+
+_ns_xop = rpclib.const.xml_ns.xop
+
+# the target of the processing instructions that stand for the contents of
+# streamed attachments. their text is the id of the Attachment instance, which
+# the protocol looks up in the attachments it collected from the response
+# object. file names are never taken from the document itself.
+ATTACHMENT_PI_TARGET = 'rpclib-attachment'
+
+# the size of the raw chunks that are base64-encoded at a time. it's a multiple
+# of 57, which is what fits in a line of base64.encodestring output.
+_encode_chunk_size = 57 * 1024
+# the size of the chunks of base64 text that are decoded at a time.
+_decode_chunk_size = 64 * 1024
+
+# the size of the chunks of raw data that are written to mime parts.
+_raw_chunk_size = 64 * 1024
+
+def _iter_file(file_name, chunk_size):
+    '''Yields the contents of the given file in chunks. The file is mmap'd
+    instead of read.'''
+
+    f = open(file_name, 'rb')
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0: # empty files can't be mmap'd
+            return
+
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for i in xrange(0, size, chunk_size):
+                yield m[i:i + chunk_size]
+        finally:
+            m.close()
+
+    finally:
+        f.close()
+
+def iter_base64_file(file_name, chunk_size=_encode_chunk_size):
+    '''Yields the contents of the given file base64-encoded in chunks, in the
+    format of base64.encodestring.'''
+
+    assert chunk_size % 57 == 0
+
+    for chunk in _iter_file(file_name, chunk_size):
+        yield base64.encodestring(chunk)
+
+class Base64Decoder(object):
+    '''Decodes the base64 text that's written to it in chunks of any size to
+    the given file. Call finish() after the last chunk.'''
+
+    def __init__(self, f):
+        self.file = f
+        self.__pending = ''
+
+    def write(self, text):
+        chunk = self.__pending + ''.join(text.split())
+
+        # a2b_base64 needs complete quadruplets, the rest is carried over.
+        n = len(chunk) - len(chunk) % 4
+        self.file.write(binascii.a2b_base64(chunk[:n]))
+        self.__pending = chunk[n:]
+
+    def finish(self):
+        if len(self.__pending) > 0:
+            self.file.write(binascii.a2b_base64(self.__pending))
+            self.__pending = ''
+
+def decode_base64_to_file(text, f, chunk_size=_decode_chunk_size):
+    '''Decodes the given base64 text to the given file in chunks.'''
+
+    decoder = Base64Decoder(f)
+    for i in xrange(0, len(text), chunk_size):
+        decoder.write(text[i:i + chunk_size])
+    decoder.finish()
+
+def _get_content_id(href):
+    '''Returns the Content-ID (or the Content-Location) of the mime part
+    that the given href refers to.'''
+
+    href = unquote(href)
+    if href.startswith('cid:'):
+        return href[4:]
+    return href
+
+class XopInclude(object):
+    '''Stands for an attachment that's sent as a separate part of a MIME
+    multipart message with the given Content-ID. It's serialized as an
+    xop:Include element that refers to that part, and it's what such elements
+    are deserialized to until the protocol resolves them.'''
+
+    def __init__(self, content_id):
+        self.content_id = content_id
+
 class Attachment(ModelBase):
     __type_name__ = 'base64Binary'
     __namespace__ = "http://www.w3.org/2001/XMLSchema"
 
-    def __init__(self, data=None, file_name=None):
+    class Attributes(ModelBase.Attributes):
+        stream = False
+        spool_size = 1024 * 1024
+
+    def __init__(self, data=None, file_name=None, file=None):
         self.data = data
         self.file_name = file_name
+        self.file = file
 
     def save_to_file(self):
         '''This method writes the data to the specified file.  This method
@@ -42,16 +164,42 @@ class Attachment(ModelBase):
         disk.
         '''
 
-        if not self.data:
+        if not (self.data or self.file):
             raise Exception("No data to write")
 
         if not self.file_name:
             raise Exception("No file_name specified")
 
         f = open(self.file_name, 'wb')
-        f.write(self.data)
+        if self.data:
+            f.write(self.data)
+        else:
+            self.file.seek(0)
+            shutil.copyfileobj(self.file, f)
         f.close()
 
+    def iter_data(self, chunk_size=_raw_chunk_size):
+        '''Yields the raw data of the attachment in chunks, without loading
+        file-backed attachments to memory.'''
+
+        if not (self.data is None):
+            yield self.data
+
+        elif not (self.file is None):
+            self.file.seek(0)
+            while True:
+                chunk = self.file.read(chunk_size)
+                if len(chunk) == 0:
+                    break
+                yield chunk
+
+        elif not (self.file_name is None):
+            for chunk in _iter_file(self.file_name, chunk_size):
+                yield chunk
+
+        else:
+            raise Exception("Neither data nor a file_name has been specified")
+
     def load_from_file(self):
         '''This method loads the data from the specified file, and does
         no encoding/decoding of the data
@@ -72,14 +220,43 @@ class Attachment(ModelBase):
         '''
 
         element = etree.SubElement(parent_elt, '{%s}%s' % (tns,name))
-        element.text = base64.encodestring(cls.to_string(value))
-        
+
+        if isinstance(value, XopInclude):
+            etree.SubElement(element, '{%s}Include' % _ns_xop,
+                                          href='cid:%s' % value.content_id)
+
+        elif cls.Attributes.stream and value.data is None and \
+                                                not (value.file_name is None):
+            # the protocol replaces this with the contents of the file.
+            element.append(etree.PI(ATTACHMENT_PI_TARGET, str(id(value))))
+
+        else:
+            element.text = base64.encodestring(cls.to_string(value))
+
     @classmethod
     @nillable_element
     def from_xml(cls, element):
         '''This method returns an Attachment object that contains
         the base64 decoded string of the text of the given element
         '''
+
+        # references to the parts of multipart (SwA or MTOM) messages.
+        if len(element) > 0:
+            include = element.find('{%s}Include' % _ns_xop)
+            if not (include is None):
+                return XopInclude(_get_content_id(include.get('href', '')))
+
+        # hrefs to fragments are soap multiRefs, which are resolved in place.
+        href = element.get('href')
+        if not (href is None or href.startswith('#')):
+            return XopInclude(_get_content_id(href))
+        if cls.Attributes.stream:
+            f = SpooledTemporaryFile(max_size=cls.Attributes.spool_size)
+            decode_base64_to_file(element.text or '', f)
+            f.seek(0)
+
+            return Attachment(file=f)
+
         data = base64.decodestring(element.text)
         a = Attachment(data=data)
         return a
@@ -97,6 +274,10 @@ class Attachment(ModelBase):
             # and return the element
             return value.data
 
+        elif not (value.file is None):
+            value.file.seek(0)
+            return value.file.read()
+
         elif not (value.file_name is None):
             # the data hasn't been loaded, but a file has been
             # specified
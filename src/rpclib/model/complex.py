@@ -20,23 +20,162 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import re
 import csv
+import keyword
 try:
     from cStringIO import StringIO
 except ImportError:
     from StringIO import StringIO
 
+from array import array
+
 from lxml import etree
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from rpclib.model import ModelBase
 from rpclib.model import nillable_element
 from rpclib.model import nillable_value
 from rpclib.model import nillable_dict
 from rpclib.model import nillable_string
 
+from rpclib.model.primitive import Double
+from rpclib.model.primitive import Integer
+
 from rpclib.util.odict import odict as TypeInfo
+from rpclib.util.etreeconv import get_parser
 from rpclib.const import xml_ns as namespace
 
+_ns_xsi = namespace.xsi
+
+def _simple_member_writer(member):
+    to_string = member.to_string
+
+    def write(value, parent, tag):
+        element = etree.SubElement(parent, tag)
+        if value is None:
+            element.set('{%s}nil' % _ns_xsi, 'true')
+        else:
+            element.text = to_string(value)
+
+    return write
+
+def _complex_member_writer(member):
+    get_serialization_instance = member.get_serialization_instance
+    write_members = member.compile_serializer()
+
+    def write(value, parent, tag):
+        element = etree.SubElement(parent, tag)
+        if value is None:
+            element.set('{%s}nil' % _ns_xsi, 'true')
+        else:
+            write_members(get_serialization_instance(value), element)
+
+    return write
+
+def _generic_member_writer(member, ns, name):
+    to_parent_element = member.to_parent_element
+
+    def write(value, parent, tag):
+        to_parent_element(value, ns, parent, name)
+
+    return write
+
+def _member_parser(member):
+    member.compile_deserializer()
+
+    if not (issubclass(member, ComplexModelBase) and
+             member.from_xml.im_func is ComplexModelBase.from_xml.im_func):
+        return member.from_xml
+
+    parse = member.__dict__['_compiled_from_xml']
+
+    def from_xml(element):
+        if bool(element.get('{%s}nil' % _ns_xsi)):
+            return None
+        return parse(element)
+
+    return from_xml
+
+def _get_bulk_format(serializer):
+    '''Returns a (to_string, from_string, typecode) triplet when the arrays of
+    the given type can be converted to and from text in bulk, None otherwise.
+    The typecode is for array.array, and is mapped to a numpy dtype.'''
+
+    to_string = getattr(getattr(serializer, 'to_string', None), 'im_func', None)
+    from_string = getattr(getattr(serializer, 'from_string', None), 'im_func',
+                                                                          None)
+
+    if to_string is Double.to_string.im_func and \
+                                 from_string is Double.from_string.im_func:
+        return repr, float, 'd'
+
+    if to_string is ModelBase.to_string.im_func and \
+                                from_string is Integer.from_string.im_func:
+        return str, int, 'l'
+
+_numpy_dtypes = {'d': 'float64', 'l': 'int64'}
+
+# the values that are written in bulk. their string representations don't need
+# to be escaped.
+_number_types = (int, long, float)
+
+def _are_numbers(values):
+    for v in values:
+        if not isinstance(v, _number_types):
+            return False
+
+    return True
+
+_identifier = re.compile('^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _compile_init(keys):
+    '''Generates the __init__ of a compact class, that sets the given members
+    directly, to the values in the keyword arguments or to None.'''
+
+    if len(keys) == 0:
+        def __init__(self, **kwargs):
+            pass
+
+        __init__._is_compact_init = True
+        return __init__
+
+    def target(k):
+        if _identifier.match(k) and not keyword.iskeyword(k):
+            return 'self.%s' % k
+        return None
+
+    with_kwargs = []
+    without_kwargs = []
+    for k in keys:
+        t = target(k)
+        if t is None:
+            with_kwargs.append('        setattr(self, %r, get(%r))' % (k, k))
+            without_kwargs.append('        setattr(self, %r, None)' % k)
+        else:
+            with_kwargs.append('        %s = get(%r)' % (t, k))
+            without_kwargs.append('        %s = None' % t)
+
+    source = '\n'.join([
+        'def __init__(self, **kwargs):',
+        '    if kwargs:',
+        '        get = kwargs.get',
+    ] + with_kwargs + [
+        '    else:',
+    ] + without_kwargs)
+
+    namespace = {}
+    exec source in namespace
+
+    retval = namespace['__init__']
+    retval._is_compact_init = True
+
+    return retval
+
 class XMLAttribute(ModelBase):
     """Items which are marshalled as attributes of the parent element."""
 
@@ -124,7 +263,28 @@ class ComplexModelMeta(type(ModelBase)):
         else:
             _type_info = cls_dict['_type_info']
             if not isinstance(_type_info, TypeInfo):
-                cls_dict['_type_info'] = TypeInfo(_type_info)
+                cls_dict['_type_info'] = _type_info = TypeInfo(_type_info)
+
+        # compact classes store their members in slots, and have an __init__
+        # that's generated for their members.
+        compact = cls_dict.get('__compact__', None)
+        if compact is None:
+            compact = True in [getattr(b, '__compact__', False)
+                                                             for b in cls_bases]
+
+        if compact and not ('__slots__' in cls_dict):
+            keys = _type_info.keys()
+            cls_dict['__slots__'] = tuple(keys)
+            for k in keys:
+                cls_dict.pop(k, None)
+
+            if not ('__init__' in cls_dict):
+                chain_keys = []
+                while not (extends is None):
+                    chain_keys = extends._type_info.keys() + chain_keys
+                    extends = getattr(extends, '__extends__', None)
+
+                cls_dict['__init__'] = _compile_init(chain_keys + keys)
 
         return type.__new__(cls, cls_name, cls_bases, cls_dict)
 
@@ -132,8 +292,13 @@ class ComplexModelBase(ModelBase):
     """
     If you want to make a better class type, this is what you should
     inherit from
+
+    Set __compact__ to True in a subclass to store the members of its
+    instances in __slots__. Subclasses of compact classes are compact as well.
     """
 
+    __compact__ = False
+
     def __init__(self, **kwargs):
         super(ComplexModelBase,self).__init__()
 
@@ -186,6 +351,10 @@ class ComplexModelBase(ModelBase):
 
     @classmethod
     def get_members_etree(cls, inst, parent):
+        compiled = cls.__dict__.get('_compiled_members_etree', None)
+        if not (compiled is None):
+            return compiled(inst, parent)
+
         parent_cls = getattr(cls, '__extends__', None)
         if not (parent_cls is None):
             parent_cls.get_members_etree(inst, parent)
@@ -199,7 +368,7 @@ class ComplexModelBase(ModelBase):
 
             mo = v.Attributes.max_occurs
             if mo == 'unbounded' or mo > 1:
-                if subvalue != None:
+                if not (subvalue is None):
                     for sv in subvalue:
                         v.to_parent_element(sv, cls.get_namespace(), parent, k)
 
@@ -207,6 +376,83 @@ class ComplexModelBase(ModelBase):
             elif subvalue is not None or v.Attributes.nillable or v.Attributes.min_occurs > 0:
                 v.to_parent_element(subvalue, cls.get_namespace(), parent, k)
 
+    @classmethod
+    def compile_serializer(cls):
+        '''Builds and returns a function that does what get_members_etree does
+        for this class, with the members of the whole __extends__ chain
+        flattened, the qualified tag names pre-built and the serializers of the
+        members pre-resolved. The result is cached in the class and is used by
+        get_members_etree from then on.
+
+        Namespaces must be resolved before calling this function.
+        '''
+
+        retval = cls.__dict__.get('_compiled_members_etree', None)
+        if not (retval is None):
+            return retval
+
+        # the function is registered before the members are compiled so that
+        # recursive type definitions resolve to it.
+        plan = []
+
+        def write_members(inst, parent):
+            for k, tag, marshall, is_array, skip_none, write in plan:
+                subvalue = getattr(inst, k, None)
+
+                if not (marshall is None):
+                    marshall(k, subvalue, parent)
+
+                elif is_array:
+                    if not (subvalue is None):
+                        for sv in subvalue:
+                            write(sv, parent, tag)
+
+                # Don't include empty values for non-nillable optional
+                # attributes.
+                elif not (subvalue is None and skip_none):
+                    write(subvalue, parent, tag)
+
+        cls._compiled_members_etree = write_members
+
+        chain = []
+        c = cls
+        while not (c is None):
+            chain.insert(0, c)
+            c = getattr(c, '__extends__', None)
+
+        for c in chain:
+            ns = c.get_namespace()
+
+            for k, v in c._type_info.items():
+                tag = "{%s}%s" % (ns, k)
+
+                if isinstance(v, XMLAttribute):
+                    plan.append((k, tag, v.marshall, False, False, None))
+                    continue
+
+                if (issubclass(v, ComplexModelBase) and
+                        v.to_parent_element.im_func is
+                                  ComplexModelBase.to_parent_element.im_func and
+                        v.get_members_etree.im_func is
+                                  ComplexModelBase.get_members_etree.im_func):
+                    write = _complex_member_writer(v)
+
+                elif (v.to_parent_element.im_func is
+                                         ModelBase.to_parent_element.im_func):
+                    write = _simple_member_writer(v)
+
+                else:
+                    write = _generic_member_writer(v, ns, k)
+
+                mo = v.Attributes.max_occurs
+                is_array = (mo == 'unbounded' or mo > 1)
+                skip_none = not (v.Attributes.nillable or
+                                                   v.Attributes.min_occurs > 0)
+
+                plan.append((k, tag, None, is_array, skip_none, write))
+
+        return write_members
+
     @classmethod
     @nillable_value
     def to_parent_element(cls, value, tns, parent_elt, name=None):
@@ -252,7 +498,10 @@ class ComplexModelBase(ModelBase):
         return cls.get_members_dict(inst, retval)
 
     @staticmethod
-    def get_flat_type_info(clz, retval={}):
+    def get_flat_type_info(clz, retval=None):
+        if retval is None:
+            retval = {}
+
         parent = getattr(clz, '__extends__', None)
         if parent != None:
             clz.get_flat_type_info(parent, retval)
@@ -297,10 +546,11 @@ class ComplexModelBase(ModelBase):
     @classmethod
     @nillable_element
     def from_xml(cls, element):
-        inst = cls.get_deserialization_instance()
+        compiled = cls.__dict__.get('_compiled_from_xml', None)
+        if not (compiled is None):
+            return compiled(element)
 
-        # FIXME: the result of this method should be cached when build_wsdl is
-        #        called (i.e. when _type_info becomes by definition immutable).
+        inst = cls.get_deserialization_instance()
         flat_type_info = ComplexModelBase.get_flat_type_info(cls)
 
         # initialize instance
@@ -337,6 +587,108 @@ class ComplexModelBase(ModelBase):
 
         return inst
 
+    @classmethod
+    def compile_deserializer(cls):
+        '''Builds and returns a function that does what from_xml does for this
+        class (minus the xsi:nil check), using a table that maps the qualified
+        tag names of the members of the whole __extends__ chain to the member
+        name, the pre-resolved member deserializer and whether the member is
+        an array. The result is cached in the class and is used by from_xml
+        from then on.
+
+        Namespaces must be resolved before calling this function.
+        '''
+
+        retval = cls.__dict__.get('_compiled_from_xml', None)
+        if not (retval is None):
+            return retval
+
+        # the tables are filled after the function is registered so that
+        # recursive type definitions resolve to it.
+        defaults = {}
+        by_tag = {}
+        by_name = {}
+        attributes = []
+
+        default_instance = (cls.get_deserialization_instance.im_func is
+                         ComplexModelBase.get_deserialization_instance.im_func)
+
+        if default_instance and \
+                          cls.__init__.im_func is ComplexModelBase.__init__.im_func:
+            def build(values):
+                inst = cls.__new__(cls)
+                inst.__dict__ = values
+                return inst
+
+        elif default_instance and \
+                             getattr(cls.__init__.im_func, '_is_compact_init', False):
+            def build(values):
+                return cls(**values)
+
+        else:
+            def build(values):
+                inst = cls.get_deserialization_instance()
+                for k, v in values.iteritems():
+                    setattr(inst, k, v)
+                return inst
+
+        def from_xml(element):
+            values = defaults.copy()
+
+            for c in element:
+                tag = c.tag
+                entry = by_tag.get(tag, None)
+
+                if entry is None:
+                    if tag is etree.Comment or tag is etree.PI:
+                        continue
+
+                    # the member could still be in an unexpected namespace.
+                    entry = by_name.get(tag.split('}')[-1], None)
+                    if entry is None:
+                        continue
+
+                key, parse, is_array = entry
+                if is_array:
+                    value = values[key]
+                    if value is None:
+                        values[key] = value = []
+                    value.append(parse(c))
+
+                else:
+                    values[key] = parse(c)
+
+            for key in attributes:
+                values[key] = element.get(key)
+
+            return build(values)
+
+        cls._compiled_from_xml = from_xml
+
+        chain = []
+        c = cls
+        while not (c is None):
+            chain.insert(0, c)
+            c = getattr(c, '__extends__', None)
+
+        for c in chain:
+            ns = c.get_namespace()
+
+            for k, v in c._type_info.items():
+                defaults[k] = None
+
+                if isinstance(v, XMLAttribute):
+                    attributes.append(k)
+                    continue
+
+                mo = v.Attributes.max_occurs
+                entry = (k, _member_parser(v), mo == 'unbounded' or mo > 1)
+
+                by_tag["{%s}%s" % (ns, k)] = entry
+                by_name[k] = entry
+
+        return from_xml
+
     @classmethod
     def from_string(cls, xml_string):
         inst = cls.from_xml(etree.fromstring(xml_string))
@@ -464,6 +816,19 @@ class ComplexModel(ComplexModelBase):
     __metaclass__ = ComplexModelMeta
 
 class Array(ComplexModel):
+    """Arrays of Double, Float and Integer values are serialized and
+    deserialized in bulk. Such arrays accept lists, array.array and numpy arrays
+    as values. They are deserialized to lists by default; set the container
+    attribute to 'array' or 'numpy' to get array.array or numpy arrays instead:
+
+        Array(Double, container='numpy')
+
+    Arrays with nil items are deserialized to lists regardless.
+    """
+
+    class Attributes(ComplexModel.Attributes):
+        container = None
+
     def __new__(cls, serializer, ** kwargs):
         retval = cls.customize(**kwargs)
 
@@ -515,6 +880,10 @@ class Array(ComplexModel):
     @classmethod
     @nillable_element
     def from_xml(cls, element):
+        compiled = cls.__dict__.get('_compiled_from_xml', None)
+        if not (compiled is None):
+            return compiled(element)
+
         retval = []
         (serializer,) = cls._type_info.values()
 
@@ -523,6 +892,89 @@ class Array(ComplexModel):
 
         return retval
 
+    @classmethod
+    def compile_deserializer(cls):
+        retval = cls.__dict__.get('_compiled_from_xml', None)
+        if not (retval is None):
+            return retval
+
+        (serializer,) = cls._type_info.values()
+        parse = _member_parser(serializer)
+
+        def from_xml(element):
+            return [parse(c) for c in element
+                          if not (c.tag is etree.Comment or c.tag is etree.PI)]
+
+        cls._compiled_from_xml = from_xml
+
+        bulk_format = _get_bulk_format(serializer)
+        if not (bulk_format is None):
+            cls._compiled_from_xml = cls.__compile_bulk_deserializer(from_xml,
+                                                                   bulk_format)
+
+        return cls._compiled_from_xml
+
+    @classmethod
+    def __compile_bulk_deserializer(cls, generic, bulk_format):
+        _, from_string, typecode = bulk_format
+        container = cls.Attributes.container
+
+        def from_xml(element):
+            texts = [c.text for c in element.iterchildren(tag=etree.Element)]
+            if None in texts: # i.e. there are nil values
+                return generic(element)
+
+            if container == 'numpy':
+                return numpy.array(texts, dtype=_numpy_dtypes[typecode])
+
+            retval = map(from_string, texts)
+            if container == 'array':
+                retval = array(typecode, retval)
+
+            return retval
+
+        return from_xml
+
+    @classmethod
+    def compile_serializer(cls):
+        retval = cls.__dict__.get('_compiled_members_etree', None)
+        if not (retval is None):
+            return retval
+
+        generic = ComplexModelBase.compile_serializer.im_func(cls)
+
+        ((member_name, serializer),) = cls._type_info.items()
+        bulk_format = _get_bulk_format(serializer)
+        if bulk_format is None:
+            return generic
+
+        # the values are formatted into a single document which is then parsed
+        # in one go, instead of creating the elements one by one.
+        to_string = bulk_format[0]
+        head = '<a xmlns:x="%s"><x:%s>' % (cls.get_namespace(), member_name)
+        sep = '</x:%s><x:%s>' % (member_name, member_name)
+        tail = '</x:%s></a>' % member_name
+
+        def write_members(inst, parent):
+            values = getattr(inst, member_name, None)
+
+            if isinstance(values, array) or (not (numpy is None) and
+                                             isinstance(values, numpy.ndarray)):
+                values = values.tolist()
+
+            elif not isinstance(values, (list, tuple)) or \
+                                                     not _are_numbers(values):
+                return generic(inst, parent)
+
+            if len(values) > 0:
+                parent.extend(etree.fromstring(
+                         head + sep.join(map(to_string, values)) + tail,
+                                                  get_parser(huge_tree=True)))
+
+        cls._compiled_members_etree = write_members
+
+        return write_members
+
     @classmethod
     @nillable_string
     def to_csv(cls, values):
@@ -552,11 +1004,37 @@ class Iterable(Array):
     @classmethod
     @nillable_element
     def from_xml(cls, element):
+        compiled = cls.__dict__.get('_compiled_from_xml', None)
+        if not (compiled is None):
+            return compiled(element)
+
+        return cls.__from_xml(element)
+
+    @classmethod
+    def __from_xml(cls, element):
         (serializer,) = cls._type_info.values()
 
         for child in element.getchildren():
             yield serializer.from_xml(child)
 
+    @classmethod
+    def compile_deserializer(cls):
+        retval = cls.__dict__.get('_compiled_from_xml', None)
+        if not (retval is None):
+            return retval
+
+        (serializer,) = cls._type_info.values()
+        parse = _member_parser(serializer)
+
+        def from_xml(element):
+            for c in element:
+                if not (c.tag is etree.Comment or c.tag is etree.PI):
+                    yield parse(c)
+
+        cls._compiled_from_xml = from_xml
+
+        return from_xml
+
 class ClassAlias(ComplexModel):
     """New type_name, same type_info.
     """
@@ -25,9 +25,25 @@ from rpclib.model.exception import Fault
 class ValidationError(Fault):
     pass
 
+def _get_length_and_charset(http_env):
+    try:
+        length = int(http_env.get("CONTENT_LENGTH"))
+    except ValueError:
+        length = 0
+
+    # fyi, here's what the parse_header function returns:
+    # >>> import cgi; cgi.parse_header("text/xml; charset=utf-8")
+    # ('text/xml', {'charset': 'utf-8'})
+    content_type = cgi.parse_header(http_env.get("CONTENT_TYPE"))
+    charset = content_type[1].get('charset',None)
+
+    return length, charset
+
 class ProtocolBase(object):
     allowed_http_verbs = ['GET','POST']
     mime_type = 'application/octet-stream'
+    # the other mime types of the requests this protocol can parse.
+    in_mime_types = ()
 
     def __init__(self, parent):
         self.parent = parent
@@ -64,21 +80,30 @@ class ProtocolBase(object):
         """Reconstruct http payload using information in the http header"""
 
         input = http_env.get('wsgi.input')
-        try:
-            length = int(http_env.get("CONTENT_LENGTH"))
-        except ValueError:
-            length = 0
-
-        # fyi, here's what the parse_header function returns:
-        # >>> import cgi; cgi.parse_header("text/xml; charset=utf-8")
-        # ('text/xml', {'charset': 'utf-8'})
-        content_type = cgi.parse_header(http_env.get("CONTENT_TYPE"))
-        charset = content_type[1].get('charset',None)
-        if charset is None:
-            charset = 'ascii'
+        length, charset = _get_length_and_charset(http_env)
 
         return input.read(length), charset
 
+    def reconstruct_wsgi_request_chunks(self, http_env, chunk_size=65536):
+        """Like reconstruct_wsgi_request, but returns the http payload as a
+        generator of strings of at most chunk_size bytes that are read from the
+        wsgi input as the generator is consumed.
+        """
+
+        input = http_env.get('wsgi.input')
+        length, charset = _get_length_and_charset(http_env)
+
+        def read_chunks(length):
+            while length > 0:
+                chunk = input.read(min(chunk_size, length))
+                if not chunk:
+                    break
+
+                length -= len(chunk)
+                yield chunk
+
+        return read_chunks(length), charset
+
     def validate(self, payload):
         """Method to be overriden to perform any sort of custom input
         validation.
@@ -17,17 +17,153 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
+"""Protocols that stream csv documents in and out of methods.
+
+OutCsv streams the return values of methods as csv documents. The method
+must return exactly one value: an Array or an Iterable of
+instances of a class, which become the rows of the document, or a single such
+instance. The members of the class become the columns, sorted by name. The
+members of nested ComplexModel members are flattened into their own columns
+with dotted names, e.g. 'address.city'. Members with more than one value (e.g.
+Arrays) can't be represented in a cell, so they're skipped.
+
+InCsv reads csv documents uploaded to methods that take an Iterable argument,
+as lazily as the method consumes them. The method is picked from the last
+segment of the url, as with HttpRpc. The rows of the document become the
+instances of the class of the Iterable, their columns are mapped to its
+members by the header row (dotted names are mapped to the members of nested
+ComplexModel members) and empty cells become None. The other arguments of the
+method are read from the query string.
+"""
+
+from __future__ import absolute_import
+
 import logging
 logger = logging.getLogger(__name__)
 
+import csv
+import urlparse
+
+from cStringIO import StringIO
+from operator import attrgetter
+
+from rpclib.model.complex import Array
+from rpclib.model.complex import ComplexModelBase
+from rpclib.model.complex import Iterable
+from rpclib.model.primitive import Decimal
+from rpclib.model.primitive import String
+from rpclib.model.primitive import string_encoding
 from rpclib.protocol import ProtocolBase
+from rpclib.protocol import ValidationError
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode(string_encoding)
+
+    return value
+
+def _get_converter(cls):
+    '''Returns a callable that converts the values of the given class to what
+    the csv writer should write, or None when the csv writer can write them
+    as they are.'''
+
+    orig = getattr(cls, '_is_clone_of', cls)
+
+    if issubclass(orig, String):
+        return _encode
+
+    # includes Integer
+    if issubclass(orig, Decimal):
+        return None
+
+    to_string = cls.to_string
+    return lambda value: _encode(to_string(value))
+
+def _is_many(cls):
+    max_occurs = cls.Attributes.max_occurs
+    return (max_occurs == 'unbounded' or max_occurs > 1 or
+                issubclass(getattr(cls, '_is_clone_of', cls), Array))
+
+def _get_members(cls):
+    extends = getattr(cls, '__extends__', None)
+    if extends is None:
+        return list(cls._type_info.items())
+
+    return _get_members(extends) + list(cls._type_info.items())
+
+def _get_nested_getter(get_parent, get_child):
+    def get(value):
+        parent = get_parent(value)
+        if parent is None:
+            return None
+        return get_child(parent)
+
+    return get
+
+def _get_converting_getter(get, convert):
+    def get_and_convert(value):
+        v = get(value)
+        if v is None:
+            return None
+        return convert(v)
+
+    return get_and_convert
+
+def get_columns(cls, prefix=''):
+    '''Returns the (column name, getter) pairs of the given class, sorted by
+    column name. The getters take an instance of the class and return the
+    value of their cell.'''
+
+    if not issubclass(getattr(cls, '_is_clone_of', cls), ComplexModelBase):
+        return [(prefix or cls.get_type_name(), _get_converter(cls) or
+                                                          (lambda value: value))]
+
+    retval = []
+    for k, v in _get_members(cls):
+        if _is_many(v):
+            continue
+
+        get = attrgetter(k)
+        if issubclass(getattr(v, '_is_clone_of', v), ComplexModelBase):
+            for name, get_child in get_columns(v, '%s%s.' % (prefix, k)):
+                retval.append((name, _get_nested_getter(get, get_child)))
+
+        else:
+            convert = _get_converter(v)
+            if not (convert is None):
+                get = _get_converting_getter(get, convert)
+
+            retval.append(('%s%s' % (prefix, k), get))
+
+    retval.sort(key=lambda column: column[0])
+
+    return retval
 
 class OutCsv(ProtocolBase):
     mime_type = 'text/csv'
 
+    def __init__(self, parent):
+        ProtocolBase.__init__(self, parent)
+
+        # the number of rows passed to the csv writer at once.
+        self.batch_size = 1000
+        # the minimum size of the chunks of the document.
+        self.chunk_size = 65536
+
+        self.__columns = {}
+
     def create_in_document(self, ctx):
         raise Exception("not supported")
 
+    def get_columns(self, cls):
+        '''Returns the cached result of get_columns(cls).'''
+
+        columns = self.__columns.get(cls)
+        if columns is None:
+            self.__columns[cls] = columns = get_columns(cls)
+
+        return columns
+
     def serialize(self, ctx):
         result_message_class = ctx.descriptor.out_message
 
@@ -41,4 +177,237 @@ class OutCsv(ProtocolBase):
         # assign raw result to its wrapper, result_message
         out_type, = result_message_class._type_info.itervalues()
 
-        ctx.out_string = out_type.to_csv(ctx.out_object)
+        if issubclass(getattr(out_type, '_is_clone_of', out_type), Array):
+            (row_class,) = out_type._type_info.values()
+            rows = ctx.out_object
+
+        else:
+            row_class = out_type
+            rows = [ctx.out_object]
+
+        ctx.out_string = self.__iter_csv(row_class, rows)
+
+        self.event_manager.fire_event('serialize', ctx)
+
+    def __iter_csv(self, cls, rows):
+        columns = self.get_columns(cls)
+        getters = [getter for name, getter in columns]
+
+        is_complex = issubclass(getattr(cls, '_is_clone_of', cls),
+                                                              ComplexModelBase)
+        batch_size = self.batch_size
+        chunk_size = self.chunk_size
+
+        out_string = StringIO()
+        writer = csv.writer(out_string, dialect=csv.excel)
+        writer.writerow([name for name, getter in columns])
+
+        batch = []
+        for row in rows:
+            if row is None:
+                batch.append(())
+                continue
+
+            if is_complex and not isinstance(row, ComplexModelBase):
+                row = cls.get_serialization_instance(row)
+
+            batch.append([get(row) for get in getters])
+
+            if len(batch) >= batch_size:
+                writer.writerows(batch)
+                del batch[:]
+
+                if out_string.tell() >= chunk_size:
+                    yield out_string.getvalue()
+                    out_string.seek(0)
+                    out_string.truncate()
+
+        writer.writerows(batch)
+
+        yield out_string.getvalue()
+
+def _get_parser(cls):
+    orig = getattr(cls, '_is_clone_of', cls)
+
+    # strings are kept as they are read, as byte strings.
+    if issubclass(orig, String):
+        return None
+
+    return cls.from_string
+
+def _get_member_setter(k, parse):
+    if parse is None:
+        return lambda inst, cell: setattr(inst, k, cell)
+
+    return lambda inst, cell: setattr(inst, k, parse(cell))
+
+def _get_nested_setter(k, cls, set_child):
+    def set_value(inst, cell):
+        child = getattr(inst, k, None)
+        if child is None:
+            child = cls.get_deserialization_instance()
+            setattr(inst, k, child)
+
+        set_child(child, cell)
+
+    return set_value
+
+def get_setters(cls, prefix=''):
+    """Returns a dict of the column names of the given class to callables
+    that take an instance of the class and the text of a cell, and set the
+    parsed value of the cell to the matching member of the instance."""
+
+    retval = {}
+    for k, v in _get_members(cls):
+        if _is_many(v):
+            continue
+
+        if issubclass(getattr(v, '_is_clone_of', v), ComplexModelBase):
+            for name, set_child in get_setters(v, '%s%s.' % (prefix, k)).items():
+                retval[name] = _get_nested_setter(k, v, set_child)
+
+        else:
+            retval['%s%s' % (prefix, k)] = _get_member_setter(k,
+                                                                _get_parser(v))
+
+    return retval
+
+def _iter_lines(chunks):
+    """Splits the given iterable of strings into lines, with their line
+    endings."""
+
+    rest = ''
+    for chunk in chunks:
+        lines = (rest + chunk).splitlines(True)
+        rest = ''
+        if len(lines) > 0 and not (lines[-1][-1] in '\r\n'):
+            rest = lines.pop()
+
+        for line in lines:
+            yield line
+
+    if rest:
+        yield rest
+
+class InCsv(ProtocolBase):
+    """Reads csv documents into the Iterable argument of the called method.
+    See the module docstring for details."""
+
+    allowed_http_verbs = ['POST', 'PUT']
+    mime_type = 'text/csv'
+
+    def __init__(self, parent):
+        ProtocolBase.__init__(self, parent)
+
+        self.__setters = {}
+
+    def get_setters(self, cls):
+        """Returns the cached result of get_setters(cls)."""
+
+        setters = self.__setters.get(cls)
+        if setters is None:
+            self.__setters[cls] = setters = get_setters(cls)
+
+        return setters
+
+    def reconstruct_wsgi_request(self, http_env):
+        # the document is read from the wsgi input as it's parsed.
+        return self.reconstruct_wsgi_request_chunks(http_env)
+
+    def create_in_document(self, ctx, in_string_encoding=None):
+        if isinstance(ctx.in_string, basestring):
+            ctx.in_string = [ctx.in_string]
+
+        ctx.in_document = csv.reader(_iter_lines(ctx.in_string),
+                                                             dialect=csv.excel)
+
+    def decompose_incoming_envelope(self, ctx):
+        assert hasattr(ctx, 'http_req_env'), ("This protocol only works with "
+                                              "the wsgi api.")
+
+        name = ctx.http_req_env['PATH_INFO'].split('/')[-1]
+
+        try:
+            route = self.parent.get_route(name)
+
+        except KeyError:
+            raise ValidationError('Client', 'Method not found: %r' % name)
+
+        ctx.method_name = '{%s}%s' % (self.parent.interface.get_tns(),
+                                                         route.descriptor.name)
+        ctx.service_class = route.service_class
+        ctx.descriptor = route.descriptor
+        ctx.function = route.function
+
+        ctx.in_header_doc = None
+        ctx.in_body_doc = urlparse.parse_qs(
+                                   ctx.http_req_env.get('QUERY_STRING', ''))
+
+    def deserialize(self, ctx):
+        body_class = ctx.descriptor.in_message
+
+        rows_key = None
+        ctx.in_object = inst = body_class.get_deserialization_instance()
+        for k, v in body_class._type_info.items():
+            if issubclass(getattr(v, '_is_clone_of', v), Iterable):
+                if not (rows_key is None):
+                    raise ValidationError('Client.CsvError', "%r takes more "
+                                "than one Iterable argument." % ctx.method_name)
+                rows_key = k
+                (row_class,) = v._type_info.values()
+
+            elif k in ctx.in_body_doc:
+                try:
+                    setattr(inst, k, v.from_string(ctx.in_body_doc[k][0]))
+
+                except Exception, e:
+                    raise ValidationError('Client.ValidationError',
+                                                     '%s: %s' % (k, e))
+
+        if rows_key is None:
+            raise ValidationError('Client.CsvError', "%r takes no Iterable "
+                                              "argument." % ctx.method_name)
+
+        try:
+            header = ctx.in_document.next()
+
+        except StopIteration:
+            header = []
+
+        except csv.Error, e:
+            raise ValidationError('Client.CsvError', str(e))
+
+        setters = self.get_setters(row_class)
+
+        unknown = [name for name in header if not (name in setters)]
+        if len(unknown) > 0:
+            raise ValidationError('Client.CsvError', "Unknown columns: %s" %
+                                                             ', '.join(unknown))
+
+        setattr(inst, rows_key, self.__iter_rows(row_class,
+                            [setters[name] for name in header], ctx.in_document))
+
+        self.event_manager.fire_event('deserialize', ctx)
+
+    def __iter_rows(self, cls, setters, reader):
+        try:
+            for record in reader:
+                # blank lines
+                if len(record) == 0:
+                    continue
+
+                inst = cls.get_deserialization_instance()
+                for set_value, cell in zip(setters, record):
+                    if cell:
+                        set_value(inst, cell)
+
+                yield inst
+
+        except csv.Error, e:
+            raise ValidationError('Client.CsvError', 'line %d: %s' %
+                                                          (reader.line_num, e))
+
+        # the from_string methods don't all raise ValueError.
+        except Exception, e:
+            raise ValidationError('Client.ValidationError', 'line %d: %s' %
+                                                          (reader.line_num, e))
@@ -33,11 +33,11 @@ class HttpRpc(ProtocolBase):
                                    ctx.http_req_env['PATH_INFO'].split('/')[-1])
         logger.debug("\033[92mMethod name: %r\033[0m" % ctx.method_name)
 
-        ctx.service_class = self.parent.get_service_class(ctx.method_name)
+        route = self.parent.get_route(ctx.method_name)
+        ctx.service_class = route.service_class
+        ctx.descriptor = route.descriptor
+        ctx.function = route.function
 
-        if ctx.descriptor is None:
-            ctx.descriptor = ctx.service_class.get_method(ctx.method_name)
-        
         ctx.in_header_doc = None
         ctx.in_body_doc = urlparse.parse_qs(ctx.http_req_env['QUERY_STRING'])
 
@@ -0,0 +1,427 @@
+
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""A protocol that maps rpclib models to and from JSON documents, without
+building an lxml document in between.
+
+The requests are JSON objects with the name of the method as their only key
+and an object with the arguments of the method as its value:
+
+    {"get_rate": {"currency": "EUR", "amount": 100}}
+
+The responses have the same structure as the response messages of the soap
+protocol:
+
+    {"get_rateResponse": {"get_rateResult": 1.09}}
+
+Faults are sent as {"Fault": {"faultcode": ..., "faultstring": ..., ...}}.
+
+ComplexModel instances are mapped to objects with their non-null members,
+Arrays and Iterables to arrays, Decimals to strings (so that their precision is
+kept), dates, times and durations to their ISO 8601 representations, and
+binary data to base64 strings. Soap headers are not supported.
+"""
+
+from __future__ import absolute_import
+
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import base64
+import decimal
+
+from lxml import etree
+
+from rpclib.model.binary import Attachment
+from rpclib.model.complex import Array
+from rpclib.model.complex import ComplexModelBase
+from rpclib.model.enum import EnumBase
+from rpclib.model.exception import Fault
+from rpclib.model.primitive import AnyAsDict
+from rpclib.model.primitive import Boolean
+from rpclib.model.primitive import Date
+from rpclib.model.primitive import DateTime
+from rpclib.model.primitive import Decimal
+from rpclib.model.primitive import Double
+from rpclib.model.primitive import Duration
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.model.primitive import string_encoding
+from rpclib.protocol import ProtocolBase
+from rpclib.protocol import ValidationError
+from rpclib.util.duration import XmlDuration
+
+def _identity(value):
+    return value
+
+def _decode_boolean(value):
+    if isinstance(value, bool):
+        return value
+
+    if isinstance(value, basestring) and value.lower() in ('true', 'false',
+                                                                    '1', '0'):
+        return Boolean.from_string(value)
+
+    raise ValueError("%r is not a boolean" % (value,))
+
+def _decode_integer(value):
+    # bool is a subclass of int
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return value
+
+    raise ValueError("%r is not an integer" % (value,))
+
+def _decode_double(value):
+    if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+        return float(value)
+
+    raise ValueError("%r is not a number" % (value,))
+
+def _decode_string(value):
+    if isinstance(value, basestring):
+        return value
+
+    raise ValueError("%r is not a string" % (value,))
+
+def _decode_decimal(value):
+    if isinstance(value, float):
+        value = repr(value)
+
+    elif isinstance(value, bool) or not isinstance(value,
+                                                    (basestring, int, long)):
+        raise ValueError("%r is not a decimal" % (value,))
+
+    try:
+        return decimal.Decimal(value)
+    except decimal.InvalidOperation:
+        raise ValueError("%r is not a decimal" % (value,))
+
+def _encode_attachment(value):
+    return base64.b64encode(Attachment.to_string(value))
+
+def _decode_attachment(value):
+    return Attachment(data=base64.b64decode(value))
+
+# the codecs of the types whose values are (almost) json values already. the
+# classes are looked up in this order, so subclasses come before their parents.
+_simple_codecs = (
+    (Boolean, _identity, _decode_boolean),
+    (Integer, _identity, _decode_integer),
+    (Decimal, str, _decode_decimal),
+    (Double, _identity, _decode_double),
+    (String, _identity, _decode_string),
+    (AnyAsDict, _identity, _identity),
+    (DateTime, lambda v: v.isoformat('T'), DateTime.from_string),
+    (Date, lambda v: v.isoformat(), Date.from_string),
+    (Duration, lambda v: str(XmlDuration.parse(v)), Duration.from_string),
+    (Attachment, _encode_attachment, _decode_attachment),
+)
+
+def _get_members(cls):
+    '''Returns the (name, class) pairs of the members of the given class and
+    of its parents, in order.'''
+
+    extends = getattr(cls, '__extends__', None)
+    if extends is None:
+        return list(cls._type_info.items())
+
+    return _get_members(extends) + list(cls._type_info.items())
+
+def _compile_list_codec(codec):
+    def convert_list(value):
+        return [(None if v is None else codec(v)) for v in value]
+
+    return convert_list
+
+def _compile_list_decoder(decoder):
+    convert_list = _compile_list_codec(decoder)
+
+    def decode_list(value):
+        if not isinstance(value, list):
+            raise ValueError("%r is not an array" % (value,))
+
+        return convert_list(value)
+
+    return decode_list
+
+def _is_many(cls):
+    max_occurs = cls.Attributes.max_occurs
+    return max_occurs == 'unbounded' or max_occurs > 1
+
+class JsonObject(ProtocolBase):
+    '''Maps rpclib models to and from JSON documents.
+
+    The encoders and decoders of the messages of the published methods are
+    compiled once, when the protocol is instantiated. Those of other classes
+    are compiled when they're first needed.
+    '''
+
+    mime_type = 'application/json'
+
+    # the (class, encoder, decoder) triples of the simple types.
+    simple_codecs = _simple_codecs
+
+    def __init__(self, parent):
+        ProtocolBase.__init__(self, parent)
+
+        self.__encoders = {}
+        self.__decoders = {}
+
+        for s in parent.interface.services:
+            for method in s.public_methods:
+                for cls in (method.in_message, method.out_message):
+                    self.get_encoder(cls)
+                    self.get_decoder(cls)
+
+    def get_encoder(self, cls):
+        '''Returns a callable that converts non-null instances of the given
+        class to json values.'''
+
+        encoder = self.__encoders.get(cls)
+        if encoder is None:
+            self.__encoders[cls] = encoder = self.__compile_encoder(cls)
+
+        return encoder
+
+    def get_decoder(self, cls):
+        '''Returns a callable that converts non-null json values to instances
+        of the given class.'''
+
+        decoder = self.__decoders.get(cls)
+        if decoder is None:
+            self.__decoders[cls] = decoder = self.__compile_decoder(cls)
+
+        return decoder
+
+    def __compile_encoder(self, cls):
+        orig = getattr(cls, '_is_clone_of', cls)
+
+        if issubclass(orig, Array):
+            (item_class,) = cls._type_info.values()
+            item_encoder = self.get_encoder(item_class)
+            if item_encoder is _identity:
+                return list
+
+            return _compile_list_codec(item_encoder)
+
+        if issubclass(orig, ComplexModelBase):
+            return self._compile_complex_encoder(cls)
+
+        if issubclass(orig, EnumBase):
+            return str
+
+        for base, encoder, decoder in self.simple_codecs:
+            if issubclass(orig, base):
+                return encoder
+
+        return cls.to_string
+
+    def __compile_decoder(self, cls):
+        orig = getattr(cls, '_is_clone_of', cls)
+
+        if issubclass(orig, Array):
+            (item_class,) = cls._type_info.values()
+            return _compile_list_decoder(self.get_decoder(item_class))
+
+        if issubclass(orig, ComplexModelBase):
+            return self._compile_complex_decoder(cls)
+
+        if issubclass(orig, EnumBase):
+            return lambda value: getattr(cls, value)
+
+        for base, encoder, decoder in self.simple_codecs:
+            if issubclass(orig, base):
+                return decoder
+
+        return cls.from_string
+
+    def _get_member_codecs(self, cls, get_codec,
+                                           compile_list=_compile_list_codec):
+        """Returns the (name, codec) pairs of the members of the given class,
+        where the codecs are returned by the given get_encoder or get_decoder
+        method. The codecs of the members with max_occurs > 1 are wrapped by
+        the given compile_list function."""
+
+        retval = []
+        for k, v in _get_members(cls):
+            codec = get_codec(v)
+            if _is_many(v) and not issubclass(getattr(v, '_is_clone_of', v),
+                                                                        Array):
+                codec = compile_list(codec)
+
+            retval.append((k, codec))
+
+        return retval
+
+    def _compile_complex_encoder(self, cls):
+        members = self._get_member_codecs(cls, self.get_encoder)
+
+        def encode_complex(value):
+            if not isinstance(value, ComplexModelBase):
+                value = cls.get_serialization_instance(value)
+
+            retval = {}
+            for k, encoder in members:
+                v = getattr(value, k, None)
+                if not (v is None):
+                    retval[k] = encoder(v)
+
+            return retval
+
+        return encode_complex
+
+    def _compile_complex_decoder(self, cls):
+        members = dict(self._get_member_codecs(cls, self.get_decoder,
+                                                         _compile_list_decoder))
+
+        def decode_complex(value):
+            if not isinstance(value, dict):
+                raise ValueError("%r is not an object" % (value,))
+
+            inst = cls.get_deserialization_instance()
+
+            for k, v in value.iteritems():
+                decoder = members.get(k)
+                if not (decoder is None or v is None):
+                    setattr(inst, k, decoder(v))
+
+            return inst
+
+        return decode_complex
+
+    def create_in_document(self, ctx, in_string_encoding=None):
+        if isinstance(ctx.in_string, basestring):
+            in_string = ctx.in_string
+        else:
+            in_string = ''.join(ctx.in_string)
+
+        try:
+            ctx.in_document = json.loads(in_string,
+                                    encoding=in_string_encoding or string_encoding)
+
+        except ValueError, e:
+            raise ValidationError('Client.JsonError', str(e))
+
+    def decompose_incoming_envelope(self, ctx):
+        doc = ctx.in_document
+        if not (isinstance(doc, dict) and len(doc) == 1):
+            raise ValidationError('Client.JsonError', "The request must be an "
+                                          "object with exactly one member.")
+
+        ((name, body),) = doc.items()
+
+        ctx.in_header_doc = None
+        ctx.in_body_doc = body
+
+        if name == 'Fault':
+            return
+
+        try:
+            route = self.parent.get_route(name)
+
+        except KeyError:
+            raise ValidationError('Client', 'Method not found: %r' % name)
+
+        ctx.method_name = '{%s}%s' % (self.parent.interface.get_tns(),
+                                                         route.descriptor.name)
+        ctx.service_class = route.service_class
+        ctx.descriptor = route.descriptor
+        ctx.function = route.function
+
+    def deserialize(self, ctx):
+        if ctx.descriptor is None:
+            ctx.in_object = None
+            ctx.in_error = self.__decode_fault(ctx.in_body_doc)
+
+        else:
+            body_class = ctx.descriptor.in_message
+
+            if ctx.in_body_doc is None or len(ctx.in_body_doc) == 0:
+                ctx.in_object = [None] * len(body_class._type_info)
+
+            elif not isinstance(ctx.in_body_doc, dict):
+                raise ValidationError('Client.JsonError',
+                                       "The arguments must be a json object.")
+
+            else:
+                try:
+                    ctx.in_object = self.get_decoder(body_class)(
+                                                               ctx.in_body_doc)
+
+                except (ValueError, TypeError, AttributeError), e:
+                    raise ValidationError('Client.ValidationError', str(e))
+
+        self.event_manager.fire_event('deserialize', ctx)
+
+    def __decode_fault(self, body):
+        if not isinstance(body, dict):
+            raise ValidationError('Client.JsonError', "Invalid fault.")
+
+        return Fault(faultcode=body.get('faultcode') or 'Server',
+                     faultstring=body.get('faultstring') or '',
+                     faultactor=body.get('faultactor') or '',
+                     detail=body.get('detail'))
+
+    def serialize(self, ctx):
+        if not (ctx.out_error is None):
+            ctx.out_document = {'Fault': self.__encode_fault(ctx.out_error)}
+
+        else:
+            result_message_class = ctx.descriptor.out_message
+            result_message = result_message_class()
+
+            # assign raw result to its wrapper, result_message
+            out_type_info = result_message_class._type_info
+
+            if len(out_type_info) == 1:
+                attr_name = out_type_info.keys()[0]
+                setattr(result_message, attr_name, ctx.out_object)
+
+            else:
+                for i in range(len(out_type_info)):
+                    attr_name = out_type_info.keys()[i]
+                    setattr(result_message, attr_name, ctx.out_object[i])
+
+            ctx.out_document = {
+                result_message_class.get_type_name():
+                        self.get_encoder(result_message_class)(result_message)
+            }
+
+        self.event_manager.fire_event('serialize', ctx)
+
+    def __encode_fault(self, fault):
+        detail = fault.detail
+        if etree.iselement(detail):
+            detail = etree.tostring(detail)
+
+        retval = {
+            'faultcode': fault.faultcode,
+            'faultstring': fault.faultstring,
+        }
+
+        if fault.faultactor:
+            retval['faultactor'] = fault.faultactor
+        if not (detail is None):
+            retval['detail'] = detail
+
+        return retval
+
+    def create_out_string(self, ctx, out_string_encoding=None):
+        ctx.out_string = [json.dumps(ctx.out_document, separators=(',', ':'))]
@@ -0,0 +1,254 @@
+
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""A compact binary protocol based on MessagePack, for service-to-service
+calls, e.g. over the ZeroMQ transport.
+
+The methods are identified by the ids of their routes in the interface, which
+number them in the order of their qualified names. Both sides must publish the
+same services.
+Every message is a MessagePack array:
+
+    [0, method_id, [arg1, arg2, ...]]                       # request
+    [1, method_id, [result1, ...]]                          # response
+    [2, [faultcode, faultstring, faultactor, detail]]       # fault
+
+The arguments and the results are in the order of the members of the
+in_message and out_message classes of the method. ComplexModel instances are
+arrays of their members as well, binary data is sent as is, strings are always
+sent as text, and the other types are mapped the way the JsonObject protocol
+maps them.
+"""
+
+from __future__ import absolute_import
+
+import logging
+logger = logging.getLogger(__name__)
+
+import msgpack
+
+from lxml import etree
+
+from rpclib.model.binary import Attachment
+from rpclib.model.complex import ComplexModelBase
+from rpclib.model.exception import Fault
+from rpclib.model.primitive import String
+from rpclib.model.primitive import string_encoding
+from rpclib.protocol import ValidationError
+from rpclib.protocol.json import JsonObject
+from rpclib.protocol.json import _compile_list_decoder
+from rpclib.protocol.json import _decode_string
+from rpclib.protocol.json import _simple_codecs
+
+REQUEST = 0
+RESPONSE = 1
+FAULT = 2
+
+def _to_unicode(value):
+    # msgpack packs str as bin, so byte strings that are meant to be text
+    # are decoded before packing.
+    if isinstance(value, str):
+        return value.decode(string_encoding)
+
+    return value
+
+def _encode_string(value):
+    if not isinstance(value, basestring):
+        value = str(value)
+
+    return _to_unicode(value)
+
+class MessagePackObject(JsonObject):
+    '''Maps rpclib models to and from MessagePack documents.'''
+
+    mime_type = 'application/x-msgpack'
+
+    simple_codecs = (
+        (Attachment, Attachment.to_string, Attachment),
+        (String, _encode_string, _decode_string),
+    ) + _simple_codecs
+
+    def __init__(self, parent):
+        JsonObject.__init__(self, parent)
+
+        tns = parent.interface.get_tns()
+
+        self.__routes = parent.interface.method_routes
+        self.method_ids = dict([('{%s}%s' % (tns, r.descriptor.name), r.id)
+                                                        for r in self.__routes])
+
+    def _compile_complex_encoder(self, cls):
+        members = self._get_member_codecs(cls, self.get_encoder)
+
+        def encode_complex(value):
+            if not isinstance(value, ComplexModelBase):
+                value = cls.get_serialization_instance(value)
+
+            retval = []
+            for k, encoder in members:
+                v = getattr(value, k, None)
+                if v is None:
+                    retval.append(None)
+                else:
+                    retval.append(encoder(v))
+
+            return retval
+
+        return encode_complex
+
+    def _compile_complex_decoder(self, cls):
+        members = self._get_member_codecs(cls, self.get_decoder,
+                                                         _compile_list_decoder)
+
+        def decode_complex(value):
+            if not isinstance(value, list):
+                raise ValueError("%r is not an array" % (value,))
+
+            inst = cls.get_deserialization_instance()
+
+            for (k, decoder), v in zip(members, value):
+                if not (v is None):
+                    setattr(inst, k, decoder(v))
+
+            return inst
+
+        return decode_complex
+
+    def create_in_document(self, ctx, in_string_encoding=None):
+        if isinstance(ctx.in_string, str):
+            in_string = ctx.in_string
+        else:
+            in_string = ''.join(ctx.in_string)
+
+        try:
+            ctx.in_document = msgpack.unpackb(in_string, raw=False)
+
+        except Exception, e:
+            raise ValidationError('Client.MessagePackError', str(e))
+
+    def decompose_incoming_envelope(self, ctx):
+        doc = ctx.in_document
+        if not (isinstance(doc, list) and len(doc) in (2, 3)):
+            raise ValidationError('Client.MessagePackError',
+                                                     "Invalid message.")
+
+        ctx.in_header_doc = None
+        ctx.in_body_doc = doc[-1]
+
+        if doc[0] == FAULT:
+            return
+
+        if not (doc[0] in (REQUEST, RESPONSE) and len(doc) == 3):
+            raise ValidationError('Client.MessagePackError',
+                                                 "Invalid message type.")
+
+        method_id = doc[1]
+        if not (isinstance(method_id, (int, long)) and
+                                        0 <= method_id < len(self.__routes)):
+            raise ValidationError('Client', 'Method not found: %r' % method_id)
+
+        route = self.__routes[method_id]
+
+        ctx.method_name = '{%s}%s' % (self.parent.interface.get_tns(),
+                                                         route.descriptor.name)
+        ctx.service_class = route.service_class
+        ctx.descriptor = route.descriptor
+        ctx.function = route.function
+
+    def deserialize(self, ctx):
+        doc = ctx.in_document
+
+        if doc[0] == FAULT:
+            ctx.in_object = None
+            ctx.in_error = self.__decode_fault(ctx.in_body_doc)
+
+        else:
+            if doc[0] == REQUEST:
+                body_class = ctx.descriptor.in_message
+            else:
+                body_class = ctx.descriptor.out_message
+
+            if not isinstance(ctx.in_body_doc, list):
+                raise ValidationError('Client.MessagePackError',
+                                           "The arguments must be an array.")
+
+            try:
+                ctx.in_object = self.get_decoder(body_class)(ctx.in_body_doc)
+
+            except (ValueError, TypeError, AttributeError), e:
+                raise ValidationError('Client.ValidationError', str(e))
+
+        self.event_manager.fire_event('deserialize', ctx)
+
+    def __decode_fault(self, body):
+        if not (isinstance(body, list) and len(body) == 4):
+            raise ValidationError('Client.MessagePackError', "Invalid fault.")
+
+        code, string, actor, detail = body
+
+        return Fault(faultcode=code or 'Server', faultstring=string or '',
+                                   faultactor=actor or '', detail=detail)
+
+    def serialize(self, ctx):
+        """Serializes ctx.out_error as a fault, ctx.out_object as a request
+        when it's an instance of the in_message of the method (as it is in
+        the clients), or as the response of the method otherwise."""
+
+        if not (ctx.out_error is None):
+            detail = ctx.out_error.detail
+            if etree.iselement(detail):
+                detail = etree.tostring(detail, encoding=unicode)
+
+            ctx.out_document = [FAULT, [_to_unicode(ctx.out_error.faultcode),
+                                    _to_unicode(ctx.out_error.faultstring),
+                                    _to_unicode(ctx.out_error.faultactor),
+                                    _to_unicode(detail)]]
+
+        else:
+            method_id = self.method_ids['{%s}%s' % (
+                      self.parent.interface.get_tns(), ctx.descriptor.name)]
+
+            in_message_class = ctx.descriptor.in_message
+            if isinstance(ctx.out_object, in_message_class):
+                ctx.out_document = [REQUEST, method_id,
+                      self.get_encoder(in_message_class)(ctx.out_object)]
+
+            else:
+                result_message_class = ctx.descriptor.out_message
+                result_message = result_message_class()
+
+                # assign raw result to its wrapper, result_message
+                out_type_info = result_message_class._type_info
+
+                if len(out_type_info) == 1:
+                    attr_name = out_type_info.keys()[0]
+                    setattr(result_message, attr_name, ctx.out_object)
+
+                else:
+                    for i in range(len(out_type_info)):
+                        attr_name = out_type_info.keys()[i]
+                        setattr(result_message, attr_name, ctx.out_object[i])
+
+                ctx.out_document = [RESPONSE, method_id,
+                      self.get_encoder(result_message_class)(result_message)]
+
+        self.event_manager.fire_event('serialize', ctx)
+
+    def create_out_string(self, ctx, out_string_encoding=None):
+        ctx.out_string = [msgpack.packb(ctx.out_document, use_bin_type=True)]
@@ -21,19 +21,51 @@ import logging
 logger = logging.getLogger(__name__)
 
 import cgi
-from rpclib.protocol.soap.mime import collapse_swa
+from rpclib.protocol.soap.mime import MultipartStream
+from rpclib.protocol.soap.mime import parse_multipart
+from rpclib.protocol.soap.mime import get_mtom_content_type
+from rpclib.protocol.soap.mime import iter_mtom_message
 
+import binascii
 import traceback
+from uuid import uuid4
+from tempfile import SpooledTemporaryFile
 from lxml import etree
 
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
 from rpclib.protocol import ProtocolBase
+from rpclib.model.binary import ATTACHMENT_PI_TARGET
+from rpclib.model.binary import Attachment
+from rpclib.model.binary import Base64Decoder
+from rpclib.model.binary import XopInclude
+from rpclib.model.binary import iter_base64_file
+from rpclib.model.complex import Array
+from rpclib.model.complex import ComplexModelBase
+from rpclib.model.complex import Iterable
 from rpclib.model.exception import Fault
 from rpclib.model.primitive import string_encoding
+from rpclib.util.etreeconv import get_parser
 import rpclib.const.xml_ns as ns
 
 class ValidationError(Fault):
     pass
 
+_envelope_tag = '{%s}Envelope' % ns.soap_env
+_header_tag = '{%s}Header' % ns.soap_env
+_body_tag = '{%s}Body' % ns.soap_env
+_fault_tag = '{%s}Fault' % ns.soap_env
+_nil_attr = '{%s}nil' % ns.xsi
+_xop_include_tag = '{%s}Include' % ns.xop
+
+# the references that Attachment.from_xml deserializes to XopInclude instances.
+_find_xop_references = etree.XPath(
+                    './/@href[not(starts-with(., "#"))] | .//xop:Include',
+                    namespaces={'xop': ns.xop})
+
 def _from_soap(in_envelope_xml, xmlids=None):
     '''
     Parses the xml string into the header and payload
@@ -42,42 +74,116 @@ def _from_soap(in_envelope_xml, xmlids=None):
     if xmlids:
         resolve_hrefs(in_envelope_xml, xmlids)
 
-    if in_envelope_xml.tag != '{%s}Envelope' % ns.soap_env:
+    if in_envelope_xml.tag != _envelope_tag:
         raise Fault('Client.SoapError', 'No {%s}Envelope element was found!' %
                                                             ns.soap_env)
 
-    header_envelope = in_envelope_xml.xpath('e:Header',
-                                          namespaces={'e': ns.soap_env})
-    body_envelope = in_envelope_xml.xpath('e:Body',
-                                          namespaces={'e': ns.soap_env})
+    header_envelope = None
+    body_envelope = None
+    for child in in_envelope_xml:
+        if child.tag == _header_tag:
+            if header_envelope is None:
+                header_envelope = child
+
+        elif child.tag == _body_tag:
+            if body_envelope is None:
+                body_envelope = child
 
-    if len(header_envelope) == 0 and len(body_envelope) == 0:
+    if header_envelope is None and body_envelope is None:
         raise Fault('Client.SoapError', 'Soap envelope is empty!' %
                                                             ns.soap_env)
 
     header=None
-    if len(header_envelope) > 0 and len(header_envelope[0]) > 0:
-        header = header_envelope[0].getchildren()[0]
+    if not (header_envelope is None) and len(header_envelope) > 0:
+        header = header_envelope[0]
 
     body=None
-    if len(body_envelope) > 0 and len(body_envelope[0]) > 0:
-        body = body_envelope[0].getchildren()[0]
+    if not (body_envelope is None) and len(body_envelope) > 0:
+        body = body_envelope[0]
 
     return header, body
 
-def _parse_xml_string(xml_string, charset=None):
-    try:
-        if charset is None:
-            charset = string_encoding
+def _get_xmlids(root):
+    xmlids = {}
+    for e in root.xpath('//*[@id]'):
+        xmlids[e.get('id')] = e
 
-        root, xmlids = etree.XMLID(xml_string.decode(charset))
+    return xmlids
+
+def _parse_xml_string(xml_string, charset=None, target=None):
+    '''The charset is only forced onto the parser when it's given, e.g. by the
+    Content-Type header. Otherwise, lxml detects it from the document. The
+    document is built by the given parser target, if any.'''
+
+    if isinstance(xml_string, unicode):
+        # the encoding declaration of the document, if there's one, no longer
+        # matches the re-encoded string, so the charset is always forced.
+        xml_string = xml_string.encode(string_encoding)
+        charset = string_encoding
+
+    # otherwise, the encoding declaration in the document, if there's one, has
+    # precedence over the given charset.
+    elif xml_string.startswith('<?xml'):
+        charset = None
+
+    if target is None:
+        parser = get_parser(charset)
+    else:
+        parser = etree.XMLParser(encoding=charset, target=target)
+
+    try:
+        root = etree.fromstring(xml_string, parser)
+    except etree.XMLSyntaxError, e:
+        raise Fault('Client.SoapError', 'Error parsing xml: %s' % e)
 
-    except ValueError,e:
-        logger.debug('%s -- falling back to str decoding.' % (e))
-        root, xmlids = etree.XMLID(xml_string)
+    # the id dict is needed only to resolve hrefs, which are rare, so it's
+    # built only when the document looks like it may contain one.
+    xmlids = {}
+    if 'href' in xml_string:
+        xmlids = _get_xmlids(root)
 
     return root, xmlids
 
+def _iter_parse_events(parser, chunks):
+    '''Feeds the given iterable of strings to the given pull parser, yielding
+    the parse events as they become available.'''
+
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event in parser.read_events():
+                yield event
+
+        parser.close()
+        for event in parser.read_events():
+            yield event
+
+    except etree.XMLSyntaxError, e:
+        raise Fault('Client.SoapError', 'Error parsing xml: %s' % e)
+
+def _iter_stream_children(element, events):
+    '''Consumes the given parse events until the end of the given element,
+    yielding its children as they are parsed. Children are discarded once
+    they're processed, so the memory usage does not depend on the number of
+    children.'''
+
+    depth = 0
+    for event, child in events:
+        if event == 'start':
+            depth += 1
+
+        elif depth == 0: # i.e. the end of the element itself
+            break
+
+        else:
+            depth -= 1
+            if depth == 0:
+                yield child
+
+                child.clear()
+                while not (child.getprevious() is None):
+                    del element[0]
+
 # see http://www.w3.org/TR/2000/NOTE-SOAP-20000508/
 # section 5.2.1 for an example of how the id and href attributes are used.
 def resolve_hrefs(element, xmlids):
@@ -86,7 +192,7 @@ def resolve_hrefs(element, xmlids):
             continue # don't need to resolve this element
 
         elif e.get('href'):
-            resolved_element = xmlids[e.get('href').replace('#', '')]
+            resolved_element = xmlids.get(e.get('href').replace('#', ''))
             if resolved_element is None:
                 continue
             resolve_hrefs(resolved_element, xmlids)
@@ -105,6 +211,314 @@ def resolve_hrefs(element, xmlids):
 
     return element
 
+def _is_attachment(cls):
+    return issubclass(getattr(cls, '_is_clone_of', cls), Attachment)
+
+def _get_attachment(cls, value, attachments):
+    if not isinstance(value, XopInclude):
+        return value
+
+    f = attachments.get(value.content_id)
+    if f is None:
+        raise Fault('Client.MimeError', 'Attachment %r was not found' %
+                                                              value.content_id)
+
+    f.seek(0)
+    if cls.Attributes.stream:
+        return Attachment(file=f)
+    return Attachment(data=f.read())
+
+def _resolve_xop(cls, inst, attachments):
+    '''Replaces the references to the parts of a multipart request in the
+    given instance of the given class with the attachments they refer to.'''
+
+    for k, v in cls._type_info.items():
+        value = getattr(inst, k, None)
+        if value is None:
+            continue
+
+        base = getattr(v, '_is_clone_of', v)
+        if _is_attachment(v):
+            setattr(inst, k, _get_attachment(v, value, attachments))
+
+        elif issubclass(base, Iterable): # these are not consumed here.
+            continue
+
+        elif issubclass(base, Array):
+            (member,) = v._type_info.values()
+            if _is_attachment(member):
+                setattr(inst, k, [_get_attachment(member, a, attachments)
+                                                                for a in value])
+
+            elif issubclass(member, ComplexModelBase):
+                for item in value:
+                    if not (item is None):
+                        _resolve_xop(member, item, attachments)
+
+        elif issubclass(base, ComplexModelBase):
+            _resolve_xop(v, value, attachments)
+
+def _is_streamed_attachment(cls):
+    return _is_attachment(cls) and cls.Attributes.stream
+
+def _has_streamed_attachments(cls, seen):
+    '''Returns True when instances of the given class can contain streamed
+    Attachments outside Iterables. The given set holds the classes that are
+    already being looked at.'''
+
+    if cls is None or cls in seen:
+        return False
+    seen.add(cls)
+
+    base = getattr(cls, '_is_clone_of', cls)
+    if issubclass(base, Attachment):
+        return cls.Attributes.stream
+
+    if issubclass(base, Iterable):
+        return False
+
+    if issubclass(base, ComplexModelBase):
+        for v in ComplexModelBase.get_flat_type_info(cls).values():
+            if _has_streamed_attachments(v, seen):
+                return True
+
+    return False
+
+def _get_child_class(cls, tag):
+    '''Returns the class of the child element of an instance of the given
+    class with the given tag, or None when it's not known. The children of
+    Iterables are not looked at, as they're not resolved by _resolve_xop.'''
+
+    base = getattr(cls, '_is_clone_of', cls)
+    if issubclass(base, Iterable):
+        return None
+
+    if issubclass(base, Array):
+        (retval,) = cls._type_info.values()
+        return retval
+
+    if issubclass(base, ComplexModelBase):
+        name = tag.rsplit('}', 1)[-1]
+        while not (cls is None):
+            retval = cls._type_info.get(name)
+            if not (retval is None):
+                return retval
+            cls = getattr(cls, '__extends__', None)
+
+class _AttachmentTarget(object):
+    '''A parser target that builds the document like etree.TreeBuilder does,
+    except that the base64 text of the streamed Attachments in the body is
+    decoded to temporary files as it's parsed, so that it's never held in
+    memory as a whole. Their elements get an xop:Include child instead, that
+    refers to the file in the attachments dict by its content id.
+
+    :param get_body_class: A callable that takes the tag of the child of the
+        soap body and returns its class, or None.
+    '''
+
+    def __init__(self, get_body_class):
+        self.attachments = {}
+
+        self.__builder = etree.TreeBuilder()
+        self.__get_body_class = get_body_class
+
+        # the (tag, class) pairs of the open elements. the class is None when
+        # it's not known.
+        self.__stack = []
+        self.__decoder = None
+        self.__file = None
+        self.__depth = None
+
+    def start(self, tag, attrib, nsmap=None):
+        cls = None
+        if len(self.__stack) > 0:
+            parent_tag, parent_class = self.__stack[-1]
+            if len(self.__stack) == 2 and parent_tag == _body_tag:
+                if tag != _fault_tag:
+                    cls = self.__get_body_class(tag)
+            elif not (parent_class is None):
+                cls = _get_child_class(parent_class, tag)
+
+        # the text before a child element, e.g. an xop:Include, is whitespace
+        # that's decoded to nothing, so the file is just dropped.
+        if not (self.__decoder is None):
+            self.__decoder = self.__file = None
+
+        self.__stack.append((tag, cls))
+
+        if not (cls is None) and _is_streamed_attachment(cls) and \
+                        not (attrib.get(_nil_attr) or 'href' in attrib):
+            self.__file = SpooledTemporaryFile(
+                                           max_size=cls.Attributes.spool_size)
+            self.__decoder = Base64Decoder(self.__file)
+            self.__depth = len(self.__stack)
+
+        return self.__builder.start(tag, attrib, nsmap)
+
+    def data(self, data):
+        if self.__decoder is None:
+            self.__builder.data(data)
+            return
+
+        try:
+            self.__decoder.write(data)
+        except binascii.Error, e:
+            raise Fault('Client.ValidationError',
+                                          'Invalid base64 data: %s' % e)
+
+    def end(self, tag):
+        if not (self.__decoder is None) and len(self.__stack) == self.__depth:
+            try:
+                self.__decoder.finish()
+            except binascii.Error, e:
+                raise Fault('Client.ValidationError',
+                                          'Invalid base64 data: %s' % e)
+
+            self.__file.seek(0)
+            content_id = uuid4().hex
+            self.attachments[content_id] = self.__file
+            self.__decoder = self.__file = None
+
+            self.__builder.start(_xop_include_tag,
+                                            {'href': 'cid:%s' % content_id})
+            self.__builder.end(_xop_include_tag)
+
+        self.__stack.pop()
+
+        return self.__builder.end(tag)
+
+    def comment(self, text):
+        return self.__builder.comment(text)
+
+    def pi(self, target, data=None):
+        return self.__builder.pi(target, data)
+
+    def close(self):
+        return self.__builder.close()
+
+def _get_streamed_attachments(cls, value, attachments):
+    '''Adds the streamed attachments in the given instance of the given class
+    to the given dict, by id. Attachment.to_parent_element writes their ids to
+    the document in their place. Iterables are not consumed here.'''
+
+    if value is None:
+        return
+
+    base = getattr(cls, '_is_clone_of', cls)
+    if issubclass(base, Attachment):
+        if cls.Attributes.stream and isinstance(value, Attachment) and \
+                      value.data is None and not (value.file_name is None):
+            attachments[str(id(value))] = value
+
+    elif issubclass(base, Iterable):
+        return
+
+    elif issubclass(base, Array):
+        (member,) = cls._type_info.values()
+        member_base = getattr(member, '_is_clone_of', member)
+        if issubclass(member_base, (Attachment, ComplexModelBase)):
+            for item in value:
+                _get_streamed_attachments(member, item, attachments)
+
+    elif issubclass(base, ComplexModelBase):
+        for k, v in ComplexModelBase.get_flat_type_info(cls).items():
+            _get_streamed_attachments(v, getattr(value, k, None), attachments)
+
+def _write_element(xf, element, attachments):
+    '''Writes the given element to the given incremental xml writer. The
+    streamed attachments in the given dict are written in chunks, yielding
+    after every chunk.'''
+
+    if element.tag is etree.PI and element.target == ATTACHMENT_PI_TARGET:
+        attachment = attachments.get(element.text)
+        if not (attachment is None):
+            for chunk in iter_base64_file(attachment.file_name):
+                xf.write(chunk)
+                yield
+            return
+
+    if element.tag is etree.Comment or element.tag is etree.PI:
+        xf.write(element)
+        return
+
+    with xf.element(element.tag, element.attrib):
+        if element.text:
+            xf.write(element.text)
+
+        for child in element:
+            for _ in _write_element(xf, child, attachments):
+                yield
+            if child.tail:
+                xf.write(child.tail)
+
+def _fill_attachments(document, attachments):
+    '''Replaces the placeholders of the streamed attachments in the given dict
+    with their contents, for when the document can't be written
+    incrementally.'''
+
+    for pi in list(document.iter(etree.PI)):
+        if pi.target != ATTACHMENT_PI_TARGET:
+            continue
+
+        attachment = attachments.get(pi.text)
+        if not (attachment is None):
+            parent = pi.getparent()
+            parent.remove(pi)
+            parent.text = ''.join(iter_base64_file(attachment.file_name))
+
+def _stream_element(xf, element, out_stream, path, attachments,
+                                                            parent_nsmap=None):
+    '''Writes the given element to the given incremental xml writer, replacing
+    the contents of the array element in the out_stream triplet with the
+    serialized values of its iterable. The path argument is the set of the
+    ancestors of the array element. The streamed attachments in the array
+    items are added to the given dict as they're serialized. Yields after every
+    array item.
+    '''
+
+    target, array_class, values = out_stream
+
+    nsmap = element.nsmap
+    if not (parent_nsmap is None):
+        nsmap = {}
+        for k, v in element.nsmap.items():
+            if parent_nsmap.get(k, None) != v:
+                nsmap[k] = v
+
+    with xf.element(element.tag, element.attrib, nsmap=nsmap):
+        if element.text:
+            xf.write(element.text)
+
+        if element is target:
+            scratch = etree.Element(target.tag, nsmap=target.nsmap)
+            (member,) = array_class._type_info.values()
+
+            for v in values:
+                _get_streamed_attachments(member, v, attachments)
+                inst = array_class.get_serialization_instance([v])
+                array_class.get_members_etree(inst, scratch)
+
+                for child in scratch:
+                    for _ in _write_element(xf, child, attachments):
+                        yield
+                scratch.clear()
+
+                yield
+
+        else:
+            for child in element:
+                if child is target or child in path:
+                    for _ in _stream_element(xf, child, out_stream, path,
+                                                    attachments, element.nsmap):
+                        yield
+
+                else:
+                    for _ in _write_element(xf, child, attachments):
+                        yield
+
+                if child.tail:
+                    xf.write(child.tail)
+
 class Soap11(ProtocolBase):
     class NO_WRAPPER:
         pass
@@ -115,6 +529,8 @@ class Soap11(ProtocolBase):
 
     allowed_http_verbs = ['POST']
     mime_type = 'application/soap+xml'
+    # soap 1.1 requests are usually sent as text/xml.
+    in_mime_types = ('text/xml',)
 
     def __init__(self, parent):
         ProtocolBase.__init__(self, parent)
@@ -122,23 +538,279 @@ class Soap11(ProtocolBase):
         self.in_wrapper = Soap11.IN_WRAPPER
         self.out_wrapper = Soap11.OUT_WRAPPER
 
+        # Iterable return values are always streamed to the output when
+        # etree.xmlfile is available. Set this to True to stream Array return
+        # values as well.
+        self.stream_arrays = False
+        # the minimum size of the chunks of a streamed response.
+        self.stream_chunk_size = 8192
+        # Set this to True to parse incoming requests incrementally from the
+        # wsgi input, so that when the last argument of the called method is
+        # an Iterable, it's deserialized lazily as the method consumes it.
+        # Requests with multiRef (href) elements are not supported in this
+        # mode.
+        self.stream_input = False
+        # the size up to which the parts of multipart requests are kept in
+        # memory. larger ones are spooled to temporary files.
+        self.attachment_spool_size = 1024 * 1024
+
+        # whether any method has streamed Attachment arguments, see
+        # __get_attachment_target
+        self.__streams_attachments = None
+
     def create_in_document(self, ctx, charset=None):
-        ctx.in_document = _parse_xml_string(ctx.in_string, charset)
+        target = self.__get_attachment_target(ctx)
+
+        if isinstance(ctx.in_string, basestring):
+            ctx.in_document = _parse_xml_string(ctx.in_string, charset, target)
+        elif isinstance(ctx.in_string, MultipartStream):
+            ctx.in_document = self.__parse_multipart(ctx, charset, target)
+        else:
+            ctx.in_document = self.__parse_xml_stream(ctx, target)
+
+        # the decoded streamed attachments are resolved like the parts of
+        # multipart requests.
+        if not (target is None or len(target.attachments) == 0):
+            if ctx.in_attachments is None:
+                ctx.in_attachments = {}
+            ctx.in_attachments.update(target.attachments)
+
+    def __get_attachment_target(self, ctx):
+        """Returns a parser target that decodes the streamed Attachments of
+        the request as it's parsed, or None when no method has any."""
+
+        if self.__streams_attachments is None:
+            self.__streams_attachments = False
+            for s in self.parent.interface.services:
+                for method in s.public_methods:
+                    for cls in (method.in_message, method.out_message):
+                        if _has_streamed_attachments(cls, set()):
+                            self.__streams_attachments = True
+
+        if self.__streams_attachments:
+            return _AttachmentTarget(lambda tag: self.__get_body_class(ctx,
+                                                                         tag))
+
+    def __get_body_class(self, ctx, tag):
+        descriptor = ctx.descriptor
+        if descriptor is None:
+            try:
+                descriptor = self.parent.get_route(tag).descriptor
+            except KeyError:
+                return None
+
+        if self.in_wrapper is self.OUT_WRAPPER:
+            return descriptor.out_message
+        return descriptor.in_message
+
+    def __parse_multipart(self, ctx, charset, target):
+        """Parses the envelope in the root part of a multipart request, and
+        sets the other parts to ctx.in_attachments."""
+
+        params = ctx.in_string.content_type[1]
+        if not ('boundary' in params):
+            raise Fault('Client.MimeError', 'No multipart boundary was found')
+
+        try:
+            root_headers, envelope, ctx.in_attachments = parse_multipart(
+                    ctx.in_string, params['boundary'], params.get('start'),
+                    self.attachment_spool_size)
+        except ValueError, e:
+            raise Fault('Client.MimeError', str(e))
+
+        root_type = cgi.parse_header(root_headers.get('content-type', ''))
+        charset = root_type[1].get('charset', charset)
+
+        return _parse_xml_string(envelope, charset, target)
+
+    def __parse_xml_stream(self, ctx, target):
+        """Parses the iterable of strings in ctx.in_string until the element
+        of the Iterable argument of the called method is found. When found,
+        sets ctx.in_stream and returns the partially built document. Otherwise,
+        parses the rest of the document.
+
+        XMLPullParser is new in lxml 3.3. With older versions, the whole request
+        is read and parsed at once.
+        """
+
+        if not hasattr(etree, 'XMLPullParser'):
+            return _parse_xml_string(''.join(ctx.in_string), target=target)
+
+        if target is None:
+            parser = etree.XMLPullParser(events=('start', 'end'))
+        else:
+            parser = etree.XMLPullParser(events=('start', 'end'),
+                                                                 target=target)
+        events = _iter_parse_events(parser, ctx.in_string)
+
+        root = None
+        method = None
+        stream_tag = None
+        depth = 0
+        has_href = False
+
+        for event, element in events:
+            if event == 'end':
+                depth -= 1
+                continue
+
+            depth += 1
+            has_href = has_href or 'href' in element.attrib
+            if depth == 1:
+                root = element
+
+            elif depth == 3 and element.getparent().tag == _body_tag:
+                method = element
+                stream_tag = self.__get_stream_tag(element.tag)
+                if stream_tag is None:
+                    break
+
+            elif depth == 4 and element.tag == stream_tag and \
+                                               element.getparent() is method:
+                ctx.in_stream = (element,
+                                 _iter_stream_children(element, events))
+                return root, {}
+
+        # this request is not going to be streamed, so parse the rest.
+        for event, element in events:
+            if event == 'start':
+                has_href = has_href or 'href' in element.attrib
+
+        # as in _parse_xml_string, the id dict is built only when it's needed.
+        xmlids = {}
+        if has_href:
+            xmlids = _get_xmlids(root)
+
+        return root, xmlids
+
+    def __get_stream_tag(self, method_name):
+        """Returns the tag of the Iterable argument of the given method if it's
+        the last one, None otherwise."""
+
+        if self.in_wrapper is not self.IN_WRAPPER:
+            return None
+
+        try:
+            in_message = self.parent.get_route(method_name).descriptor.in_message
+        except KeyError:
+            return None
+
+        if len(in_message._type_info) == 0:
+            return None
+
+        k = in_message._type_info.keys()[-1]
+        v = in_message._type_info[k]
+        if issubclass(getattr(v, '_is_clone_of', v), Iterable):
+            return '{%s}%s' % (in_message.get_namespace(), k)
 
     def create_out_string(self, ctx, charset=None):
         """Sets an iterable of string fragments to ctx.out_string"""
         if charset is None:
             charset = string_encoding
 
-        ctx.out_string = [etree.tostring(ctx.out_document, xml_declaration=True,
-                                                              encoding=charset)]
+        if ctx.out_streamed_attachments is None:
+            ctx.out_streamed_attachments = {}
 
-    def reconstruct_wsgi_request(self, http_env):
-        http_payload, charset = ProtocolBase.reconstruct_wsgi_request(self, http_env)
+        has_attachments = len(ctx.out_streamed_attachments) > 0
+        if has_attachments and not hasattr(etree, 'xmlfile'):
+            _fill_attachments(ctx.out_document, ctx.out_streamed_attachments)
+            has_attachments = False
 
+        if ctx.out_stream is None and not has_attachments:
+            ctx.out_string = [etree.tostring(ctx.out_document,
+                                     xml_declaration=True, encoding=charset)]
+        else:
+            ctx.out_string = self.__stream_out_string(ctx, charset)
+
+        if ctx.out_attachments:
+            boundary = 'rpclib_mtom_%s' % uuid4().hex
+            ctx.out_content_type = get_mtom_content_type(boundary,
+                                                                self.mime_type)
+            ctx.out_string = iter_mtom_message(boundary, self.mime_type,
+                                ctx.out_string, ctx.out_attachments, charset)
+
+    def __stream_out_string(self, ctx, charset):
+        out_string = StringIO()
+
+        attachments = ctx.out_streamed_attachments
+        if ctx.out_stream is None:
+            writer = lambda xf: _write_element(xf, ctx.out_document,
+                                                                   attachments)
+        else:
+            path = set(ctx.out_stream[0].iterancestors())
+            writer = lambda xf: _stream_element(xf, ctx.out_document,
+                                            ctx.out_stream, path, attachments)
+
+        try:
+            with etree.xmlfile(out_string, encoding=charset) as xf:
+                xf.write_declaration()
+
+                for _ in writer(xf):
+                    xf.flush()
+
+                    if out_string.tell() >= self.stream_chunk_size:
+                        yield out_string.getvalue()
+                        out_string.seek(0)
+                        out_string.truncate()
+
+        except Exception:
+            # the response headers are gone, so all we can do is to cut the
+            # response short.
+            logger.error(traceback.format_exc())
+            raise
+
+        yield out_string.getvalue()
+
+    def __apply_xop(self, ctx, result_message_class, result_message):
+        """Replaces the attachments in the result message with xop:Include
+        references and sets them to ctx.out_attachments, to be sent as separate
+        mime parts."""
+
+        ctx.out_attachments = []
+
+        def include(value):
+            content_id = 'rpclibAttachment_%d' % len(ctx.out_attachments)
+            ctx.out_attachments.append((content_id, value))
+            return XopInclude(content_id)
+
+        for k, v in result_message_class._type_info.items():
+            value = getattr(result_message, k, None)
+            if value is None:
+                continue
+
+            if _is_attachment(v):
+                setattr(result_message, k, include(value))
+
+            elif issubclass(getattr(v, '_is_clone_of', v), Array) and \
+                                   _is_attachment(v._type_info.values()[0]):
+                setattr(result_message, k, [
+                      (a if a is None else include(a)) for a in value])
+
+    def __get_stream_key(self, result_message_class, result_message):
+        if not hasattr(etree, 'xmlfile'):
+            return None
+
+        for k, v in result_message_class._type_info.items():
+            if getattr(result_message, k, None) is None:
+                continue
+
+            base = getattr(v, '_is_clone_of', v)
+            if issubclass(base, Iterable) or (self.stream_arrays and
+                                                       issubclass(base, Array)):
+                return k
+
+    def reconstruct_wsgi_request(self, http_env):
         content_type = cgi.parse_header(http_env.get("CONTENT_TYPE"))
 
-        return collapse_swa(content_type, http_payload), charset
+        # multipart requests are parsed as they're read.
+        if 'multipart/related' in content_type[0]:
+            chunks, charset = self.reconstruct_wsgi_request_chunks(http_env)
+            return MultipartStream(chunks, content_type), charset
+
+        if self.stream_input:
+            return self.reconstruct_wsgi_request_chunks(http_env)
+
+        return ProtocolBase.reconstruct_wsgi_request(self, http_env)
 
     def decompose_incoming_envelope(self, ctx):
         envelope_xml, xmlids = ctx.in_document
@@ -168,18 +840,35 @@ class Soap11(ProtocolBase):
                         logger.debug(body_doc)
                         raise Fault('Client.Xml', 'Error at line: %d, '
                                     'col: %d' % e.position)
-            try:
-                if ctx.service_class is None: # i.e. if it's a server
-                    ctx.service_class = self.parent.get_service_class(ctx.method_name)
+            if ctx.service_class is None: # i.e. if it's a server
+                route = self.__get_route(ctx)
 
-            except Exception,e:
-                logger.debug(traceback.format_exc())
-                raise ValidationError('Client', 'Method not found: %r' %
-                                                                ctx.method_name)
+                ctx.service_class = route.service_class
+                ctx.descriptor = route.descriptor
+                ctx.function = route.function
 
             ctx.in_header_doc = header_doc
             ctx.in_body_doc = body_doc
 
+    def __get_route(self, ctx):
+        try:
+            return self.parent.get_route(ctx.method_name)
+
+        except KeyError:
+            # fall back to the SOAPAction http header, when available.
+            http_req_env = getattr(ctx, 'http_req_env', None)
+            if http_req_env is not None:
+                soap_action = http_req_env.get('HTTP_SOAPACTION', '').strip('"')
+                if soap_action:
+                    try:
+                        return self.parent.get_route(soap_action)
+                    except KeyError:
+                        pass
+
+            logger.debug(traceback.format_exc())
+            raise ValidationError('Client', 'Method not found: %r' %
+                                                                ctx.method_name)
+
     def deserialize(self, ctx):
         """Takes a MethodContext instance and a string containing ONE soap
         message.
@@ -218,6 +907,26 @@ class Soap11(ProtocolBase):
             else:
                 ctx.in_object = [None] * len(body_class._type_info)
 
+            if not (ctx.in_body_doc is None or len(ctx.in_body_doc) == 0):
+                if not (ctx.in_attachments is None):
+                    _resolve_xop(body_class, ctx.in_object, ctx.in_attachments)
+
+                # references to parts in a request that has none can't be
+                # resolved, so they're rejected.
+                elif len(_find_xop_references(ctx.in_body_doc)) > 0:
+                    _resolve_xop(body_class, ctx.in_object, {})
+
+            # the Iterable argument whose children are still being parsed
+            if not (ctx.in_stream is None):
+                element, children = ctx.in_stream
+
+                k = body_class._type_info.keys()[-1]
+                v = body_class._type_info[k]
+                (serializer,) = v._type_info.values()
+                if not (getattr(ctx.in_object, k) is None): # i.e. not nil
+                    setattr(ctx.in_object, k,
+                                   (serializer.from_xml(c) for c in children))
+
         self.event_manager.fire_event('deserialize', ctx)
 
     def serialize(self, ctx):
@@ -230,7 +939,11 @@ class Soap11(ProtocolBase):
 
         # construct the soap response, and serialize it
         nsmap = self.parent.interface.nsmap
-        ctx.out_document = etree.Element('{%s}Envelope' % ns.soap_env,
+
+        # an empty envelope is already there when the context is reused, e.g.
+        # by the clients.
+        if ctx.out_document is None:
+            ctx.out_document = etree.Element('{%s}Envelope' % ns.soap_env,
                                                                     nsmap=nsmap)
 
         if not (ctx.out_error is None):
@@ -296,10 +1009,37 @@ class Soap11(ProtocolBase):
                         attr_name=result_message_class._type_info.keys()[i]
                         setattr(result_message, attr_name, ctx.out_object[i])
 
+            # attachments are sent as separate mime parts of the response.
+            if self.out_wrapper is self.OUT_WRAPPER and ctx.descriptor.mtom:
+                self.__apply_xop(ctx, result_message_class, result_message)
+
+            # the array that's going to be streamed is serialized empty here.
+            # its contents are serialized in create_out_string.
+            stream_key = None
+            if self.out_wrapper is self.OUT_WRAPPER and not ctx.descriptor.mtom:
+                stream_key = self.__get_stream_key(result_message_class,
+                                                                 result_message)
+            if not (stream_key is None):
+                stream_values = getattr(result_message, stream_key)
+                setattr(result_message, stream_key, [])
+
+            # the streamed attachments are looked up by id when the document
+            # is written.
+            ctx.out_streamed_attachments = {}
+            _get_streamed_attachments(result_message_class, result_message,
+                                                   ctx.out_streamed_attachments)
+
             # transform the results into an element
             result_message_class.to_parent_element(
                   result_message, self.parent.interface.get_tns(), out_body_doc)
 
+            if not (stream_key is None):
+                stream_element = out_body_doc[0].find('{%s}%s' % (
+                            result_message_class.get_namespace(), stream_key))
+                ctx.out_stream = (stream_element,
+                                  result_message_class._type_info[stream_key],
+                                  stream_values)
+
             if logger.level == logging.DEBUG:
                 logger.debug('\033[91m'+ "Response" + '\033[0m')
                 logger.debug(etree.tostring(ctx.out_document,
@@ -20,11 +20,16 @@ except ImportError:
 
 from email import message_from_string
 
+from cStringIO import StringIO
+from tempfile import SpooledTemporaryFile
+
 import rpclib.const.xml_ns
 
 _ns_xop = rpclib.const.xml_ns.xop
 _ns_soap_env = rpclib.const.xml_ns.soap_env
 
+_mtom_root_id = 'rpclibEnvelope'
+
 def join_attachment(href_id, envelope, payload, prefix=True):
     '''
     Helper function for swa_to_soap.
@@ -294,4 +299,178 @@ def apply_mtom(headers, envelope, params, paramvals):
 
     return (mtomheaders, [mtombody])
 
+class MultipartStream(object):
+    '''The body of a multipart request as an iterable of strings that are read
+    as it's consumed, along with its Content-Type, as parsed by
+    cgi.parse_header.'''
+
+    def __init__(self, chunks, content_type):
+        self.chunks = chunks
+        self.content_type = content_type
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+def _parse_part_headers(block):
+    headers = {}
+    name = None
+
+    # the first line is the rest of the boundary line.
+    for line in block.split('\r\n')[1:]:
+        if line[:1] in (' ', '\t') and not (name is None): # folded header
+            headers[name] += ' ' + line.strip()
+            continue
+
+        name, _, value = line.partition(':')
+        name = name.strip().lower()
+        headers[name] = value.strip()
+
+    return headers
+
+def parse_multipart(chunks, boundary, start=None, spool_size=1024 * 1024):
+    '''Parses a multipart/related (SwA or MTOM) message in a single pass over
+    the given iterable of strings.
+
+    The payload of the root part is returned as a string. The other parts are
+    written as they're read to temporary files that are kept in memory until
+    they grow beyond spool_size bytes. Base64-encoded parts are decoded on the
+    way.
+
+    @param  boundary  the boundary parameter of the Content-Type.
+    @param  start     the start parameter of the Content-Type, i.e. the
+                      Content-ID of the root part. None means the first part.
+    @return           tuple of length 3 with a dict of the headers of the root
+                      part (with lowercase names), its payload and a dict of the
+                      other parts as files positioned at their start, by their
+                      Content-ID (without the angle brackets) and their
+                      Content-Location.
+    '''
+
+    delimiter = '\r\n--' + boundary
+    keep = len(delimiter) - 1
+    chunks = iter(chunks)
+
+    def read(buf):
+        for chunk in chunks:
+            if len(chunk) > 0:
+                return buf + chunk
+        raise ValueError("Unexpected end of multipart message")
+
+    root_headers = None
+    root = None
+    parts = {}
+
+    # the first delimiter doesn't have to be preceded by a line break.
+    buf = '\r\n'
+    sink = None # None for the preamble
+
+    while True:
+        i = buf.find(delimiter)
+        while True:
+            if i >= 0:
+                # the delimiter is followed by '--', whitespace or a line break.
+                # otherwise, it's just data that looks like one.
+                while len(buf) < i + len(delimiter) + 2:
+                    buf = read(buf)
+                c = buf[i + len(delimiter):i + len(delimiter) + 2]
+                if c == '--' or c == '\r\n' or c[0] in ' \t':
+                    break
+
+                i = buf.find(delimiter, i + 1)
+                continue
+
+            if len(buf) > keep:
+                if not (sink is None):
+                    sink.write(buf[:-keep])
+                buf = buf[-keep:]
+
+            buf = read(buf)
+            i = buf.find(delimiter)
+
+        if not (sink is None):
+            sink.write(buf[:i])
+            if isinstance(sink, Base64Decoder):
+                sink.finish()
+        buf = buf[i + len(delimiter):]
+
+        if buf.startswith('--'): # the close delimiter. the rest is ignored.
+            break
+
+        i = buf.find('\r\n\r\n')
+        while i < 0:
+            buf = read(buf)
+            i = buf.find('\r\n\r\n')
+
+        headers = _parse_part_headers(buf[:i])
+        buf = buf[i + 4:]
+
+        content_id = headers.get('content-id', '')
+        if (root_headers is None) and (start is None or start == content_id):
+            root_headers = headers
+            root = sink = StringIO()
+            continue
+
+        f = sink = SpooledTemporaryFile(max_size=spool_size)
+        if headers.get('content-transfer-encoding', '').lower() == 'base64':
+            sink = Base64Decoder(f)
+
+        if content_id:
+            parts[content_id.strip('<>')] = f
+        if 'content-location' in headers:
+            parts[headers['content-location']] = f
+
+    if root_headers is None:
+        raise ValueError("The root part of the multipart message was not found")
+
+    for f in parts.values():
+        f.seek(0)
+
+    return root_headers, root.getvalue(), parts
+
+def get_mtom_content_type(boundary, root_type):
+    '''Returns the Content-Type header of an MTOM message built by
+    iter_mtom_message.'''
+
+    return 'multipart/related; type="application/xop+xml"; ' \
+           'boundary="%s"; start="<%s>"; start-info="%s"' % (boundary,
+                                                       _mtom_root_id, root_type)
+
+def iter_mtom_message(boundary, root_type, envelope, attachments,
+                                                            charset='utf-8'):
+    '''Yields the body of an MTOM message in chunks, without copying the
+    envelope or the attachment data.
+
+    References:
+    XOP     http://www.w3.org/TR/xop10/
+    MTOM    http://www.w3.org/Submission/soap11mtom10/
+
+    @param boundary     the MIME boundary, which must not occur in any of the
+                        parts.
+    @param root_type    the mime type of the envelope.
+    @param envelope     iterable of the chunks of the serialized envelope, whose
+                        attachments are replaced with xop:Include elements.
+    @param attachments  (content id, Attachment) pairs.
+    '''
+
+    yield '--%s\r\n' \
+          'Content-Type: application/xop+xml; charset=%s; type="%s"\r\n' \
+          'Content-Transfer-Encoding: binary\r\n' \
+          'Content-ID: <%s>\r\n\r\n' % (boundary, charset, root_type,
+                                                                _mtom_root_id)
+
+    for chunk in envelope:
+        yield chunk
+
+    for content_id, attachment in attachments:
+        yield '\r\n--%s\r\n' \
+              'Content-Type: application/octet-stream\r\n' \
+              'Content-Transfer-Encoding: binary\r\n' \
+              'Content-ID: <%s>\r\n\r\n' % (boundary, content_id)
+
+        for chunk in attachment.iter_data():
+            yield chunk
+
+    yield '\r\n--%s--\r\n' % boundary
+
 from rpclib.model.binary import Attachment
+from rpclib.model.binary import Base64Decoder
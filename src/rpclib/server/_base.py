@@ -22,6 +22,8 @@
 import logging
 logger = logging.getLogger(__name__)
 
+from time import time
+
 from rpclib.model.exception import Fault
 from rpclib._base import EventManager
 
@@ -41,31 +43,62 @@ class ServerBase(object):
         self.event_manager = EventManager(self)
 
     def get_in_object(self, ctx, in_string_charset=None):
-        self.app.in_protocol.create_in_document(ctx, in_string_charset)
+        if isinstance(ctx.in_string, str):
+            ctx.in_bytes = len(ctx.in_string)
 
         try:
+            t0 = time()
+            ctx.in_protocol.create_in_document(ctx, in_string_charset)
+            t1 = time()
+            ctx.timings['parse'] = t1 - t0
+
             # sets the ctx.in_body_doc and ctx.in_header_doc properties
-            self.app.in_protocol.decompose_incoming_envelope(ctx)
+            ctx.in_protocol.decompose_incoming_envelope(ctx)
+            t2 = time()
+            ctx.timings['decompose'] = t2 - t1
 
             if ctx.service_class != None:
                 ctx.service_class.event_manager.fire_event('decompose_envelope',
                                                                         ctx)
-            self.app.in_protocol.deserialize(ctx)
+
+            t2 = time()
+            ctx.in_protocol.deserialize(ctx)
+            ctx.timings['deserialize'] = time() - t2
 
         except Fault,e:
             ctx.in_object = None
             ctx.in_error = e
             ctx.out_error = e
 
-
     def get_out_object(self, ctx):
+        t0 = time()
         self.app.process_request(ctx, ctx.in_object)
+        ctx.timings['call'] = time() - t0
 
     def get_out_string(self, ctx):
         assert ctx.out_document is None
-        assert ctx.out_string is None
 
-        self.app.out_protocol.serialize(ctx)
+        # out_string is already set when the response was served from the
+        # cache of the method, or by an identical request.
+        try:
+            if ctx.out_string is None:
+                self.__serialize(ctx)
+
+        finally:
+            if not (ctx.flight is None):
+                ctx.descriptor.coalesce.leave(ctx)
+
+        if isinstance(ctx.out_string, list):
+            ctx.out_bytes = sum([len(s) for s in ctx.out_string])
+
+        if not (self.app.stats is None):
+            self.app.stats.record(ctx)
+
+    def __serialize(self, ctx):
+        t0 = time()
+        ctx.out_protocol.serialize(ctx)
+        t1 = time()
+        ctx.timings['serialize'] = t1 - t0
 
         if ctx.service_class != None:
             if ctx.out_error is None:
@@ -75,7 +108,11 @@ class ServerBase(object):
                 ctx.service_class.event_manager.fire_event(
                                             'method_exception_document', ctx)
 
-        self.app.out_protocol.create_out_string(ctx)
+        # when the response is streamed, this only measures the serialization
+        # of the parts of the document that are not streamed.
+        t1 = time()
+        ctx.out_protocol.create_out_string(ctx)
+        ctx.timings['tostring'] = time() - t1
 
         if ctx.service_class != None:
             if ctx.out_error is None:
@@ -84,3 +121,12 @@ class ServerBase(object):
             else:
                 ctx.service_class.event_manager.fire_event(
                                             'method_exception_string', ctx)
+
+        # only successful responses that are already serialized to a list are
+        # cached, so that streamed responses are never read into memory.
+        if not (ctx.cache_key is None) and ctx.out_error is None \
+                and isinstance(ctx.out_string, list) \
+                and not ctx.out_streamed_attachments \
+                and ctx.out_content_type is None:
+            ctx.descriptor.cache.put(ctx.cache_key, ctx.out_object,
+                                                                ctx.out_string)
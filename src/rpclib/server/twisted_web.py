@@ -0,0 +1,206 @@
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""An rpc server that runs on the twisted reactor, as a twisted.web resource.
+
+Service methods can return a twisted Deferred instance, e.g. by returning the
+result of a function decorated with twisted.internet.defer.inlineCallbacks
+(the rpc decorator needs the signature of the method itself), in which case
+the response is sent when the Deferred fires, without blocking a thread in the
+meantime. The parsing and serialization of the documents are run in the thread
+pool of the reactor, so they don't block the event loop either. The methods
+themselves are called from the reactor thread, so the ones that don't return a
+Deferred should not block. Methods with an executor are the exception: they're
+called from the thread pool of the reactor, as waiting for the executor to run
+them would block the event loop. Identical requests are not coalesced, unless
+the method has an executor, for the same reason.
+
+The method_return_object events are fired when the method returns, with the
+Deferred as ctx.out_object. When the Deferred fails, the
+method_exception_object events are fired as well.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+from time import time
+
+from twisted.internet import threads
+from twisted.internet.defer import Deferred
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+from rpclib._base import MethodContext
+from rpclib.model.exception import Fault
+from rpclib.server import ServerBase
+
+class TwistedMethodContext(MethodContext):
+    def __init__(self, app, request, req_env):
+        self.http_request = request
+        # a wsgi-like environment, for the protocols that need one.
+        self.http_req_env = req_env
+
+        MethodContext.__init__(self, app)
+
+        # only the methods with an executor are called outside the reactor
+        # thread.
+        self.blocking = False
+
+def _get_req_env(request):
+    path, _, query_string = request.uri.partition('?')
+
+    return {
+        'REQUEST_METHOD': request.method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': request.getHeader('content-type') or '',
+        'CONTENT_LENGTH': request.getHeader('content-length') or '0',
+        'HTTP_SOAPACTION': request.getHeader('soapaction') or '',
+        'wsgi.input': request.content,
+    }
+
+class TwistedWebResource(Resource, ServerBase):
+    isLeaf = True
+    transport = 'http://schemas.xmlsoap.org/soap/http'
+
+    def __init__(self, app):
+        Resource.__init__(self)
+        ServerBase.__init__(self, app)
+
+    def render_GET(self, request):
+        if request.uri.endswith('wsdl'):
+            return self.__handle_wsdl_request(request)
+
+        return self.__handle_rpc(request)
+
+    def render_POST(self, request):
+        return self.__handle_rpc(request)
+
+    def __handle_wsdl_request(self, request):
+        wsdl = self.app.interface.get_interface_document()
+        if wsdl is None:
+            url = str(request.URLPath()).split('?')[0].split('.wsdl')[0]
+            self.app.interface.build_interface_document(url)
+            wsdl = self.app.interface.get_interface_document()
+
+        request.setHeader('Content-Type', 'text/xml; charset=utf-8')
+
+        return wsdl
+
+    def __handle_rpc(self, request):
+        ctx = TwistedMethodContext(self.app, request, _get_req_env(request))
+
+        # set when the client goes away before the response is ready.
+        disconnected = []
+        request.notifyFinish().addErrback(lambda failure: disconnected.append(1))
+
+        d = threads.deferToThread(self.__get_in_object, ctx)
+        d.addCallback(lambda _: self.__get_out_object(ctx))
+        d.addCallback(lambda _: threads.deferToThread(self.__get_out_string, ctx))
+        d.addCallback(self.__write_response, ctx, disconnected)
+        d.addErrback(self.__write_error, ctx, disconnected)
+
+        return NOT_DONE_YET
+
+    def __get_in_object(self, ctx):
+        ctx.in_string, in_string_charset = \
+                     ctx.in_protocol.reconstruct_wsgi_request(ctx.http_req_env)
+
+        self.get_in_object(ctx, in_string_charset)
+
+    def __get_out_object(self, ctx):
+        if not (ctx.in_error is None) or ctx.service_class is None:
+            return
+
+        if self.__has_executor(ctx):
+            ctx.blocking = True
+            return threads.deferToThread(self.get_out_object, ctx)
+
+        t0 = time()
+        self.get_out_object(ctx)
+
+        if isinstance(ctx.out_object, Deferred):
+            d = ctx.out_object
+            ctx.out_object = None
+
+            d.addCallbacks(self.__on_result, self.__on_error,
+                                  callbackArgs=(ctx, t0), errbackArgs=(ctx, t0))
+
+            return d
+
+    def __has_executor(self, ctx):
+        return not (ctx.descriptor.executor is None and
+                                    ctx.service_class.__executor__ is None)
+
+    def __on_result(self, result, ctx, t0):
+        ctx.timings['call'] = time() - t0
+        ctx.out_object = result
+
+    def __on_error(self, failure, ctx, t0):
+        ctx.timings['call'] = time() - t0
+        logger.error(failure.getTraceback())
+
+        e = failure.value
+        if not isinstance(e, Fault):
+            e = Fault('Server', str(e))
+
+        ctx.out_error = e
+
+        self.app.event_manager.fire_event('method_exception_object', ctx)
+        ctx.service_class.event_manager.fire_event('method_exception_object',
+                                                                           ctx)
+
+    def __get_out_string(self, ctx):
+        if ctx.in_error is None and ctx.service_class is None:
+            return
+
+        self.get_out_string(ctx)
+        if ctx.out_string is None:
+            ctx.out_string = ''
+
+        # streamed responses are consumed here so that the reactor thread
+        # doesn't have to.
+        ctx.out_string = ''.join(ctx.out_string)
+
+    def __write_response(self, _, ctx, disconnected):
+        if disconnected:
+            return
+
+        request = ctx.http_request
+        if ctx.in_error is None and ctx.service_class is None:
+            request.setResponseCode(404)
+
+        else:
+            if not (ctx.in_error is None and ctx.out_error is None):
+                request.setResponseCode(500)
+
+            request.setHeader('Content-Type', ctx.out_content_type or
+                                                   ctx.out_protocol.mime_type)
+            request.write(ctx.out_string)
+
+        request.finish()
+
+    def __write_error(self, failure, ctx, disconnected):
+        logger.error(failure.getTraceback())
+
+        if disconnected:
+            return
+
+        request = ctx.http_request
+        request.setResponseCode(500)
+        request.finish()
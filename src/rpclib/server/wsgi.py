@@ -17,18 +17,32 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
-"""An rpc server that uses http as transport, and wsgi as bridge api"""
+"""An rpc server that uses http as transport, and wsgi as bridge api.
+
+WsgiApplication can serve the services of the application with more than one
+protocol. The protocol of every request is picked from the url suffix, the
+Content-Type header or the Accept header, in that order:
+
+    WsgiApplication(app, protocols={
+        'json': JsonObject,
+        'msgpack': MessagePackObject,
+    })
+
+Here, a request to /get_rate.json or one with 'Content-Type: application/json'
+is handled with the JsonObject protocol. The protocols of the application are
+used when none matches.
+"""
 
 # FIXME: this is maybe still too soap-centric.
 
 import logging
 logger = logging.getLogger(__name__)
 
+import cgi
 import traceback
 
 from rpclib._base import MethodContext
 from rpclib.model.exception import Fault
-from rpclib.protocol.soap.mime import apply_mtom
 from rpclib.util import reconstruct_url
 from rpclib.server import ServerBase
 
@@ -51,14 +65,101 @@ class WsgiMethodContext(MethodContext):
 
         MethodContext.__init__(self, app)
 
+def _parse_accept(accept):
+    """Returns the mime types in the given Accept header, the preferred ones
+    first."""
+
+    retval = []
+    for i, media_range in enumerate(accept.split(',')):
+        mime_type, params = cgi.parse_header(media_range)
+        try:
+            q = float(params.get('q', 1))
+        except ValueError:
+            q = 0
+
+        if q > 0 and mime_type:
+            retval.append((-q, i, mime_type))
+
+    retval.sort()
+
+    return [mime_type for _, _, mime_type in retval]
+
 class WsgiApplication(ServerBase):
+    """
+    :param app: The Application instance to serve.
+    :param protocols: The additional protocols to serve the application with,
+        as a dict of url suffixes to protocol classes or to (in protocol
+        class, out protocol class) pairs. The protocols are instantiated once
+        and share the interface of the application.
+    """
+
     transport = 'http://schemas.xmlsoap.org/soap/http'
 
-    def __init__(self, app):
+    def __init__(self, app, protocols=None):
         ServerBase.__init__(self, app)
 
         self._allowed_http_verbs = app.in_protocol.allowed_http_verbs
 
+        self.__default_protocols = (app.in_protocol, app.out_protocol)
+        self.__suffixes = {}
+        self.__in_mime_types = {}
+        self.__out_mime_types = {}
+
+        self.__add_protocols(self.__default_protocols)
+
+        for suffix, protocol_classes in (protocols or {}).items():
+            if isinstance(protocol_classes, (list, tuple)):
+                in_protocol_class, out_protocol_class = protocol_classes
+            else:
+                in_protocol_class = out_protocol_class = protocol_classes
+
+            in_protocol = in_protocol_class(app)
+            if out_protocol_class is in_protocol_class:
+                out_protocol = in_protocol
+            else:
+                out_protocol = out_protocol_class(app)
+
+            pair = (in_protocol, out_protocol)
+
+            self.__suffixes[suffix] = pair
+            self.__add_protocols(pair)
+
+    def __add_protocols(self, pair):
+        in_protocol, out_protocol = pair
+
+        for mime_type in (in_protocol.mime_type,) + \
+                                            tuple(in_protocol.in_mime_types):
+            self.__in_mime_types.setdefault(mime_type, pair)
+
+        self.__out_mime_types.setdefault(out_protocol.mime_type, out_protocol)
+
+    def get_protocols(self, req_env):
+        """Returns the (in protocol, out protocol) pair to handle the given
+        request with. The url suffix of the request selects both of them, and
+        is removed from its PATH_INFO. Otherwise, the in protocol is selected
+        by the Content-Type of the request, and the out protocol by its Accept
+        header or else by the in protocol. Both fall back to the protocols of
+        the application."""
+
+        path_info = req_env.get('PATH_INFO', '')
+        head, dot, suffix = path_info.rpartition('.')
+        if dot and not ('/' in suffix):
+            pair = self.__suffixes.get(suffix)
+            if not (pair is None):
+                req_env['PATH_INFO'] = head
+                return pair
+
+        content_type = cgi.parse_header(req_env.get('CONTENT_TYPE', ''))[0]
+        in_protocol, out_protocol = self.__in_mime_types.get(content_type,
+                                                      self.__default_protocols)
+
+        for mime_type in _parse_accept(req_env.get('HTTP_ACCEPT', '')):
+            if mime_type in self.__out_mime_types:
+                out_protocol = self.__out_mime_types[mime_type]
+                break
+
+        return in_protocol, out_protocol
+
     def __call__(self, req_env, start_response, wsgi_url=None):
         '''This method conforms to the WSGI spec for callable wsgi applications
         (PEP 333). It looks in environ['wsgi.input'] for a fully formed rpc
@@ -79,15 +180,21 @@ class WsgiApplication(ServerBase):
         if self.__is_wsdl_request(req_env):
             return self.__handle_wsdl_request(req_env, start_response, url)
 
-        elif not (req_env['REQUEST_METHOD'].upper() in self._allowed_http_verbs):
+        in_protocol, out_protocol = self.get_protocols(req_env)
+        if in_protocol is self.app.in_protocol:
+            allowed_http_verbs = self._allowed_http_verbs
+        else:
+            allowed_http_verbs = in_protocol.allowed_http_verbs
+
+        if not (req_env['REQUEST_METHOD'].upper() in allowed_http_verbs):
             start_response(HTTP_405, [
                 ('Content-type', ''),
-                ('Allow', ', '.join(self._allowed_http_verbs)),
+                ('Allow', ', '.join(allowed_http_verbs)),
             ])
             return ['']
 
-        else:
-            return self.__handle_rpc(req_env, start_response)
+        return self.__handle_rpc(req_env, start_response, in_protocol,
+                                                                  out_protocol)
 
     def __is_wsdl_request(self, req_env):
         # Get the wsdl for the service. Assume path_info matches pattern:
@@ -130,15 +237,16 @@ class WsgiApplication(ServerBase):
 
             return [""]
 
-    def __handle_rpc(self, req_env, start_response):
-        ctx = WsgiMethodContext(self.app, req_env,
-                                                self.app.out_protocol.mime_type)
+    def __handle_rpc(self, req_env, start_response, in_protocol, out_protocol):
+        ctx = WsgiMethodContext(self.app, req_env, out_protocol.mime_type)
+        ctx.in_protocol = in_protocol
+        ctx.out_protocol = out_protocol
 
         # implementation hook
         self.event_manager.fire_event('wsgi_call', ctx)
 
         ctx.in_string, in_string_charset = \
-                        self.app.in_protocol.reconstruct_wsgi_request(req_env)
+                             in_protocol.reconstruct_wsgi_request(req_env)
 
         self.get_in_object(ctx, in_string_charset)
 
@@ -163,20 +271,9 @@ class WsgiApplication(ServerBase):
         # implementation hook
         self.event_manager.fire_event('wsgi_return', ctx)
 
-        if ctx.descriptor and ctx.descriptor.mtom:
-            # when there are more than one return type, the result is 
-            # encapsulated inside a list. when there's just one, the result
-            # is returned unencapsulated. the apply_mtom always expects the
-            # objects to be inside an iterable, hence the following test.
-            out_type_info = ctx.descriptor.out_message._type_info
-            if len(out_type_info) == 1:
-                out_object = [out_object]
-
-            ctx.http_resp_headers, ctx.out_string = apply_mtom(
-                    ctx.http_resp_headers, ctx.out_string,
-                    ctx.descriptor.out_message._type_info.values(),
-                    out_object
-                )
+        # e.g. mtom responses are multipart messages.
+        if not (ctx.out_content_type is None):
+            ctx.http_resp_headers['Content-Type'] = ctx.out_content_type
 
         # initiate the response
         del ctx.http_resp_headers['Content-Length']
@@ -17,11 +17,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
-"""A soap server that uses ZeroMQ (zmq.REP) as transport"""
+"""An rpc server that uses ZeroMQ (zmq.REP) as transport. Works with any
+protocol, e.g. Soap11 or the more compact MessagePackObject."""
 
 import zmq
 
-from rpclib import MethodContext
+from rpclib._base import MethodContext
+from rpclib.model.exception import Fault
 from rpclib.server import ServerBase
 
 context = zmq.Context()
@@ -43,18 +45,25 @@ class Server(ServerBase):
 
     def serve_forever(self):
         while True:
-            in_string = self.soap_socket.recv()
             ctx = MethodContext(self.app)
+            ctx.in_string = self.soap_socket.recv()
 
-            in_object = self.get_in_object(ctx, in_string)
+            # a zmq.REP socket must reply to every message before it can
+            # receive the next one, so the faults are always sent back.
+            try:
+                self.get_in_object(ctx)
+                if ctx.in_error is None:
+                    self.get_out_object(ctx)
+                elif ctx.out_error is None:
+                    # the message was a response or a fault.
+                    ctx.out_error = Fault('Client', 'Expected a request.')
 
-            if ctx.in_error:
-                out_object = ctx.in_error
-            else:
-                out_object = self.get_out_object(ctx, in_object)
-                if ctx.out_error:
-                    out_object = ctx.out_error
+                self.get_out_string(ctx)
 
-            out_string = self.get_out_string(ctx, out_object)
+            except Fault, e:
+                ctx.out_error = e
+                ctx.out_document = None
+                ctx.out_protocol.serialize(ctx)
+                ctx.out_protocol.create_out_string(ctx)
 
-            self.soap_socket.send(''.join(out_string))
+            self.soap_socket.send(''.join(ctx.out_string))
@@ -69,6 +69,8 @@ class ServiceBase(object):
     __out_header__ = None
     __service_name__ = None
     __port_types__ = ()
+    __executor__ = None # the rpclib.util.executor instance to run the methods
+                        # in, if any.
 
     @classmethod
     def get_service_class_name(cls):
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+
+"""Helpers that call wsgi applications in the same process, for the tests."""
+
+from StringIO import StringIO
+
+from lxml import etree
+
+def get_soap_request(method, **kwargs):
+    """Returns a soap request for the given method of an application whose
+    tns is 'tns'. The arguments are written in the order of their names."""
+
+    args = ''.join(['<tns:%s>%s</tns:%s>' % (k, v, k)
+                                                for k, v in sorted(kwargs.items())])
+
+    return '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns">
+        <senv:Body><tns:%s>%s</tns:%s></senv:Body>
+    </senv:Envelope>''' % (method, args, method)
+
+def call_wsgi(wsgi_app, request, input=None,
+                                      content_type='text/xml; charset=utf-8'):
+    """Posts the given request to the given wsgi application, and returns the
+    chunks of its response."""
+
+    if input is None:
+        input = StringIO(request)
+
+    env = {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(request)),
+        'wsgi.input': input,
+    }
+
+    return list(wsgi_app(env, lambda status, headers: None))
+
+def call_soap(wsgi_app, method, **kwargs):
+    """Calls the given method with a soap request, and returns the root
+    element of the response."""
+
+    return etree.fromstring(''.join(call_wsgi(wsgi_app,
+                                         get_soap_request(method, **kwargs))))
@@ -17,6 +17,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
+import threading
 import unittest
 
 from rpclib.model.exception import Fault
@@ -51,6 +52,25 @@ class RpclibClientTestBase(object):
 
         self.assertEquals(ret, val)
 
+    def test_stub_reuse(self):
+        echo_string = self.client.service.echo_string
+        self.assertTrue(echo_string is self.client.service.echo_string)
+
+        results = []
+        def call(val):
+            results.append((val, echo_string(val)))
+
+        threads = [threading.Thread(target=call, args=(str(i),))
+                                                              for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEquals(len(results), 8)
+        for val, ret in results:
+            self.assertEquals(val, ret)
+
     def test_enum(self):
         DaysOfWeekEnum = self.client.factory.create("DaysOfWeekEnum")
 
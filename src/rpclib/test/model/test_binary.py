@@ -25,6 +25,7 @@ from tempfile import mkstemp
 from lxml import etree
 
 from rpclib.model.binary import Attachment
+from rpclib.model.binary import iter_base64_file
 import rpclib.const.xml_ns
 
 ns_xsd = rpclib.const.xml_ns.xsd
@@ -120,5 +121,34 @@ class TestBinary(unittest.TestCase):
         dt = Attachment.get_namespace()
         assert dt == ns_xsd
 
+    def test_stream(self):
+        StreamingAttachment = Attachment.customize(stream=True, spool_size=1024)
+
+        element = etree.Element('test')
+        attachment = Attachment(file_name=self.tmpfile)
+        StreamingAttachment.to_parent_element(attachment, ns_test, element)
+        element = element[0]
+
+        # the contents are filled in by the protocol, which looks the
+        # attachment up by id.
+        self.assertEquals(element[0].target, 'rpclib-attachment')
+        self.assertEquals(element[0].text, str(id(attachment)))
+
+        f = open(self.tmpfile, 'rb')
+        data = f.read()
+        f.close()
+
+        chunks = list(iter_base64_file(self.tmpfile, chunk_size=570))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEquals(''.join(chunks), base64.encodestring(data))
+
+        element = etree.Element('test')
+        element.text = ''.join(chunks)
+        a = StreamingAttachment.from_xml(element)
+
+        self.assertEquals(a.data, None)
+        self.assertTrue(a.file._rolled) # i.e. it's on disk
+        self.assertEquals(a.file.read(), data)
+
 if __name__ == '__main__':
     unittest.main()
@@ -20,6 +20,13 @@
 import datetime
 import unittest
 
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from rpclib.model.complex import ComplexModel
 from rpclib.model.complex import Array
 
@@ -114,6 +121,181 @@ class TestComplexModel(unittest.TestCase):
         self.assertEquals(None, p.age)
         self.assertEquals(None, p.addresses)
 
+    def test_compiled_serializer(self):
+        class CompiledAddress(ComplexModel):
+            street = String
+            zip = Integer(nillable=False)
+
+        class CompiledPerson(ComplexModel):
+            name = String
+            age = Integer
+            addresses = Array(CompiledAddress)
+            titles = Array(String)
+
+        class CompiledEmployee(CompiledPerson):
+            __namespace__ = 'other_ns'
+            salary = Float
+
+        CompiledPerson.resolve_namespace(CompiledPerson, __name__)
+        CompiledEmployee.resolve_namespace(CompiledEmployee, __name__)
+
+        e = CompiledEmployee()
+        e.name = 'bob'
+        e.addresses = [CompiledAddress(street='123 happy way'), None]
+        e.titles = ['mr', 'dr']
+        e.salary = 1.5
+
+        def serialize():
+            element = etree.Element('test')
+            CompiledEmployee.to_parent_element(e, ns_test, element)
+            return etree.tostring(element)
+
+        expected = serialize()
+        CompiledEmployee.compile_serializer()
+
+        self.assertTrue('_compiled_members_etree' in CompiledEmployee.__dict__)
+        self.assertTrue('_compiled_members_etree' in
+                          CompiledPerson._type_info['addresses'].__dict__)
+        self.assertFalse('_compiled_members_etree' in CompiledPerson.__dict__)
+        self.assertEquals(expected, serialize())
+
+    def test_compiled_deserializer(self):
+        class CompiledLevel(ComplexModel):
+            arg1 = String
+            arg2 = Array(Integer)
+
+        class CompiledParent(ComplexModel):
+            level = CompiledLevel
+            levels = Array(CompiledLevel)
+            name = String
+
+        CompiledParent.resolve_namespace(CompiledParent, __name__)
+        CompiledParent.compile_deserializer()
+
+        self.assertTrue('_compiled_from_xml' in CompiledParent.__dict__)
+        self.assertTrue('_compiled_from_xml' in CompiledLevel.__dict__)
+
+        ns = CompiledParent.get_namespace()
+        element = etree.fromstring('''
+            <p xmlns="%s" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+                <!-- comments are ignored -->
+                <level><arg1>a</arg1><arg2><integer>1</integer><integer>2</integer></arg2></level>
+                <levels>
+                    <CompiledLevel><arg1>b</arg1></CompiledLevel>
+                    <!-- here too -->
+                    <CompiledLevel xsi:nil="true"/>
+                </levels>
+                <name xmlns="unexpected_namespace">c</name>
+            </p>''' % ns)
+
+        p = CompiledParent.from_xml(element)
+
+        self.assertTrue(isinstance(p, CompiledParent))
+        self.assertEquals(p.level.arg1, 'a')
+        self.assertEquals(p.level.arg2, [1, 2])
+        self.assertEquals(len(p.levels), 2)
+        self.assertEquals(p.levels[0].arg1, 'b')
+        self.assertEquals(p.levels[0].arg2, None)
+        self.assertEquals(p.levels[1], None)
+        self.assertEquals(p.name, 'c')
+
+    def test_compact(self):
+        class CompactBase(ComplexModel):
+            __compact__ = True
+
+            i = Integer
+
+        class CompactChild(CompactBase):
+            s = String
+            children = Array(CompactBase)
+
+        CompactChild.resolve_namespace(CompactChild, __name__)
+
+        self.assertEquals(CompactChild.__slots__, ('s', 'children'))
+
+        c = CompactChild(i=1, s='a')
+        self.assertEquals((c.i, c.s, c.children), (1, 'a', None))
+        self.assertEquals(c.__dict__, {})
+
+        c.children = [CompactBase(i=2), CompactBase()]
+
+        element = etree.Element('test')
+        CompactChild.to_parent_element(c, CompactChild.get_namespace(),
+                                                                       element)
+        c2 = CompactChild.from_xml(element[0])
+
+        self.assertTrue(isinstance(c2, CompactChild))
+        self.assertEquals(c2.__dict__, {})
+        self.assertEquals((c2.i, c2.s), (1, 'a'))
+        self.assertEquals([e.i for e in c2.children], [2, None])
+
+        # the members are not class attributes when _type_info is explicit.
+        class CompactExplicit(ComplexModel):
+            __compact__ = True
+
+            _type_info = [('i', Integer), ('s', String)]
+
+        c = CompactExplicit(i=1)
+        self.assertEquals((c.i, c.s), (1, None))
+
+        # classes that don't opt in are not affected.
+        c = ComplexModel()
+        c.x = 1
+        self.assertEquals(c.__dict__, {'x': 1})
+
+    def test_typed_array(self):
+        values = [1.5, 0.1, -2e-300]
+
+        def roundtrip(cls, value):
+            cls.resolve_namespace(cls, __name__)
+            element = etree.Element('test')
+            cls.to_parent_element(value, cls.get_namespace(), element)
+            return element[0], cls.from_xml(element[0])
+
+        generic, _ = roundtrip(Array(Float), values)
+
+        Compiled = Array(Float)
+        Compiled.resolve_namespace(Compiled, __name__)
+        Compiled.compile_serializer()
+        Compiled.compile_deserializer()
+
+        for value in (values, tuple(values), array('d', values)):
+            element, retval = roundtrip(Compiled, value)
+            self.assertEquals(etree.tostring(element), etree.tostring(generic))
+            self.assertEquals(retval, values)
+
+        # nil items are not lost.
+        element, retval = roundtrip(Compiled, [1.5, None])
+        self.assertEquals(retval, [1.5, None])
+
+        # values that aren't numbers are not written in bulk, so they're
+        # escaped.
+        element = etree.Element('test')
+        Compiled.to_parent_element(['1</x><x>2'], Compiled.get_namespace(),
+                                                                       element)
+        self.assertEquals(len(element[0]), 1)
+
+        Typed = Array(Integer, container='array')
+        Typed.resolve_namespace(Typed, __name__)
+        Typed.compile_serializer()
+        Typed.compile_deserializer()
+
+        element, retval = roundtrip(Typed, array('l', [1, 2, 3]))
+        self.assertEquals(retval, array('l', [1, 2, 3]))
+
+        if numpy is None:
+            return
+
+        Typed = Array(Float, container='numpy')
+        Typed.resolve_namespace(Typed, __name__)
+        Typed.compile_serializer()
+        Typed.compile_deserializer()
+
+        element, retval = roundtrip(Typed, numpy.array(values))
+        self.assertEquals(etree.tostring(element), etree.tostring(generic))
+        self.assertTrue(isinstance(retval, numpy.ndarray))
+        self.assertEquals(retval.tolist(), values)
+
     def test_class_array(self):
         peeps = []
         names = ['bob', 'jim', 'peabody', 'mumblesleves']
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+
+import os
+import tempfile
+import unittest
+from rpclib.application import Application
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.binary import Attachment
+from rpclib.model.complex import ComplexModel
+from rpclib.model.complex import Iterable
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.protocol.soap import Soap11
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.service import ServiceBase
+from rpclib.test._wsgi import call_soap
+from rpclib.test._wsgi import call_wsgi
+from rpclib.test._wsgi import get_soap_request
+from rpclib.util.cache import ResponseCache
+from rpclib.util.cache import canonicalize
+
+class Base(ComplexModel):
+    a = Integer
+
+class Derived(Base):
+    b = Integer
+
+class CachedService(ServiceBase):
+    calls = 0
+
+    @srpc(String, _returns=String, _cache=ResponseCache(max_entries=2))
+    def cached(s):
+        CachedService.calls += 1
+        return '%s %d' % (s, CachedService.calls)
+
+    @srpc(Integer, _returns=Iterable(String), _cache=ResponseCache())
+    def stream(n):
+        CachedService.calls += 1
+        return ('item %d' % i for i in range(n))
+
+    @srpc(String, _returns=Attachment.customize(stream=True),
+                                                      _cache=ResponseCache())
+    def attachment(file_name):
+        CachedService.calls += 1
+        return Attachment(file_name=file_name)
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        CachedService.calls = 0
+        app = Application([CachedService], Wsdl11, Soap11, tns='tns')
+        app.out_protocol.stream_chunk_size = 0
+        self.app = app
+        self.cache = app.get_route('cached').descriptor.cache
+        self.cache.clear()
+        self.wsgi_app = WsgiApplication(app)
+
+    def __call(self, s):
+        root = call_soap(self.wsgi_app, 'cached', s=s)
+
+        return root.find('.//{tns}cachedResult').text
+
+    def test_cache(self):
+        hits, misses, evictions = (self.cache.hits, self.cache.misses,
+                                                          self.cache.evictions)
+
+        self.assertEquals(self.__call('a'), 'a 1')
+        self.assertEquals(self.__call('a'), 'a 1')
+        self.assertEquals(self.__call('b'), 'b 2')
+        self.assertEquals(self.__call('c'), 'c 3') # evicts a
+        self.assertEquals(self.__call('a'), 'a 4')
+
+        self.assertEquals(self.cache.hits - hits, 1)
+        self.assertEquals(self.cache.misses - misses, 4)
+        self.assertEquals(self.cache.evictions - evictions, 2)
+
+    def test_ttl(self):
+        self.cache.ttl = 0
+        try:
+            self.assertEquals(self.__call('a'), 'a 1')
+            self.assertEquals(self.__call('a'), 'a 2')
+
+        finally:
+            self.cache.ttl = None
+
+    def test_streamed(self):
+        # streamed responses are neither read into memory nor cached.
+        fd, file_name = tempfile.mkstemp()
+        os.write(fd, 'data')
+        os.close(fd)
+
+        try:
+            for method, kwargs in (('stream', {'n': 10}),
+                                       ('attachment', {'file_name': file_name})):
+                CachedService.calls = 0
+                cache = self.app.get_route(method).descriptor.cache
+
+                for i in range(2):
+                    chunks = call_wsgi(self.wsgi_app,
+                                          get_soap_request(method, **kwargs))
+                    self.assertTrue(len(chunks) > 1)
+
+                self.assertEquals(CachedService.calls, 2)
+                self.assertEquals(len(cache), 0)
+
+        finally:
+            os.unlink(file_name)
+
+class TestCanonicalize(unittest.TestCase):
+    def test_extends(self):
+        x = Derived(a=1, b=2)
+        y = Derived(a=3, b=2)
+
+        self.assertEquals(canonicalize(x), (Derived, 1, 2))
+        self.assertNotEquals(canonicalize(x), canonicalize(y))
+
+if __name__ == '__main__':
+    unittest.main()
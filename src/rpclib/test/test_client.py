@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+import threading
+import unittest
+
+from rpclib._base import MethodContext
+from rpclib.application import Application
+from rpclib.client import ClientBase
+from rpclib.client import RemoteProcedureBase
+from rpclib.client import Service
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.exception import Fault
+from rpclib.model.primitive import String
+from rpclib.protocol.soap import Soap11
+from rpclib.server import ServerBase
+from rpclib.service import ServiceBase
+
+class EchoService(ServiceBase):
+    @srpc(String, _returns=String)
+    def echo(s):
+        return s
+
+    @srpc(String)
+    def fail(s):
+        raise Fault('Client.Failed', s)
+
+class _RemoteProcedure(RemoteProcedureBase):
+    '''Sends the requests to a server in the same process.'''
+
+    server = None
+
+    def __call__(self, *args, **kwargs):
+        ctx = self.get_context()
+
+        try:
+            self.get_out_object(ctx, args, kwargs)
+            self.get_out_string(ctx)
+
+            server_ctx = MethodContext(self.server.app)
+            server_ctx.in_string = ''.join(ctx.out_string)
+
+            self.server.get_in_object(server_ctx)
+            if server_ctx.in_error is None:
+                self.server.get_out_object(server_ctx)
+            self.server.get_out_string(server_ctx)
+
+            ctx.in_string = ''.join(server_ctx.out_string)
+            self.get_in_object(ctx)
+
+            return ctx.in_object
+
+        finally:
+            self.release_context(ctx)
+
+class _Client(ClientBase):
+    def __init__(self, server):
+        app = Application([EchoService], Wsdl11, Soap11, tns='tns')
+        ClientBase.__init__(self, None, app)
+
+        _RemoteProcedure.server = server
+        self.service = Service(_RemoteProcedure, None, app)
+
+class TestRemoteProcedureBase(unittest.TestCase):
+    def setUp(self):
+        app = Application([EchoService], Wsdl11, Soap11, tns='tns')
+        self.client = _Client(ServerBase(app))
+
+    def __assert_clean(self, stub):
+        ctx = stub.get_context()
+        try:
+            for k in ('in_string', 'in_document', 'in_object', 'in_error',
+                                'out_object', 'out_error', 'out_string'):
+                self.assertEquals(getattr(ctx, k), None, k)
+
+            # the envelope is kept, without its contents.
+            self.assertEquals(len(ctx.out_document), 0)
+            self.assertEquals(ctx.timings, {})
+
+        finally:
+            stub.release_context(ctx)
+
+        return ctx
+
+    def test_reuse(self):
+        echo = self.client.service.echo
+        self.assertTrue(echo is self.client.service.echo)
+
+        self.assertEquals(echo('a'), 'a')
+        ctx = self.__assert_clean(echo)
+
+        # the released context is used by the following call.
+        self.assertEquals(echo('b'), 'b')
+        self.assertTrue(self.__assert_clean(echo) is ctx)
+
+    def test_error(self):
+        fail = self.client.service.fail
+
+        try:
+            fail('a')
+        except Fault, e:
+            self.assertEquals(e.faultstring, 'a')
+        else:
+            self.fail("Fault expected")
+
+        # nothing of the failed call is left in the context.
+        self.__assert_clean(fail)
+
+        try:
+            fail('b')
+        except Fault, e:
+            self.assertEquals(e.faultstring, 'b')
+        else:
+            self.fail("Fault expected")
+
+    def test_threads(self):
+        echo = self.client.service.echo
+
+        results = []
+        def call(s):
+            for i in range(20):
+                results.append((s, echo(s)))
+
+        threads = [threading.Thread(target=call, args=(str(i),))
+                                                              for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEquals(len(results), 160)
+        for s, result in results:
+            self.assertEquals(s, result)
+
+if __name__ == '__main__':
+    unittest.main()
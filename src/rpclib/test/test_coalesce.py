@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+
+import time
+import threading
+import unittest
+from rpclib._base import MethodContext
+from rpclib.application import Application
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.primitive import String
+from rpclib.protocol.soap import Soap11
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.service import ServiceBase
+from rpclib.test._wsgi import call_soap
+from rpclib.util.coalesce import RequestCoalescer
+
+class CoalescedService(ServiceBase):
+    calls = 0
+    release = threading.Event()
+
+    @srpc(String, _returns=String, _coalesce=RequestCoalescer())
+    def coalesced(s):
+        CoalescedService.calls += 1
+        CoalescedService.release.wait(1)
+        return '%s %d' % (s, CoalescedService.calls)
+
+class TestRequestCoalescer(unittest.TestCase):
+    def setUp(self):
+        CoalescedService.calls = 0
+        CoalescedService.release.clear()
+
+        app = Application([CoalescedService], Wsdl11, Soap11, tns='tns')
+        self.wsgi_app = WsgiApplication(app)
+        self.coalesce = app.get_route('coalesced').descriptor.coalesce
+        self.coalesce.executions = self.coalesce.collapsed = 0
+
+    def __call_concurrently(self, n, release_after):
+        results = []
+        def call():
+            results.append(call_soap(self.wsgi_app, 'coalesced', s='x'))
+
+        threads = [threading.Thread(target=call) for i in range(n)]
+        for t in threads:
+            t.start()
+
+        time.sleep(release_after)
+        CoalescedService.release.set()
+        for t in threads:
+            t.join()
+
+        return [r.find('.//{tns}coalescedResult').text for r in results]
+
+    def test_coalesce(self):
+        results = self.__call_concurrently(5, 0.1) # let them all arrive
+
+        self.assertEquals(CoalescedService.calls, 1)
+        self.assertEquals(self.coalesce.executions, 1)
+        self.assertEquals(self.coalesce.collapsed, 4)
+        self.assertEquals(results, ['x 1'] * 5)
+
+        # the next request calls the method again
+        self.__call_concurrently(1, 0)
+        self.assertEquals(CoalescedService.calls, 2)
+
+    def test_timeout(self):
+        self.coalesce.timeout = 0.05
+        try:
+            results = self.__call_concurrently(2, 0.3)
+
+        finally:
+            self.coalesce.timeout = 30
+
+        # the waiting request gave up and called the method itself.
+        self.assertEquals(CoalescedService.calls, 2)
+        self.assertEquals(self.coalesce.executions, 2)
+        self.assertEquals(self.coalesce.collapsed, 0)
+        self.assertEquals(sorted(results), ['x 2', 'x 2'])
+
+    def test_abandoned(self):
+        # the first request never has its response serialized, so it never
+        # leaves its flight.
+        coalesce = RequestCoalescer(key=lambda ctx: 'key', timeout=0.05)
+        app = self.wsgi_app.app
+
+        self.assertTrue(coalesce.join(MethodContext(app)))
+
+        # the next one waits for it once, and takes the flight over.
+        ctx = MethodContext(app)
+        t0 = time.time()
+        self.assertTrue(coalesce.join(ctx))
+        self.assertTrue(time.time() - t0 >= 0.05)
+        coalesce.leave(ctx)
+
+        t0 = time.time()
+        self.assertTrue(coalesce.join(MethodContext(app)))
+        self.assertTrue(time.time() - t0 < 0.05)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+import csv
+import json
+import datetime
+import unittest
+
+from StringIO import StringIO
+
+from rpclib.application import Application
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.complex import Array
+from rpclib.model.complex import ComplexModel
+from rpclib.model.complex import Iterable
+from rpclib.model.primitive import Date
+from rpclib.model.primitive import Float
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.protocol.csv import InCsv
+from rpclib.protocol.csv import OutCsv
+from rpclib.protocol.csv import get_columns
+from rpclib.protocol.http import HttpRpc
+from rpclib.protocol.json import JsonObject
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.service import ServiceBase
+
+class Address(ComplexModel):
+    city = String
+    zip = Integer
+
+class Person(ComplexModel):
+    name = String
+    born = Date
+    weight = Float
+    address = Address
+    nicknames = Array(String)
+
+class Employee(Person):
+    salary = Float
+
+def _get_people(n):
+    for i in range(n):
+        address = None
+        if i % 2 == 0:
+            address = Address(city=u'\u0130stanbul', zip=34000 + i)
+
+        yield Person(name='person %d' % i, born=datetime.date(1980, 1, 1),
+                     weight=70.5, address=address, nicknames=['x'])
+
+class CsvService(ServiceBase):
+    @srpc(Integer, _returns=Iterable(Person))
+    def people(n):
+        return _get_people(n)
+
+    @srpc(_returns=Person)
+    def person():
+        return _get_people(1).next()
+
+    @srpc(Integer, _returns=Array(Integer))
+    def numbers(n):
+        return range(n)
+
+def _call(wsgi_app, method, n=None):
+    chunks = list(wsgi_app({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': '/%s' % method,
+        'QUERY_STRING': '' if n is None else 'n=%d' % n,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '7000',
+        'CONTENT_TYPE': '',
+        'CONTENT_LENGTH': '0',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(''),
+    }, lambda status, headers: None))
+
+    return chunks, list(csv.reader(StringIO(''.join(chunks))))
+
+class TestOutCsv(unittest.TestCase):
+    def setUp(self):
+        app = Application([CsvService], Wsdl11, HttpRpc, OutCsv, tns='tns')
+        app.out_protocol.batch_size = 10
+        app.out_protocol.chunk_size = 1024
+
+        self.wsgi_app = WsgiApplication(app)
+
+    def test_columns(self):
+        self.assertEquals([name for name, getter in get_columns(Person)],
+                  ['address.city', 'address.zip', 'born', 'name', 'weight'])
+
+    def test_extends(self):
+        self.assertEquals([name for name, getter in get_columns(Employee)],
+        ['address.city', 'address.zip', 'born', 'name', 'salary', 'weight'])
+
+    def test_nested(self):
+        chunks, rows = _call(self.wsgi_app, 'people', 3)
+
+        self.assertEquals(rows, [
+            ['address.city', 'address.zip', 'born', 'name', 'weight'],
+            ['\xc4\xb0stanbul', '34000', '1980-01-01', 'person 0', '70.5'],
+            ['', '', '1980-01-01', 'person 1', '70.5'],
+            ['\xc4\xb0stanbul', '34002', '1980-01-01', 'person 2', '70.5'],
+        ])
+
+    def test_chunks(self):
+        chunks, rows = _call(self.wsgi_app, 'people', 1000)
+
+        self.assertEquals(len(rows), 1001)
+        self.assertEquals(rows[-1][3], 'person 999')
+
+        # every chunk but the last one has at least chunk_size bytes, and the
+        # rows are written in batches.
+        self.assertTrue(1 < len(chunks) < 100)
+        for chunk in chunks[:-1]:
+            self.assertTrue(len(chunk) >= 1024)
+
+    def test_single(self):
+        chunks, rows = _call(self.wsgi_app, 'person')
+
+        self.assertEquals(rows[1], ['\xc4\xb0stanbul', '34000', '1980-01-01',
+                                                          'person 0', '70.5'])
+
+    def test_simple(self):
+        chunks, rows = _call(self.wsgi_app, 'numbers', 3)
+
+        self.assertEquals(rows, [['integer'], ['0'], ['1'], ['2']])
+
+class _Input(object):
+    """A wsgi input that keeps track of how much of it was read."""
+
+    def __init__(self, data):
+        self.data = StringIO(data)
+        self.position = 0
+
+    def read(self, n):
+        retval = self.data.read(n)
+        self.position += len(retval)
+        return retval
+
+class UploadService(ServiceBase):
+    # the positions of the input at which the rows were received.
+    positions = []
+
+    @srpc(String, Iterable(Person), _returns=Array(String))
+    def upload(prefix, people):
+        retval = []
+        for p in people:
+            UploadService.positions.append(_input.position)
+            retval.append('%s %s %r %s %s' % (prefix, p.name, p.weight, p.born,
+                                     p.address and p.address.zip))
+
+        return retval
+
+    @srpc(Iterable(Person), _returns=Integer)
+    def count(people):
+        return len(list(people))
+
+_input = None
+
+def _upload(wsgi_app, method, data, query_string=''):
+    global _input
+    _input = _Input(data)
+
+    status = []
+    out_string = ''.join(wsgi_app({
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/%s' % method,
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '7000',
+        'CONTENT_TYPE': 'text/csv',
+        'CONTENT_LENGTH': str(len(data)),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': _input,
+    }, lambda s, headers: status.append(s)))
+
+    return status[0], json.loads(out_string)
+
+class TestInCsv(unittest.TestCase):
+    def setUp(self):
+        app = Application([UploadService], Wsdl11, InCsv, JsonObject,
+                                                                    tns='tns')
+        self.wsgi_app = WsgiApplication(app)
+        del UploadService.positions[:]
+
+    def test_upload(self):
+        data = ('name,weight,address.zip,born\r\n'
+                'a,1.5,34000,2011-12-13\r\n'
+                '\r\n'
+                '"b\r\nc",,,\r\n')
+
+        status, doc = _upload(self.wsgi_app, 'upload', data, 'prefix=x')
+
+        self.assertEquals(status, '200 OK')
+        self.assertEquals(doc['uploadResponse']['uploadResult'], [
+            'x a 1.5 2011-12-13 34000',
+            'x b\r\nc None None None',
+        ])
+
+    def test_streaming(self):
+        row = 'name,1.5,34000,2011-12-13\r\n'
+        data = 'name,weight,address.zip,born\r\n' + row * 20000
+
+        status, doc = _upload(self.wsgi_app, 'count', data)
+        self.assertEquals(doc, {'countResponse': {'countResult': 20000}})
+
+        status, doc = _upload(self.wsgi_app, 'upload', data)
+        self.assertEquals(len(doc['uploadResponse']['uploadResult']), 20000)
+
+        # the first rows reach the method before the whole input is read.
+        self.assertTrue(UploadService.positions[0] < len(data) / 2)
+        self.assertEquals(UploadService.positions[-1], len(data))
+
+    def test_unknown_column(self):
+        status, doc = _upload(self.wsgi_app, 'count', 'name,nope\r\na,b\r\n')
+
+        self.assertEquals(status, '500 Internal server error')
+        self.assertEquals(doc['Fault']['faultcode'], 'senv:Client.CsvError')
+
+    def test_invalid_value(self):
+        status, doc = _upload(self.wsgi_app, 'count',
+                                     'name,born\r\na,2011-12-13\r\nb,x\r\n')
+
+        self.assertEquals(status, '500 Internal server error')
+        self.assertEquals(doc['Fault']['faultcode'],
+                                                'senv:Client.ValidationError')
+        self.assertTrue('line 3' in doc['Fault']['faultstring'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+
+import os
+import time
+import threading
+import unittest
+from rpclib.application import Application
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.exception import Fault
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.protocol.soap import Soap11
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.service import ServiceBase
+from rpclib.test._wsgi import call_soap
+from rpclib.util.executor import ProcessPoolExecutor
+from rpclib.util.executor import ThreadPoolExecutor
+
+_slow_pool = ThreadPoolExecutor(max_workers=1, max_queue=1, timeout=0.1)
+
+class ExecutorService(ServiceBase):
+    __executor__ = ThreadPoolExecutor(max_workers=2)
+
+    release = threading.Event()
+
+    @srpc(String, _returns=String, _executor=_slow_pool)
+    def slow(s):
+        ExecutorService.release.wait(1)
+        return s
+
+    @srpc(String, _returns=String)
+    def fast(s):
+        return threading.current_thread().name
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        ExecutorService.release.clear()
+        app = Application([ExecutorService], Wsdl11, Soap11, tns='tns')
+        self.wsgi_app = WsgiApplication(app)
+
+    def tearDown(self):
+        ExecutorService.release.set()
+
+    def __call(self, method):
+        return call_soap(self.wsgi_app, method, s='x')
+
+    def test_timeout(self):
+        root = self.__call('slow')
+        self.assertEquals(root.find('.//faultcode').text, 'senv:Server.Timeout')
+
+        # the slow method does not affect the methods in other pools
+        root = self.__call('fast')
+        self.assertTrue(root.find('.//{tns}fastResult').text.startswith(
+                                                            'rpclib-executor'))
+
+    def test_busy(self):
+        started = threading.Event()
+        release = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=1, max_queue=1, timeout=1)
+
+        def block():
+            started.set()
+            release.wait()
+
+        # one running, one queued
+        threads = [threading.Thread(target=pool.run, args=(block,))
+                                                             for i in range(2)]
+        threads[0].start()
+        started.wait()
+        threads[1].start()
+        time.sleep(0.05)
+
+        try:
+            try:
+                pool.run(block)
+            except Fault, e:
+                self.assertEquals(e.faultcode, 'senv:Server.Busy')
+            else:
+                self.fail("Fault not raised")
+        finally:
+            release.set()
+            for t in threads:
+                t.join()
+
+        self.assertEquals(pool.run(lambda a, b: a + b, 1, 2), 3)
+
+class NegativeFault(Fault):
+    pass
+
+class ProcessPoolService(ServiceBase):
+    __executor__ = ProcessPoolExecutor(processes=1, max_tasks=1)
+
+    @srpc(Integer, _returns=Integer)
+    def pid(n):
+        if n < 0:
+            raise NegativeFault('Client.Negative', 'n is negative')
+        return os.getpid()
+
+class TestProcessPoolExecutor(unittest.TestCase):
+    def setUp(self):
+        app = Application([ProcessPoolService], Wsdl11, Soap11, tns='tns')
+        self.wsgi_app = WsgiApplication(app)
+
+    def tearDown(self):
+        ProcessPoolService.__executor__.close()
+
+    def __call(self, n):
+        return call_soap(self.wsgi_app, 'pid', n=n)
+
+    def test_process_pool(self):
+        pids = set()
+        for i in range(2):
+            root = self.__call(i)
+            pids.add(int(root.find('.//{tns}pidResult').text))
+
+        # the worker is replaced after every task
+        self.assertEquals(len(pids), 2)
+        self.assertFalse(os.getpid() in pids)
+
+    def test_fault(self):
+        root = self.__call(-1)
+
+        self.assertEquals(root.find('.//faultcode').text, 'senv:Client.Negative')
+        self.assertEquals(root.find('.//faultstring').text, 'n is negative')
+
+if __name__ == '__main__':
+    unittest.main()
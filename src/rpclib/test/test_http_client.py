@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+import time
+import socket
+import threading
+import unittest
+
+from BaseHTTPServer import HTTPServer
+from BaseHTTPServer import BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from rpclib.client.http import ConnectionPool
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['content-length']))
+
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.delay)
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+        # the connection is closed without telling the client, like servers
+        # do with the connections that stay idle too long.
+        if self.server.drop:
+            self.close_connection = 1
+
+    def log_message(self, *args):
+        pass
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.drop = False
+        self.delay = 0
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        pool = ConnectionPool()
+        for i in range(5):
+            self.assertEquals(pool.request(self.url, 'x%d' % i), (200, 'x%d' % i))
+
+        self.assertEquals(pool.opened, 1)
+        self.assertEquals(pool.reused, 4)
+        self.assertEquals(self.server.connections, 1)
+
+    def test_idle_timeout(self):
+        pool = ConnectionPool(idle_timeout=0)
+        pool.request(self.url, 'x')
+        pool.request(self.url, 'y')
+
+        self.assertEquals(pool.opened, 2)
+        self.assertEquals(pool.reused, 0)
+
+    def test_stale(self):
+        self.server.drop = True
+
+        pool = ConnectionPool()
+        for i in range(3):
+            self.assertEquals(pool.request(self.url, 'x%d' % i), (200, 'x%d' % i))
+
+        self.assertEquals(self.server.connections, 3)
+
+    def test_timeout(self):
+        pool = ConnectionPool(timeout=0.1)
+        pool.request(self.url, 'x')
+
+        # the request may have been processed, so it's not sent again.
+        self.server.delay = 0.3
+        self.assertRaises(socket.timeout, pool.request, self.url, 'y')
+
+        time.sleep(0.4)
+        self.assertEquals(self.server.requests, 2)
+
+    def test_max_size(self):
+        pool = ConnectionPool(max_size=2)
+        errors = []
+
+        def run():
+            try:
+                for i in range(20):
+                    assert pool.request(self.url, 'x%d' % i) == (200, 'x%d' % i)
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEquals(errors, [])
+        self.assertTrue(pool.opened <= 2)
+        self.assertTrue(self.server.connections <= 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+import json
+import decimal
+import datetime
+import unittest
+
+from StringIO import StringIO
+
+from rpclib.application import Application
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.complex import Array
+from rpclib.model.complex import ComplexModel
+from rpclib.model.complex import Iterable
+from rpclib.model.enum import Enum
+from rpclib.model.exception import Fault
+from rpclib.model.primitive import Boolean
+from rpclib.model.primitive import Date
+from rpclib.model.primitive import DateTime
+from rpclib.model.primitive import Decimal
+from rpclib.model.primitive import Float
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.protocol.json import JsonObject
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.service import ServiceBase
+from rpclib.util.cache import ResponseCache
+
+Color = Enum('red', 'green', type_name='Color')
+
+class Point(ComplexModel):
+    x = Float
+    y = Float
+
+class Shape(ComplexModel):
+    name = String
+    color = Color
+    points = Array(Point)
+    tags = String(max_occurs='unbounded')
+    closed = Boolean
+    created = DateTime
+    area = Decimal
+
+class Leaf(ComplexModel):
+    value = Integer
+
+class Node(ComplexModel):
+    value = Integer
+    children = Array(Leaf)
+
+class Point3D(Point):
+    z = Float
+
+class JsonService(ServiceBase):
+    @srpc(Shape, _returns=Shape)
+    def echo_shape(shape):
+        return shape
+
+    @srpc(Node, _returns=Integer)
+    def count(node):
+        return node.value + sum([n.value for n in node.children or []
+                                                             if not (n is None)])
+
+    @srpc(Integer, Date, _returns=Iterable(Date))
+    def days(n, start):
+        return (start + datetime.timedelta(i) for i in range(n))
+
+    @srpc(Boolean, _returns=Boolean)
+    def negate(b):
+        return not b
+
+    @srpc(Point3D, _returns=Point3D)
+    def echo_point(point):
+        return point
+
+    @srpc(String)
+    def fail(s):
+        raise Fault('Client.Failed', s)
+
+    @srpc(String, _returns=String, _cache=ResponseCache())
+    def cached(s):
+        return s
+
+def _request(wsgi_app, body, content_type, path='/', accept=None):
+    env = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '7000',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+    }
+    if not (accept is None):
+        env['HTTP_ACCEPT'] = accept
+
+    response = []
+    out_string = ''.join(wsgi_app(env,
+                    lambda status, headers: response.extend((status, headers))))
+
+    return response[0], dict(response[1]), out_string
+
+def _call(wsgi_app, doc):
+    status, headers, out_string = _request(wsgi_app, json.dumps(doc),
+                                            'application/json; charset=utf-8')
+
+    return status, json.loads(out_string)
+
+class TestJsonObject(unittest.TestCase):
+    def setUp(self):
+        app = Application([JsonService], Wsdl11, JsonObject, tns='tns')
+        self.wsgi_app = WsgiApplication(app)
+
+    def test_complex(self):
+        shape = {
+            'name': 'triangle',
+            'color': 'green',
+            'points': [{'x': 0.0, 'y': 0.0}, {'x': 1.5, 'y': 0.0},
+                                                            {'x': 0.0, 'y': 2}],
+            'tags': ['a', 'b'],
+            'closed': True,
+            'created': '2011-12-13T14:15:16',
+            'area': '1.50',
+        }
+
+        status, doc = _call(self.wsgi_app, {'echo_shape': {'shape': shape}})
+
+        self.assertEquals(status, '200 OK')
+        shape['points'][2]['y'] = 2.0
+        self.assertEquals(doc, {'echo_shapeResponse':
+                                              {'echo_shapeResult': shape}})
+
+    def test_nested(self):
+        tree = {'value': 1, 'children': [{'value': 2}, None, {'value': 3}]}
+
+        status, doc = _call(self.wsgi_app, {'count': {'node': tree}})
+
+        self.assertEquals(doc, {'countResponse': {'countResult': 6}})
+
+    def test_iterable(self):
+        status, doc = _call(self.wsgi_app, {'days': {'n': 3,
+                                                        'start': '2011-12-31'}})
+
+        self.assertEquals(doc, {'daysResponse': {'daysResult':
+                            ['2011-12-31', '2012-01-01', '2012-01-02']}})
+
+    def test_fault(self):
+        status, doc = _call(self.wsgi_app, {'fail': {'s': 'oops'}})
+
+        self.assertEquals(status, '500 Internal server error')
+        self.assertEquals(doc, {'Fault': {'faultcode': 'senv:Client.Failed',
+                                                      'faultstring': 'oops'}})
+
+    def test_invalid_argument(self):
+        status, doc = _call(self.wsgi_app, {'count': {'node': {'value': 'x'}}})
+
+        self.assertEquals(status, '500 Internal server error')
+        self.assertEquals(doc['Fault']['faultcode'],
+                                                'senv:Client.ValidationError')
+
+    def test_boolean(self):
+        for value, expected in ((False, True), ('false', True), ('1', False)):
+            status, doc = _call(self.wsgi_app, {'negate': {'b': value}})
+
+            self.assertEquals(doc, {'negateResponse':
+                                                    {'negateResult': expected}})
+
+    def test_invalid_boolean(self):
+        for value in ('no', 0, [True]):
+            status, doc = _call(self.wsgi_app, {'negate': {'b': value}})
+
+            self.assertEquals(status, '500 Internal server error')
+            self.assertEquals(doc['Fault']['faultcode'],
+                                                'senv:Client.ValidationError')
+
+    def test_invalid_values(self):
+        for args, message in (
+                ({'node': {'value': 1.7}}, '1.7 is not an integer'),
+                ({'node': {'value': True}}, 'True is not an integer'),
+                ({'node': [1]}, '[1] is not an object'),
+                ({'node': {'value': 1, 'children': {}}}, '{} is not an array'),
+            ):
+            status, doc = _call(self.wsgi_app, {'count': args})
+
+            self.assertEquals(status, '500 Internal server error')
+            self.assertEquals(doc['Fault'], {
+                'faultcode': 'senv:Client.ValidationError',
+                'faultstring': message,
+            })
+
+        for shape, message in (
+                ({'name': 5}, '5 is not a string'),
+                ({'points': [{'x': '1'}]}, "u'1' is not a number"),
+                ({'tags': 'ab'}, "u'ab' is not an array"),
+                ({'area': 'x'}, "u'x' is not a decimal"),
+            ):
+            status, doc = _call(self.wsgi_app, {'echo_shape': {'shape': shape}})
+
+            self.assertEquals(doc['Fault']['faultstring'], message)
+
+    def test_extends(self):
+        point = {'x': 1.0, 'y': 2.0, 'z': 3.0}
+
+        status, doc = _call(self.wsgi_app, {'echo_point': {'point': point}})
+
+        self.assertEquals(doc, {'echo_pointResponse':
+                                                  {'echo_pointResult': point}})
+
+    def test_malformed(self):
+        status, headers, out_string = _request(self.wsgi_app, '{bad',
+                                                            'application/json')
+
+        self.assertEquals(status, '500 Internal server error')
+        self.assertEquals(json.loads(out_string)['Fault']['faultcode'],
+                                                        'senv:Client.JsonError')
+
+    def test_unknown_method(self):
+        status, doc = _call(self.wsgi_app, {'nope': {}})
+
+        self.assertEquals(doc['Fault']['faultcode'], 'senv:Client')
+
+    def test_codecs(self):
+        protocol = self.wsgi_app.app.in_protocol
+
+        value = decimal.Decimal('3.141592653589793238')
+        encoded = protocol.get_encoder(Decimal)(value)
+        self.assertEquals(protocol.get_decoder(Decimal)(encoded), value)
+
+        encoder = protocol.get_encoder(Point)
+        self.assertTrue(encoder is protocol.get_encoder(Point))
+        self.assertEquals(encoder({'x': 1.0, 'y': None}), {'x': 1.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+import datetime
+import unittest
+
+import msgpack
+
+from rpclib._base import MethodContext
+from rpclib.application import Application
+from rpclib.client import ClientBase
+from rpclib.client import RemoteProcedureBase
+from rpclib.client import Service
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.binary import Attachment
+from rpclib.model.complex import Array
+from rpclib.model.complex import ComplexModel
+from rpclib.model.exception import Fault
+from rpclib.model.primitive import DateTime
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.protocol.msgpack import MessagePackObject
+from rpclib.server import ServerBase
+from rpclib.service import ServiceBase
+
+class Item(ComplexModel):
+    name = String
+    count = Integer
+    created = DateTime
+
+class MsgpackService(ServiceBase):
+    @srpc(Array(Item), Integer, _returns=Array(Item))
+    def multiply(items, n):
+        for item in items:
+            item.count *= n
+        return items
+
+    @srpc(Attachment, _returns=Integer)
+    def size(data):
+        return len(data.data)
+
+    @srpc(String)
+    def fail(s):
+        raise Fault('Client.Failed', s)
+
+def _serve(server, in_string):
+    # what the zeromq server does with every message it receives.
+    ctx = MethodContext(server.app)
+    ctx.in_string = in_string
+
+    try:
+        server.get_in_object(ctx)
+        if ctx.in_error is None:
+            server.get_out_object(ctx)
+        elif ctx.out_error is None:
+            ctx.out_error = Fault('Client', 'Expected a request.')
+
+        server.get_out_string(ctx)
+
+    except Fault, e:
+        ctx.out_error = e
+        ctx.out_document = None
+        ctx.out_protocol.serialize(ctx)
+        ctx.out_protocol.create_out_string(ctx)
+
+    return ''.join(ctx.out_string)
+
+class _RemoteProcedure(RemoteProcedureBase):
+    '''Sends the requests to a server in the same process.'''
+
+    server = None
+
+    def __call__(self, *args, **kwargs):
+        ctx = self.get_context()
+
+        try:
+            self.get_out_object(ctx, args, kwargs)
+            self.get_out_string(ctx)
+
+            ctx.in_string = _serve(self.server, ''.join(ctx.out_string))
+            self.get_in_object(ctx)
+
+            return ctx.in_object
+
+        finally:
+            self.release_context(ctx)
+
+class _Client(ClientBase):
+    def __init__(self, server):
+        app = Application([MsgpackService], Wsdl11, MessagePackObject,
+                                                                    tns='tns')
+        ClientBase.__init__(self, None, app)
+
+        _RemoteProcedure.server = server
+        self.service = Service(_RemoteProcedure, None, app)
+
+class TestMessagePackObject(unittest.TestCase):
+    def setUp(self):
+        app = Application([MsgpackService], Wsdl11, MessagePackObject,
+                                                                    tns='tns')
+        self.server = ServerBase(app)
+        self.method_ids = app.in_protocol.method_ids
+        self.app = app
+
+    def __call(self, doc):
+        return msgpack.unpackb(_serve(self.server, msgpack.packb(doc,
+                                           use_bin_type=True)), raw=False)
+
+    def test_method_ids(self):
+        self.assertEquals(self.method_ids, {
+            '{tns}fail': 0,
+            '{tns}multiply': 1,
+            '{tns}size': 2,
+        })
+
+        # the ids are those of the routes of the interface.
+        for name, method_id in self.method_ids.items():
+            route = self.app.interface.get_route(name)
+            self.assertEquals(route.id, method_id)
+            self.assertTrue(self.app.interface.method_routes[method_id] is route)
+
+    def test_positional(self):
+        # complex values are arrays of their members, in _type_info order.
+        def row(**kwargs):
+            return [kwargs[k] for k in Item._type_info]
+
+        doc = self.__call([0, 1, [[row(name=u'a', count=2, created=None),
+                   row(name=u'b', count=3, created='2011-12-13T14:15:16')], 10]])
+
+        self.assertEquals(doc, [1, 1, [[row(name=u'a', count=20, created=None),
+                      row(name=u'b', count=30, created=u'2011-12-13T14:15:16')]]])
+
+    def test_binary(self):
+        doc = self.__call([0, 2, ['\x00\xff' * 100]])
+
+        self.assertEquals(doc, [1, 2, [200]])
+
+    def test_fault(self):
+        doc = self.__call([0, 0, [u'oops']])
+
+        self.assertEquals(doc, [2, [u'senv:Client.Failed', u'oops', u'', None]])
+
+    def test_text(self):
+        # byte strings go out as msgpack str, not bin.
+        doc = self.__call([0, 0, [u'oops']])
+        self.assertEquals(doc[0], 2)
+        for v in doc[1][:2]:
+            self.assertEquals(type(v), unicode)
+
+        encoder = self.app.out_protocol.get_encoder(Item)
+        values = encoder(Item(name='caf\xc3\xa9', count=1))
+        name = values[Item._type_info.keys().index('name')]
+        self.assertEquals(type(name), unicode)
+        self.assertEquals(name, u'caf\xe9')
+
+        doc = msgpack.unpackb(msgpack.packb([name], use_bin_type=True),
+                                                                     raw=False)
+        self.assertEquals(doc, [u'caf\xe9'])
+
+    def test_not_an_array(self):
+        doc = self.__call([0, 1, [{'name': u'a'}, 10]])
+
+        self.assertEquals(doc[0], 2)
+        self.assertEquals(doc[1][0], u'senv:Client.ValidationError')
+
+    def test_unknown_method(self):
+        doc = self.__call([0, 42, []])
+
+        self.assertEquals(doc[0], 2)
+        self.assertEquals(doc[1][0], u'senv:Client')
+
+    def test_malformed(self):
+        doc = msgpack.unpackb(_serve(self.server, '\xc1garbage'), raw=False)
+
+        self.assertEquals(doc[0], 2)
+        self.assertEquals(doc[1][0], u'senv:Client.MessagePackError')
+
+    def test_not_a_request(self):
+        doc = self.__call([2, [u'Client', u'oops', None, None]])
+
+        self.assertEquals(doc[0], 2)
+        self.assertEquals(doc[1][0], u'senv:Client')
+
+    def test_client(self):
+        client = _Client(self.server)
+
+        created = datetime.datetime(2011, 12, 13, 14, 15, 16)
+        items = client.service.multiply([Item(name='a', count=2,
+                                                   created=created)], 3)
+
+        self.assertEquals(len(items), 1)
+        self.assertEquals(items[0].name, 'a')
+        self.assertEquals(items[0].count, 6)
+        self.assertEquals(items[0].created, created)
+
+        self.assertEquals(client.service.size(Attachment(data='abc')), 3)
+
+        try:
+            client.service.fail('oops')
+        except Fault, e:
+            self.assertEquals(e.faultstring, 'oops')
+        else:
+            self.fail("Fault expected")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+
+import json
+import unittest
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from lxml import etree
+
+from rpclib.application import Application
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.protocol.json import JsonObject
+from rpclib.protocol.soap import Soap11
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.test.test_json import JsonService
+from rpclib.test.test_json import _request
+
+if not (msgpack is None):
+    from rpclib.protocol.msgpack import MessagePackObject
+
+_soap_request = """<senv:Envelope
+    xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tns="tns">
+    <senv:Body><tns:cached><tns:s>x</tns:s></tns:cached></senv:Body>
+</senv:Envelope>"""
+
+_json_request = json.dumps({'cached': {'s': 'x'}})
+
+def _assert_soap(test, response):
+    status, headers, out_string = response
+
+    test.assertEquals(status, '200 OK')
+    test.assertEquals(headers['Content-Type'], Soap11.mime_type)
+    test.assertEquals(etree.fromstring(out_string).find(
+                                          './/{tns}cachedResult').text, 'x')
+
+def _assert_json(test, response):
+    status, headers, out_string = response
+
+    test.assertEquals(status, '200 OK')
+    test.assertEquals(headers['Content-Type'], JsonObject.mime_type)
+    test.assertEquals(json.loads(out_string),
+                              {'cachedResponse': {'cachedResult': 'x'}})
+
+class TestContentNegotiation(unittest.TestCase):
+    def setUp(self):
+        app = Application([JsonService], Wsdl11, Soap11, tns='tns')
+        self.wsgi_app = WsgiApplication(app, protocols={'json': JsonObject})
+
+    def test_default(self):
+        _assert_soap(self, _request(self.wsgi_app, _soap_request,
+                                  'text/xml; charset=utf-8', accept='*/*'))
+
+    def test_suffix(self):
+        _assert_json(self, _request(self.wsgi_app, _json_request,
+                                       'text/plain', path='/service.json'))
+
+    def test_content_type(self):
+        _assert_json(self, _request(self.wsgi_app, _json_request,
+                                      'application/json; charset=utf-8'))
+
+    def test_accept(self):
+        # the request is parsed as soap, and the response is sent as json.
+        _assert_json(self, _request(self.wsgi_app, _soap_request,
+                        'text/xml; charset=utf-8', accept='application/json'))
+
+    def test_shared_cache(self):
+        # the cached responses of one protocol are not served to the others.
+        for i in range(2):
+            _assert_soap(self, _request(self.wsgi_app, _soap_request,
+                                                  'text/xml; charset=utf-8'))
+            _assert_json(self, _request(self.wsgi_app, _json_request,
+                                                          'application/json'))
+
+class TestSoapContentType(unittest.TestCase):
+    def setUp(self):
+        app = Application([JsonService], Wsdl11, JsonObject, tns='tns')
+        self.wsgi_app = WsgiApplication(app, protocols={'soap': Soap11})
+
+    def test_text_xml(self):
+        # soap 1.1 requests are selected by the text/xml content type too.
+        _assert_soap(self, _request(self.wsgi_app, _soap_request,
+                                                    'text/xml; charset=utf-8'))
+
+        _assert_json(self, _request(self.wsgi_app, _soap_request,
+                        'text/xml; charset=utf-8', accept='application/json'))
+
+class TestMessagePackNegotiation(unittest.TestCase):
+    def setUp(self):
+        if msgpack is None:
+            self.skipTest('msgpack is not installed')
+
+        app = Application([JsonService], Wsdl11, Soap11, tns='tns')
+        self.wsgi_app = WsgiApplication(app, protocols={
+            'json': JsonObject,
+            'msgpack': MessagePackObject,
+        })
+
+    def test_accept(self):
+        status, headers, out_string = _request(self.wsgi_app, _json_request,
+            'application/json',
+            accept='application/json; q=0.5, application/x-msgpack')
+
+        # the ids are the same in all MessagePackObject instances of the app.
+        method_id = MessagePackObject(self.wsgi_app.app).method_ids[
+                                                                '{tns}cached']
+
+        self.assertEquals(headers['Content-Type'], MessagePackObject.mime_type)
+        self.assertEquals(msgpack.unpackb(out_string, raw=False),
+                                                        [1, method_id, ['x']])
+
+    def test_content_type(self):
+        method_id = MessagePackObject(self.wsgi_app.app).method_ids[
+                                                                '{tns}cached']
+        body = msgpack.packb([0, method_id, ['x']], use_bin_type=True)
+
+        # without an Accept header, the response is sent as a msgpack document.
+        status, headers, out_string = _request(self.wsgi_app, body,
+                                                       'application/x-msgpack')
+
+        self.assertEquals(headers['Content-Type'], MessagePackObject.mime_type)
+        self.assertEquals(msgpack.unpackb(out_string, raw=False),
+                                                        [1, method_id, ['x']])
+
+if __name__ == '__main__':
+    unittest.main()
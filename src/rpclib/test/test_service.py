@@ -169,6 +169,45 @@ class Test(unittest.TestCase):
         self.assertEqual(response_data[1], 'b')
         self.assertEqual(response_data[2], 'c')
 
+    def test_routes(self):
+        app = Application([TestService, MultipleReturnService],
+                                        rpclib.interface.wsdl.Wsdl11,
+                                        rpclib.protocol.soap.Soap11, tns='tns')
+
+        route = app.get_route('{tns}aa')
+        self.assertEquals(route.service_class, TestService)
+        self.assertEquals(route.descriptor.name, 'aa')
+        self.assertEquals(route.function, TestService.aa)
+
+        self.assertTrue(app.get_route('aa') is route)
+        self.assertTrue(app.get_route('multi') is app.get_route('{tns}multi'))
+        self.assertRaises(KeyError, app.get_route, 'nonexistent')
+        self.assertRaises(AttributeError, setattr, route, 'function', None)
+
+    def test_route_conflict(self):
+        class AliasService(ServiceBase):
+            @rpc(_returns=String)
+            def aa(ctx):
+                return 'aa'
+
+            @rpc(_returns=String, _public_name='{tns}aa')
+            def bb(ctx):
+                return 'bb'
+
+        class QualifiedService(ServiceBase):
+            @rpc(_returns=String, _public_name='{tns}bb')
+            def aa(ctx):
+                return 'aa'
+
+            @rpc(_returns=String)
+            def bb(ctx):
+                return 'bb'
+
+        for service in (AliasService, QualifiedService):
+            self.assertRaises(Exception, Application, [service],
+                                        rpclib.interface.wsdl.Wsdl11,
+                                        rpclib.protocol.soap.Soap11, tns='tns')
+
     def test_multiple_ns(self):
         svc = Application([MultipleNamespaceService],rpclib.interface.wsdl.Wsdl11,
                                          rpclib.protocol.soap.Soap11,tns='tns')
@@ -17,21 +17,44 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
+import os
+import email
+import base64
+import tempfile
 import unittest
 
+from StringIO import StringIO
+
 from lxml import etree
 
+import rpclib.const.xml_ns as ns
+
 from rpclib.model.complex import ComplexModel
 
 from rpclib.model.complex import Array
+from rpclib.model.binary import Attachment
+from rpclib.model.primitive import Any
 from rpclib.model.primitive import DateTime
 from rpclib.model.primitive import Float
 from rpclib.model.primitive import Integer
 from rpclib.model.primitive import String
 
 from rpclib.model.complex import ComplexModel as Message
+from rpclib.model.complex import Iterable
 from rpclib.protocol.soap import _from_soap
 from rpclib.protocol.soap import _parse_xml_string
+from rpclib.protocol.soap import Soap11
+from rpclib.protocol.soap.mime import get_mtom_content_type
+from rpclib.protocol.soap.mime import iter_mtom_message
+from rpclib.protocol.soap.mime import parse_multipart
+from rpclib.application import Application
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.service import ServiceBase
+from rpclib.model.exception import Fault
+from rpclib.test._wsgi import call_wsgi
+from rpclib.test._wsgi import get_soap_request
 
 class Address(ComplexModel):
     street = String
@@ -112,6 +135,53 @@ class TestSoap(unittest.TestCase):
         # quick and dirty test href reconstruction
         self.assertEquals(len(payload[0]), 2)
 
+    def test_charset(self):
+        envelope_string = ('<soap:Envelope xmlns:soap="%s"><soap:Header/>'
+                           '<soap:Body><s>\xe7</s></soap:Body></soap:Envelope>'
+                                                                % ns.soap_env)
+
+        root, xmlids = _parse_xml_string(envelope_string, 'iso-8859-1')
+        header, payload = _from_soap(root, xmlids)
+
+        self.assertEquals(header, None)
+        self.assertEquals(payload.text, u'\xe7')
+        self.assertEquals(xmlids, {})
+
+        # the encoding declaration has precedence over the given charset
+        envelope_string = '<?xml version="1.0" encoding="utf-8"?>' + \
+                envelope_string.decode('iso-8859-1').encode('utf-8')
+
+        root, xmlids = _parse_xml_string(envelope_string, 'iso-8859-1')
+        header, payload = _from_soap(root, xmlids)
+
+        self.assertEquals(payload.text, u'\xe7')
+
+        # without a charset, lxml detects it from the document
+        envelope_string = envelope_string.replace(
+                                     '<?xml version="1.0" encoding="utf-8"?>', '')
+
+        root, xmlids = _parse_xml_string(envelope_string)
+        header, payload = _from_soap(root, xmlids)
+
+        self.assertEquals(payload.text, u'\xe7')
+
+        # unicode documents are re-encoded, so their declaration is ignored
+        envelope_string = u'<?xml version="1.0" encoding="iso-8859-1"?>' + \
+                                              envelope_string.decode('utf-8')
+
+        root, xmlids = _parse_xml_string(envelope_string)
+        header, payload = _from_soap(root, xmlids)
+
+        self.assertEquals(payload.text, u'\xe7')
+
+    def test_syntax_error(self):
+        try:
+            _parse_xml_string('<soap:Envelope')
+        except Fault, e:
+            self.assertEquals(e.faultcode, 'senv:Client.SoapError')
+        else:
+            raise Exception("must fail")
+
     def test_namespaces(self):
         m = Message.produce(
             namespace="some_namespace",
@@ -194,5 +264,422 @@ class TestSoap(unittest.TestCase):
         self.assertEquals(100, len(addresses))
         self.assertEquals('0', addresses[0].find('{%s}zip' % Address.get_namespace()).text)
 
+class _CountingInput(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, n):
+        retval = self.data[self.pos:self.pos + n]
+        self.pos += len(retval)
+        return retval
+
+class StreamingService(ServiceBase):
+    @srpc(Integer, Iterable(Integer), _returns=Array(Integer))
+    def total(n, numbers):
+        # returns the total, and how much of the input was read at the time
+        # the first number was read.
+        retval = [n, 0, 0]
+        for i in numbers:
+            if retval[2] == 0:
+                retval[2] = StreamingService.input.pos
+            retval[0] += i
+        retval[1] = StreamingService.input.pos
+        return retval
+
+
+    @srpc(Integer, _returns=Iterable(String))
+    def stream(n):
+        for i in range(n):
+            yield 'item %d' % i
+
+    @srpc(Integer, _returns=Array(String))
+    def array(n):
+        return ['item %d' % i for i in range(n)]
+
+class TestSoapStreaming(unittest.TestCase):
+    def setUp(self):
+        app = Application([StreamingService], Wsdl11, Soap11, tns='tns')
+        app.out_protocol.stream_chunk_size = 0
+        self.app = app
+        self.wsgi_app = WsgiApplication(app)
+
+    def __get_items(self, chunks, method):
+        root = etree.fromstring(''.join(chunks))
+        result = root.find('.//{tns}%sResult' % method)
+        return [e.text for e in result]
+
+    def test_iterable(self):
+        chunks = call_wsgi(self.wsgi_app, get_soap_request('stream', n=10))
+
+        self.assertTrue(len(chunks) > 10)
+        self.assertEquals(self.__get_items(chunks, 'stream'),
+                                           ['item %d' % i for i in range(10)])
+
+    def test_empty_iterable(self):
+        chunks = call_wsgi(self.wsgi_app, get_soap_request('stream', n=0))
+
+        self.assertEquals(self.__get_items(chunks, 'stream'), [])
+
+    def test_array(self):
+        chunks = call_wsgi(self.wsgi_app, get_soap_request('array', n=10))
+        self.assertEquals(len(chunks), 1)
+
+        self.app.out_protocol.stream_arrays = True
+        streamed_chunks = call_wsgi(self.wsgi_app,
+                                              get_soap_request('array', n=10))
+
+        self.assertTrue(len(streamed_chunks) > 10)
+        self.assertEquals(etree.tostring(etree.fromstring(''.join(chunks))),
+                 etree.tostring(etree.fromstring(''.join(streamed_chunks))))
+
+class TestSoapWsgi(unittest.TestCase):
+    def setUp(self):
+        app = Application([StreamingService], Wsdl11, Soap11, tns='tns')
+        self.wsgi_app = WsgiApplication(app)
+
+    def test_no_charset(self):
+        request = '''<senv:Envelope
+                xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+                xmlns:tns="tns"><!-- \xc3\xa7 -->
+            <senv:Body><tns:array><tns:n>2</tns:n></tns:array></senv:Body>
+        </senv:Envelope>'''
+
+        chunks = call_wsgi(self.wsgi_app, request,
+                                                     content_type='text/xml')
+        root = etree.fromstring(''.join(chunks))
+        result = root.find('.//{tns}arrayResult')
+
+        self.assertEquals([e.text for e in result], ['item 0', 'item 1'])
+
+    def test_syntax_error(self):
+        chunks = call_wsgi(self.wsgi_app, '<senv:Envelope')
+        root = etree.fromstring(''.join(chunks))
+        fault = root.find('.//{%s}Fault' % ns.soap_env)
+
+        self.assertEquals(fault.find('faultcode').text, 'senv:Client.SoapError')
+
+class TestSoapInputStreaming(unittest.TestCase):
+    def setUp(self):
+        app = Application([StreamingService], Wsdl11, Soap11, tns='tns')
+        app.in_protocol.stream_input = True
+        self.wsgi_app = WsgiApplication(app)
+
+    def __call(self, numbers):
+        request = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body><tns:total><tns:n>5</tns:n>
+            <tns:numbers>%s</tns:numbers></tns:total></senv:Body>
+        </senv:Envelope>''' % ''.join(['<tns:integer>%d</tns:integer>' % i
+                                                             for i in numbers])
+
+        StreamingService.input = _CountingInput(request)
+        chunks = call_wsgi(self.wsgi_app, request, StreamingService.input)
+
+        root = etree.fromstring(''.join(chunks))
+        result = root.find('.//{tns}totalResult')
+
+        return [int(e.text) for e in result], len(request)
+
+    def test_lazy(self):
+        (total, read_at_end, read_at_first), length = self.__call(range(50000))
+
+        self.assertEquals(total, sum(range(50000)) + 5)
+        self.assertEquals(read_at_end, length)
+        self.assertTrue(read_at_first < length)
+
+    def test_empty(self):
+        (total, read_at_end, read_at_first), length = self.__call([])
+
+        self.assertEquals(total, 5)
+
+    def test_href(self):
+        # requests that are not streamed are parsed as usual.
+        request = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body>
+                <tns:array><tns:n href="#id1"/></tns:array>
+                <multiRef id="id1">2</multiRef>
+            </senv:Body></senv:Envelope>'''
+
+        root = etree.fromstring(''.join(call_wsgi(self.wsgi_app, request)))
+        result = root.find('.//{tns}arrayResult')
+
+        self.assertEquals([e.text for e in result], ['item 0', 'item 1'])
+
+StreamingAttachment = Attachment.customize(stream=True)
+
+class AttachmentService(ServiceBase):
+    @srpc(StreamingAttachment, _returns=StreamingAttachment)
+    def reverse(a):
+        fd, file_name = tempfile.mkstemp()
+        f = os.fdopen(fd, 'wb')
+        f.write(a.file.read()[::-1])
+        f.close()
+
+        return Attachment(file_name=file_name)
+
+    @srpc(String, _returns=Array(StreamingAttachment))
+    def files(file_name):
+        return [Attachment(file_name=file_name), None,
+                                                 Attachment(file_name=file_name)]
+
+    @srpc(Array(StreamingAttachment), _returns=Array(Integer))
+    def sizes(a):
+        retval = []
+        for attachment in a:
+            attachment.file.seek(0, os.SEEK_END)
+            retval.append(attachment.file.tell())
+
+        return retval
+
+    @srpc(Any, _returns=Any)
+    def echo(a):
+        return a
+
+class TestAttachmentStreaming(unittest.TestCase):
+    def setUp(self):
+        app = Application([AttachmentService], Wsdl11, Soap11, tns='tns')
+        app.out_protocol.stream_chunk_size = 0
+        self.wsgi_app = WsgiApplication(app)
+
+        fd, self.file_name = tempfile.mkstemp()
+        os.write(fd, 'secret')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.file_name)
+
+    def __call(self, method, arg):
+        request = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body><tns:%s><tns:a>%s</tns:a>
+            </tns:%s></senv:Body></senv:Envelope>''' % (method, arg, method)
+
+        return call_wsgi(self.wsgi_app, request)
+
+    def test_stream(self):
+
+        data = os.urandom(200000)
+        request = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body><tns:reverse><tns:a>%s</tns:a>
+            </tns:reverse></senv:Body></senv:Envelope>''' % \
+                                                       base64.encodestring(data)
+
+        chunks = call_wsgi(self.wsgi_app, request)
+        self.assertTrue(len(chunks) > 1)
+
+        result = etree.fromstring(''.join(chunks)).find('.//{tns}reverseResult')
+        self.assertEquals(base64.decodestring(result.text), data[::-1])
+
+    def test_array(self):
+        request = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body><tns:files>
+                <tns:file_name>%s</tns:file_name>
+            </tns:files></senv:Body></senv:Envelope>''' % self.file_name
+
+        chunks = call_wsgi(self.wsgi_app, request)
+        result = etree.fromstring(''.join(chunks)).find('.//{tns}filesResult')
+
+        self.assertEquals([e.text and base64.decodestring(e.text)
+                                   for e in result], ['secret', None, 'secret'])
+
+    def test_large(self):
+        # larger than the 10 MB that libxml2 allows in a single text node
+        # without the huge_tree option.
+        data = os.urandom(12 * 1024 * 1024)
+        request = get_soap_request('sizes',
+                            a='<tns:a>%s</tns:a><tns:a>%s</tns:a>' % (
+                                  base64.encodestring(data), 'YWJj'))
+
+        for stream_input in (False, True):
+            self.wsgi_app.app.in_protocol.stream_input = stream_input
+
+            root = etree.fromstring(''.join(call_wsgi(self.wsgi_app,
+                                                                    request)))
+            result = root.find('.//{tns}sizesResult')
+
+            self.assertEquals([int(e.text) for e in result],
+                                                           [len(data), 3])
+
+    def test_invalid_base64(self):
+        root = etree.fromstring(''.join(self.__call('reverse', 'abc')))
+
+        self.assertEquals(root.find('.//faultcode').text,
+                                                'senv:Client.ValidationError')
+
+    def test_forged_placeholder(self):
+        # the placeholders of streamed attachments in the request are not
+        # replaced by the contents of the files they name.
+        chunks = self.__call('echo', '<x><?rpclib-attachment %s?></x>' %
+                                                                self.file_name)
+        response = ''.join(chunks)
+
+        self.assertFalse(base64.encodestring('secret').strip() in response)
+        self.assertTrue(self.file_name in response)
+
+class MtomService(ServiceBase):
+    @srpc(String, _returns=(Attachment, Array(Attachment)), _mtom=True)
+    def get_files(file_name):
+        return (Attachment(file_name=file_name),
+                                   [Attachment(data='a'), Attachment(data='b')])
+
+class TestMtom(unittest.TestCase):
+    def test_mtom(self):
+        app = Application([MtomService], Wsdl11, Soap11, tns='tns')
+        wsgi_app = WsgiApplication(app)
+
+        data = os.urandom(100000)
+        fd, file_name = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+
+        request = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body><tns:get_files>
+            <tns:file_name>%s</tns:file_name>
+            </tns:get_files></senv:Body></senv:Envelope>''' % file_name
+
+        headers = {}
+        def start_response(status, response_headers):
+            headers.update(response_headers)
+
+        env = {
+            'REQUEST_METHOD': 'POST',
+            'QUERY_STRING': '',
+            'PATH_INFO': '/',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'wsgi.url_scheme': 'http',
+            'CONTENT_TYPE': 'text/xml; charset=utf-8',
+            'CONTENT_LENGTH': str(len(request)),
+            'wsgi.input': StringIO(request),
+        }
+        try:
+            body = ''.join(wsgi_app(env, start_response))
+        finally:
+            os.unlink(file_name)
+
+        msg = email.message_from_string('Content-Type: %s\r\n\r\n%s' %
+                                              (headers['Content-Type'], body))
+        self.assertTrue(msg.is_multipart())
+
+        parts = msg.get_payload()
+        self.assertEquals(parts[0]['Content-ID'], msg.get_param('start'))
+
+        root = etree.fromstring(parts[0].get_payload())
+        hrefs = [e.get('href') for e in root.iter('{%s}Include' % ns.xop)]
+        self.assertEquals(len(hrefs), 3)
+
+        payloads = dict([('cid:' + p['Content-ID'].strip('<>'),
+                                       p.get_payload()) for p in parts[1:]])
+        self.assertEquals([payloads[h] for h in hrefs], [data, 'a', 'b'])
+
+class MultipartService(ServiceBase):
+    @srpc(Attachment, StreamingAttachment, Array(Attachment), _returns=String)
+    def describe(a, b, c):
+        return '%s %s %s' % (a.data, b.file.read(),
+                                                 ','.join([x.data for x in c]))
+
+class TestMultipartRequest(unittest.TestCase):
+    def setUp(self):
+        app = Application([MultipartService], Wsdl11, Soap11, tns='tns')
+        self.wsgi_app = WsgiApplication(app)
+
+    def __call(self, body, content_type):
+        env = {
+            'REQUEST_METHOD': 'POST',
+            'QUERY_STRING': '',
+            'PATH_INFO': '/',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'wsgi.url_scheme': 'http',
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': StringIO(body),
+        }
+
+        root = etree.fromstring(''.join(self.wsgi_app(env,
+                                          lambda status, headers: None)))
+        return root.find('.//{tns}describeResult').text
+
+    def test_mtom(self):
+        envelope = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:xop="http://www.w3.org/2004/08/xop/include"
+            xmlns:tns="tns"><senv:Body><tns:describe>
+                <tns:a><xop:Include href="cid:a%40x"/></tns:a>
+                <tns:b><xop:Include href="cid:b@x"/></tns:b>
+                <tns:c><tns:base64Binary><xop:Include href="cid:c@x"/>
+                    </tns:base64Binary></tns:c>
+            </tns:describe></senv:Body></senv:Envelope>'''
+
+        attachments = [('a@x', Attachment(data='a\n--xy')),
+                       ('b@x', Attachment(data='bb')),
+                       ('c@x', Attachment(data='cc'))]
+        body = ''.join(iter_mtom_message('x', 'text/xml', [envelope],
+                                                                  attachments))
+
+        result = self.__call(body, get_mtom_content_type('x', 'text/xml'))
+        self.assertEquals(result, 'a\n--xy bb cc')
+
+    def test_not_multipart(self):
+        request = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body><tns:describe>
+                <tns:a href="cid:a"/>
+            </tns:describe></senv:Body></senv:Envelope>'''
+
+        root = etree.fromstring(''.join(call_wsgi(self.wsgi_app,
+                                                                     request)))
+
+        self.assertEquals(root.find('.//faultcode').text,
+                                                        'senv:Client.MimeError')
+
+    def test_swa(self):
+        body = '''preamble\r
+--x\r
+Content-Type: text/xml; charset=utf-8\r
+\r
+<senv:Envelope
+    xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+    xmlns:tns="tns"><senv:Body><tns:describe>
+        <tns:a href="cid:a"/>
+        <tns:b href="http://example.com/b"/>
+        <tns:c/>
+    </tns:describe></senv:Body></senv:Envelope>\r
+--x\r
+Content-ID: <a>\r
+Content-Transfer-Encoding: base64\r
+\r
+%s\r
+--x\r
+Content-Location: http://example.com/b\r
+\r
+bb\r
+--x--\r
+''' % base64.encodestring('aa')
+
+        result = self.__call(body, 'multipart/related; boundary=x')
+        self.assertEquals(result, 'aa bb ')
+
+    def test_parse_multipart(self):
+        data = '1\r\n--boundary+' * 100 # looks like a delimiter, but isn't
+        body = ''.join(iter_mtom_message('boundary', 'text/xml', ['<a/>'],
+                                                  [('x', Attachment(data=data))]))
+
+        # the delimiters are split between chunks
+        chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+        headers, root, parts = parse_multipart(chunks, 'boundary',
+                                              '<rpclibEnvelope>', spool_size=10)
+
+        self.assertEquals(root, '<a/>')
+        self.assertTrue(headers['content-type'].startswith(
+                                                        'application/xop+xml'))
+        self.assertEquals(parts.keys(), ['x'])
+        self.assertEquals(parts['x'].read(), data)
+
 if __name__ == '__main__':
     unittest.main()
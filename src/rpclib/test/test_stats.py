@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+
+import unittest
+from rpclib.application import Application
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.complex import Array
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.protocol.soap import Soap11
+from rpclib.server.wsgi import WsgiApplication
+from rpclib.service import ServiceBase
+from rpclib.test._wsgi import call_soap
+
+class ArrayService(ServiceBase):
+    @srpc(Integer, _returns=Array(String))
+    def array(n):
+        return ['item %d' % i for i in range(n)]
+
+class TestStats(unittest.TestCase):
+    def test_stats(self):
+        app = Application([ArrayService], Wsdl11, Soap11, tns='tns')
+        wsgi_app = WsgiApplication(app)
+
+        for i in range(10):
+            call_soap(wsgi_app, 'array', n=i)
+
+        stats = app.get_stats()
+        self.assertEquals(stats.keys(), ['array'])
+
+        stats = app.get_stats('array')
+        for phase in ('parse', 'decompose', 'deserialize', 'call', 'serialize',
+                                                                   'tostring'):
+            self.assertEquals(stats['phases'][phase]['count'], 10)
+            self.assertTrue(stats['phases'][phase]['p99'] >=
+                                              stats['phases'][phase]['p50'])
+
+        self.assertEquals(stats['in_bytes']['count'], 10)
+        self.assertTrue(stats['out_bytes']['p99'] > stats['out_bytes']['p50'])
+
+        app.stats = None
+        call_soap(wsgi_app, 'array', n=1)
+        self.assertEquals(app.get_stats(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+import time
+
+from StringIO import StringIO
+
+from lxml import etree
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.defer import TimeoutError
+from twisted.internet.defer import gatherResults
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import returnValue
+from twisted.trial import unittest
+from twisted.web.server import Site
+from twisted.web.test.requesthelper import DummyRequest
+
+from rpclib.application import Application
+from rpclib.client.twisted_http import Client
+from rpclib.decorator import srpc
+from rpclib.interface.wsdl import Wsdl11
+from rpclib.model.exception import Fault
+from rpclib.model.primitive import Float
+from rpclib.model.primitive import Integer
+from rpclib.model.primitive import String
+from rpclib.protocol.soap import Soap11
+from rpclib.server.twisted_web import TwistedWebResource
+from rpclib.service import ServiceBase
+from rpclib.util.coalesce import RequestCoalescer
+from rpclib.util.executor import ThreadPoolExecutor
+
+def _sleep(secs):
+    d = Deferred()
+    reactor.callLater(secs, d.callback, None)
+    return d
+
+class DeferredService(ServiceBase):
+    @srpc(String, _returns=String)
+    def sync(s):
+        return s
+
+    @srpc(String, Integer, _returns=String)
+    def deferred(s, n):
+        return _repeat(s, n)
+
+    @srpc(Float)
+    def sleep(secs):
+        return _sleep(secs)
+
+    @srpc(String, Integer, _returns=String, _coalesce=RequestCoalescer())
+    def coalesced(s, n):
+        return _repeat(s, n)
+
+    @srpc(Float, _returns=Float,
+                            _executor=ThreadPoolExecutor(max_workers=1, timeout=1))
+    def blocking_sleep(secs):
+        time.sleep(secs)
+        return secs
+
+@inlineCallbacks
+def _repeat(s, n):
+    yield _sleep(0.01)
+    if n < 0:
+        raise Exception("negative")
+    returnValue(s * n)
+
+class TestTwistedWebResource(unittest.TestCase):
+    def setUp(self):
+        app = Application([DeferredService], Wsdl11, Soap11, tns='tns')
+        self.resource = TwistedWebResource(app)
+
+    def __call(self, method, **kwargs):
+        body = '''<senv:Envelope
+            xmlns:senv="http://schemas.xmlsoap.org/soap/envelope/"
+            xmlns:tns="tns"><senv:Body><tns:%s>%s</tns:%s></senv:Body>
+        </senv:Envelope>''' % (method, ''.join(['<tns:%s>%s</tns:%s>' % (k,v,k)
+                                           for k, v in kwargs.items()]), method)
+
+        request = DummyRequest([''])
+        request.method = 'POST'
+        request.uri = '/'
+        request.content = StringIO(body)
+        request.requestHeaders.setRawHeaders('content-type',
+                                                   ['text/xml; charset=utf-8'])
+        request.requestHeaders.setRawHeaders('content-length', [str(len(body))])
+
+        self.resource.render(request)
+
+        def parse(_):
+            root = etree.fromstring(''.join(request.written))
+            return request.responseCode, root
+
+        return request.notifyFinish().addCallback(parse)
+
+    @inlineCallbacks
+    def test_sync(self):
+        code, root = yield self.__call('sync', s='x')
+
+        self.assertEquals(code, None) # i.e. 200
+        self.assertEquals(root.find('.//{tns}syncResult').text, 'x')
+
+    @inlineCallbacks
+    def test_deferred(self):
+        # both calls are in flight at the same time.
+        d1 = self.__call('deferred', s='ab', n=3)
+        d2 = self.__call('deferred', s='c', n=2)
+
+        code, root = yield d1
+        self.assertEquals(root.find('.//{tns}deferredResult').text, 'ababab')
+
+        code, root = yield d2
+        self.assertEquals(root.find('.//{tns}deferredResult').text, 'cc')
+
+    @inlineCallbacks
+    def test_deferred_error(self):
+        code, root = yield self.__call('deferred', s='ab', n=-1)
+
+        self.assertEquals(code, 500)
+        self.assertEquals(root.find('.//faultstring').text, 'negative')
+
+    @inlineCallbacks
+    def test_coalesce(self):
+        # waiting for the identical request in the reactor thread would never
+        # let it finish.
+        results = yield gatherResults([self.__call('coalesced', s='a', n=2)
+                                                            for i in range(2)])
+
+        for code, root in results:
+            self.assertEquals(root.find('.//{tns}coalescedResult').text, 'aa')
+
+    @inlineCallbacks
+    def test_executor(self):
+        # the reactor keeps serving other requests while the method runs in
+        # its executor.
+        finished = []
+        d1 = self.__call('blocking_sleep', secs=0.3)
+        d1.addCallback(lambda result: finished.append('blocking') or result)
+        d2 = self.__call('sync', s='x')
+        d2.addCallback(lambda result: finished.append('sync') or result)
+
+        code, root = yield d1
+        self.assertEquals(root.find('.//{tns}blocking_sleepResult').text,
+                                                                        '0.3')
+        yield d2
+        self.assertEquals(finished, ['sync', 'blocking'])
+
+class TestTwistedHttpClient(unittest.TestCase):
+    def setUp(self):
+        app = Application([DeferredService], Wsdl11, Soap11, tns='tns')
+        self.port = reactor.listenTCP(0, Site(TwistedWebResource(app)),
+                                                         interface='127.0.0.1')
+
+        app = Application([DeferredService], Wsdl11, Soap11, tns='tns')
+        self.client = Client('http://127.0.0.1:%d/' % self.port.getHost().port,
+                                                                           app)
+
+    @inlineCallbacks
+    def tearDown(self):
+        yield self.client.pool.closeCachedConnections()
+        yield self.port.stopListening()
+
+    @inlineCallbacks
+    def test_concurrent(self):
+        results = yield gatherResults([self.client.service.deferred('x', i)
+                                                            for i in range(20)])
+
+        self.assertEquals(results, ['x' * i for i in range(20)])
+
+        # the connections are kept open for the following calls.
+        result = yield self.client.service.sync('y')
+        self.assertEquals(result, 'y')
+
+    @inlineCallbacks
+    def test_fault(self):
+        try:
+            yield self.client.service.deferred('x', -1)
+        except Fault, e:
+            self.assertEquals(e.faultstring, 'negative')
+        else:
+            self.fail("Fault expected")
+
+    @inlineCallbacks
+    def test_timeout(self):
+        try:
+            yield self.client.service.sleep(0.2, _timeout=0.05)
+        except TimeoutError:
+            pass
+        else:
+            self.fail("TimeoutError expected")
+
+        # lets the server finish the call.
+        yield _sleep(0.3)
@@ -0,0 +1,161 @@
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""A response cache for methods that are pure functions of their arguments.
+Pass an instance to the rpc decorator with the _cache keyword argument:
+
+    @srpc(String, _returns=String, _cache=ResponseCache(max_entries=100, ttl=60))
+    def get_country_name(code):
+        ...
+"""
+
+import time
+import types
+import threading
+
+from rpclib.model.complex import ComplexModelBase
+from rpclib.util.odict import odict
+
+def _get_member_names(cls):
+    '''Returns the names of the members of the given class and of its parents,
+    in order.'''
+
+    extends = getattr(cls, '__extends__', None)
+    if extends is None:
+        return list(cls._type_info.keys())
+
+    return _get_member_names(extends) + list(cls._type_info.keys())
+
+def canonicalize(value):
+    '''Returns a hashable representation of the given native value. Raises
+    TypeError when that's not possible, e.g. for generators.'''
+
+    if value is None:
+        return None
+
+    if isinstance(value, ComplexModelBase):
+        cls = value.__class__
+        return (cls,) + tuple([canonicalize(getattr(value, k, None))
+                                                for k in _get_member_names(cls)])
+
+    if isinstance(value, (list, tuple)):
+        return tuple([canonicalize(v) for v in value])
+
+    if isinstance(value, dict):
+        items = value.items()
+        items.sort()
+        return tuple([(k, canonicalize(v)) for k, v in items])
+
+    if isinstance(value, types.GeneratorType):
+        raise TypeError("generators can't be canonicalized")
+
+    hash(value) # raises TypeError for unhashable values
+
+    return value
+
+def get_request_key(ctx, key=None):
+    '''Returns a hashable key that identifies the response to the request in
+    the given context, or None when the request can't be identified that way.
+    The key is built from ctx.in_object and ctx.in_header, or by the given key
+    callable, which can also return None.'''
+
+    try:
+        if key is None:
+            retval = (canonicalize(ctx.in_object), canonicalize(ctx.in_header))
+        else:
+            retval = key(ctx)
+            if retval is None:
+                return None
+
+        # the same service can be exposed by more than one application, or
+        # with more than one protocol.
+        return (ctx.out_protocol, retval)
+
+    except TypeError:
+        return None
+
+class ResponseCache(object):
+    '''A thread-safe LRU cache for the responses of a method.
+
+    :param max_entries: The maximum number of responses to keep.
+    :param ttl: The number of seconds a response stays valid. None means
+        responses don't expire.
+    :param key: A callable that takes the MethodContext and returns a hashable
+        cache key, or None to bypass the cache for that request. The default
+        key is built from ctx.in_object and ctx.in_header.
+
+    The hits, misses and evictions attributes count the cache lookups that
+    were served from the cache, the lookups that were not, and the entries
+    that were dropped either to make room or because they expired.
+    '''
+
+    def __init__(self, max_entries=1024, ttl=None, key=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.key = key
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__entries = odict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_key(self, ctx):
+        '''Returns the cache key for the given context, or None when the
+        request can't be cached.'''
+
+        return get_request_key(ctx, self.key)
+
+    def get(self, key):
+        '''Returns the (out_object, out_string) pair stored for the given key,
+        or None on a miss.'''
+
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if not (entry is None):
+                expires, value = entry
+                if expires is None or expires > time.time():
+                    self.__entries[key] = entry # mark as recently used
+                    self.hits += 1
+                    return value
+
+                self.evictions += 1
+
+            self.misses += 1
+
+    def put(self, key, out_object, out_string):
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = time.time() + self.ttl
+
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (expires, (out_object, out_string))
+
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
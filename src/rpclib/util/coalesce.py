@@ -0,0 +1,136 @@
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Coalescing of identical concurrent requests. Pass an instance to the rpc
+decorator with the _coalesce keyword argument:
+
+    @srpc(String, _returns=String, _coalesce=RequestCoalescer())
+    def get_exchange_rate(currency):
+        ...
+
+While a request is being processed, identical requests to the same method
+wait for it to finish and get a copy of its serialized response instead of
+calling the method again. Requests are identical when their keys, as built by
+rpclib.util.cache.get_request_key, are equal.
+
+Requests are not coalesced in contexts whose blocking attribute is False, e.g.
+the ones that are processed in the reactor thread of TwistedWebResource.
+"""
+
+import threading
+
+from rpclib.util.cache import get_request_key
+
+class _Flight(object):
+    def __init__(self, key):
+        self.key = key
+        self.done = threading.Event()
+
+        # these are set only when the response can be shared.
+        self.shared = False
+        self.out_object = None
+        self.out_error = None
+        self.out_string = None
+
+class RequestCoalescer(object):
+    '''Lets concurrent identical requests share one method call and one
+    serialized response.
+
+    :param key: A callable that takes the MethodContext and returns a hashable
+        key, or None to not coalesce that request. The default key is built from
+        ctx.in_object and ctx.in_header.
+    :param timeout: The number of seconds to wait for the identical request.
+        When it does not finish in time, the waiting request calls the method
+        itself, and the requests that arrive later wait for it instead. This
+        way, a request whose response is never serialized, e.g. because it was
+        processed by Application.process_request alone, holds the others up
+        for one timeout at most. None means no timeout.
+
+    The executions and collapsed attributes count the requests that called the
+    method and the requests that were served by a concurrent identical one.
+    '''
+
+    def __init__(self, key=None, timeout=30):
+        self.key = key
+        self.timeout = timeout
+
+        self.executions = 0
+        self.collapsed = 0
+
+        self.__flights = {}
+        self.__lock = threading.Lock()
+
+    def join(self, ctx):
+        '''Returns True when the request in the given context should call the
+        method. Otherwise, waits for the identical request that's in flight to
+        finish, sets the response attributes of ctx from it and returns False.
+        '''
+
+        key = get_request_key(ctx, self.key)
+        if key is None:
+            with self.__lock:
+                self.executions += 1
+            return True
+
+        with self.__lock:
+            flight = self.__flights.get(key)
+            if flight is None:
+                self.__flights[key] = ctx.flight = _Flight(key)
+                self.executions += 1
+                return True
+
+        finished = flight.done.wait(self.timeout)
+
+        with self.__lock:
+            if not finished and self.__flights.get(key) is flight:
+                self.__flights[key] = ctx.flight = _Flight(key)
+
+            if not (finished and flight.shared):
+                self.executions += 1
+                return True
+
+            self.collapsed += 1
+
+        ctx.out_object = flight.out_object
+        ctx.out_error = flight.out_error
+        ctx.out_string = flight.out_string
+
+        return False
+
+    def leave(self, ctx):
+        '''Called when the request that called the method has its response
+        serialized, or has failed to do so. Releases the requests waiting for
+        it.'''
+
+        flight = ctx.flight
+        ctx.flight = None
+
+        with self.__lock:
+            # the flight was replaced if a waiting request timed out.
+            if self.__flights.get(flight.key) is flight:
+                del self.__flights[flight.key]
+
+        # streamed responses are consumed as they're sent, so they can't be
+        # shared. the waiting requests call the method themselves in that case.
+        if isinstance(ctx.out_string, list) and ctx.out_stream is None:
+            flight.out_object = ctx.out_object
+            flight.out_error = ctx.out_error
+            flight.out_string = ctx.out_string
+            flight.shared = True
+
+        flight.done.set()
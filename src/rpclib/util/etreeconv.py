@@ -17,10 +17,28 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
+import threading
+
 from lxml import etree
 
 from rpclib.util.odict import odict
 
+# per-thread XMLParser instances, see get_parser
+_parsers = threading.local()
+
+def get_parser(encoding=None, huge_tree=False):
+    '''Returns an XMLParser with the given options that's private to the
+    current thread. lxml parsers can be reused, but not concurrently.'''
+
+    parsers = _parsers.__dict__
+    key = (encoding, huge_tree)
+    retval = parsers.get(key)
+    if retval is None:
+        retval = parsers[key] = etree.XMLParser(encoding=encoding,
+                                                          huge_tree=huge_tree)
+
+    return retval
+
 def root_dict_to_etree(d):
     assert len(d) == 1
 
@@ -0,0 +1,225 @@
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Bounded thread and process pools to run service methods in. Assign one to a
+method with the _executor argument of the rpc decorator, or to all methods of a
+service with the __executor__ attribute of the service class:
+
+    slow_pool = ThreadPoolExecutor(max_workers=4, max_queue=16, timeout=10)
+
+    class SomeService(ServiceBase):
+        @srpc(String, _returns=String, _executor=slow_pool)
+        def slow_lookup(s):
+            ...
+
+The request thread waits for the method to return. When the method does not
+start and finish within the timeout, the request fails with a
+Fault('Server.Timeout'). As threads can't be interrupted, the method keeps
+running (and keeps its worker busy) until it returns, but its result is
+discarded. When max_queue requests are already waiting for a worker, new
+requests fail immediately with a Fault('Server.Busy').
+
+ProcessPoolExecutor runs srpc methods in worker processes instead, for
+CPU-bound methods that would otherwise hold the GIL. The arguments and the
+return value of the method are pickled, so they must be instances of classes
+that can be imported by name in the worker processes.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import sys
+import threading
+import traceback
+import multiprocessing
+
+from Queue import Queue
+from Queue import Full
+
+from rpclib.model.exception import Fault
+
+class _Task(object):
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+        self.done = threading.Event()
+        self.cancelled = False
+        self.result = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args)
+        except:
+            self.exc_info = sys.exc_info()
+
+        self.done.set()
+
+class ThreadPoolExecutor(object):
+    '''Runs callables in at most max_workers threads.
+
+    :param max_workers: The maximum number of callables that run concurrently.
+    :param max_queue: The maximum number of callables waiting for a worker.
+        None means unbounded.
+    :param timeout: The number of seconds to wait for a callable to return.
+        None means no timeout.
+    :param name: Used in the names of the worker threads.
+    '''
+
+    def __init__(self, max_workers=4, max_queue=None, timeout=None, name=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.name = name
+
+        self.__queue = Queue(max_queue or 0)
+        self.__workers = []
+        self.__lock = threading.Lock()
+
+    def run(self, func, *args):
+        '''Runs func(*args) in a worker thread and returns its return value, or
+        re-raises its exception, in the calling thread.'''
+
+        task = _Task(func, args)
+
+        self.__start_workers()
+
+        try:
+            self.__queue.put_nowait(task)
+        except Full:
+            raise Fault('Server.Busy', "Too many pending requests in %r" % self)
+
+        if not task.done.wait(self.timeout):
+            task.cancelled = True
+            raise Fault('Server.Timeout', "The method did not return in %r "
+                                                  "seconds." % self.timeout)
+
+        if not (task.exc_info is None):
+            raise task.exc_info[0], task.exc_info[1], task.exc_info[2]
+
+        return task.result
+
+    def run_method(self, ctx, func, params):
+        '''Runs the given service method the way Application.process_request
+        would.'''
+
+        return self.run(ctx.service_class.call_wrapper, ctx, func, params)
+
+    def __start_workers(self):
+        if len(self.__workers) == self.max_workers:
+            return
+
+        with self.__lock:
+            while len(self.__workers) < self.max_workers:
+                worker = threading.Thread(target=self.__work,
+                        name='%s-%d' % (self.name or 'rpclib-executor',
+                                                         len(self.__workers)))
+                worker.daemon = True
+                worker.start()
+
+                self.__workers.append(worker)
+
+    def __work(self):
+        while True:
+            task = self.__queue.get()
+            if not task.cancelled:
+                task.run()
+
+    def __repr__(self):
+        return "%s(name=%r, max_workers=%d)" % (self.__class__.__name__,
+                                                   self.name, self.max_workers)
+
+def _call_in_worker(module_name, class_name, method_name, params):
+    '''Runs in the worker process.'''
+
+    module = __import__(module_name, fromlist=[class_name])
+    func = getattr(getattr(module, class_name), method_name)
+
+    try:
+        return func(*params)
+
+    except Fault:
+        raise
+
+    except Exception, e:
+        # the exception may not survive pickling, and the traceback won't.
+        logger.error(traceback.format_exc())
+        raise Fault('Server', str(e))
+
+class ProcessPoolExecutor(object):
+    '''Runs srpc methods in a pool of worker processes.
+
+    :param processes: The number of worker processes. None means the number of
+        cpus.
+    :param max_tasks: The number of methods a worker process runs before it's
+        replaced by a new one. None means workers are never replaced.
+    :param timeout: The number of seconds to wait for a method to return. None
+        means no timeout.
+
+    The pool is created when it's first used, so that the workers are forked
+    from a fully initialized process.
+    '''
+
+    def __init__(self, processes=None, max_tasks=None, timeout=None):
+        self.processes = processes
+        self.max_tasks = max_tasks
+        self.timeout = timeout
+
+        self.__pool = None
+        self.__lock = threading.Lock()
+
+    def __get_pool(self):
+        if self.__pool is None:
+            with self.__lock:
+                if self.__pool is None:
+                    self.__pool = multiprocessing.Pool(self.processes,
+                                                 maxtasksperchild=self.max_tasks)
+
+        return self.__pool
+
+    def run_method(self, ctx, func, params):
+        if not ctx.descriptor.no_ctx:
+            raise ValueError("%r can only run methods that don't take the "
+                             "method context (i.e. the srpc ones)" % self)
+
+        service_class = ctx.service_class
+        result = self.__get_pool().apply_async(_call_in_worker, (
+                service_class.__module__, service_class.__name__,
+                ctx.descriptor.name, list(params)
+            ))
+
+        try:
+            return result.get(self.timeout)
+
+        except multiprocessing.TimeoutError:
+            raise Fault('Server.Timeout', "The method did not return in %r "
+                                                  "seconds." % self.timeout)
+
+    def close(self):
+        '''Stops the worker processes once they finish their current
+        methods.'''
+
+        with self.__lock:
+            if not (self.__pool is None):
+                self.__pool.close()
+                self.__pool.join()
+                self.__pool = None
+
+    def __repr__(self):
+        return "%s(processes=%r)" % (self.__class__.__name__, self.processes)
@@ -115,3 +115,29 @@ class odict(object):
     def append(self, t):
         k, v = t
         self[k] = v
+
+    def pop(self, key, default=Empty):
+        if key in self.__dict:
+            retval = self.__dict[key]
+            del self[key]
+            return retval
+
+        if default is odict.Empty:
+            raise KeyError(key)
+
+        return default
+
+    def popitem(self, last=True):
+        if len(self.__list) == 0:
+            raise KeyError('popitem(): dictionary is empty')
+
+        if last:
+            k = self.__list.pop()
+        else:
+            k = self.__list.pop(0)
+
+        return k, self.__dict.pop(k)
+
+    def clear(self):
+        del self.__list[:]
+        self.__dict.clear()
@@ -0,0 +1,128 @@
+#
+# rpclib - Copyright (C) Rpclib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Aggregation of the per-phase timings and payload sizes that the servers
+record in the MethodContext of every request."""
+
+import threading
+
+# the phases of the request pipeline, in order.
+PHASES = ('parse', 'decompose', 'deserialize', 'call', 'serialize', 'tostring')
+
+def _nearest_rank(samples, p):
+    return samples[max(int(round(p / 100.0 * len(samples))) - 1, 0)]
+
+class Histogram(object):
+    '''Keeps the count and the sum of all the recorded values, and the most
+    recent `size` values to compute the percentiles from.'''
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.count = 0
+        self.total = 0
+        self.__samples = []
+
+    def add(self, value):
+        if self.count < self.size:
+            self.__samples.append(value)
+        else:
+            self.__samples[self.count % self.size] = value
+
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p):
+        '''Returns the p-th percentile (0 < p <= 100) of the kept values, or
+        None when there are none.'''
+
+        if len(self.__samples) == 0:
+            return None
+
+        return _nearest_rank(sorted(self.__samples), p)
+
+    def summary(self):
+        retval = {'count': self.count, 'total': self.total}
+
+        if len(self.__samples) > 0:
+            samples = sorted(self.__samples)
+            for p in (50, 95, 99):
+                retval['p%d' % p] = _nearest_rank(samples, p)
+
+        return retval
+
+class MethodStats(object):
+    '''The histograms of a single method.'''
+
+    def __init__(self, size=1024):
+        self.phases = {}
+        for phase in PHASES:
+            self.phases[phase] = Histogram(size)
+
+        self.in_bytes = Histogram(size)
+        self.out_bytes = Histogram(size)
+
+    def summary(self):
+        return {
+            'phases': dict([(k, v.summary()) for k, v in self.phases.items()]),
+            'in_bytes': self.in_bytes.summary(),
+            'out_bytes': self.out_bytes.summary(),
+        }
+
+class PipelineStats(object):
+    '''Aggregates the timings and the payload sizes in MethodContext instances
+    per method. Timings are in seconds, sizes are in bytes.'''
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.methods = {}
+        self.__lock = threading.Lock()
+
+    def record(self, ctx):
+        if ctx.descriptor is None:
+            return
+
+        with self.__lock:
+            stats = self.methods.get(ctx.descriptor.name)
+            if stats is None:
+                stats = self.methods[ctx.descriptor.name] = \
+                                                        MethodStats(self.size)
+
+            phases = stats.phases
+            for k, v in ctx.timings.items():
+                phases[k].add(v)
+
+            if not (ctx.in_bytes is None):
+                stats.in_bytes.add(ctx.in_bytes)
+            if not (ctx.out_bytes is None):
+                stats.out_bytes.add(ctx.out_bytes)
+
+    def summary(self, method_name=None):
+        '''Returns a dict of method names to dicts with 'phases', 'in_bytes' and
+        'out_bytes' keys, that contain the count, total, p50, p95 and p99 values
+        of the histograms. When method_name is given, returns only the dict of
+        that method.'''
+
+        with self.__lock:
+            if not (method_name is None):
+                return self.methods[method_name].summary()
+
+            return dict([(k, v.summary()) for k, v in self.methods.items()])
+
+    def clear(self):
+        with self.__lock:
+            self.methods.clear()